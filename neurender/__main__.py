@@ -1,26 +1,62 @@
+import sys
 from argparse import ArgumentParser, Namespace
 from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
 
-from . import NeurenderProject
 from .utils import print_err
-from .utils.subprocess import run_command
-from . import config, storage
+
+# Each command imports what it uses, so that --help and short commands skip importing
+# boto3, the pipeline steps and their imaging libraries
+if TYPE_CHECKING:
+    from .project import NeurenderProject
+    from .storage import TransferSummary
+
+TRANSFER_REPORT_FILE = "transfer-report.json"
+
+def _add_transfer_report_arg(parser:ArgumentParser, default_help:str):
+    parser.add_argument("--transfer-report", type=str, default="", help=f"Write transfer statistics as JSON to this path. {default_help}")
+
+def _write_transfer_report(summary:"TransferSummary", path:Path | str):
+    report = summary.report().model_dump_json(indent=2)
+    if path:
+        Path(path).write_text(report)
+        print("Transfer report written to", path)
+    else:
+        print("Transfer report:")
+        print(report)
 
 def _add_project_arg(parser:ArgumentParser):
     parser.add_argument("project", type=str, help="Path or S3 bucket url to a project directory")
-    parser.add_argument("-l", "--local-path", type=str, default='', help="If project is remote, specifies a local path to download project files")
+    parser.add_argument("-l", "--local-path", type=str, default='', help="If project is remote, specifies a local path to download project files. Defaults to the project cache if configured, otherwise a folder named after the project")
 
 def _add_run_args(parser:ArgumentParser):
     _add_project_arg(parser)
     parser.add_argument("-p", "--pipeline", type=str, default="", help="Pipeline filename to run. Defaults to the first pipeline found in the {project}/pipelines folder")
-    parser.add_argument("-n", "--no-skip", nargs='+', help="Define steps which must not be skipped, even if their output paths already exist")
+    parser.add_argument("-n", "--no-skip", nargs='+', help="Define steps which must be run rather than restored from the step cache")
+    parser.add_argument("--lazy", action='store_true', help="For remote projects, only download the files the pipeline reads, while it runs")
     parser.add_argument("-o", "--output", type=str, default="", help="Output path for pipeline execution artifacts. Defaults to {project}/output/{pipeline_filename}")
     parser.add_argument("-u", "--upload-url", type=str, default="", help="Specify and S3 url other than the project URL to upload pipeline output artifacts (specified within the pipeline)")
     parser.add_argument("--on-finished", type=str, default="", help="Run command when pipeline is finished")
+    _add_transfer_report_arg(parser, f"Defaults to {{output}}/{TRANSFER_REPORT_FILE}")
     
 # The `run` subcommand
 def _run_command(args:Namespace):
-    project = NeurenderProject.load(args.project, args.local_path)
+    from .project import NeurenderProject
+
+    project = NeurenderProject.load(args.project, args.local_path, lazy=args.lazy, use_cache=True)
+    try:
+        _run_project(project, args)
+    finally:
+        project.release()
+
+def _run_project(project:"NeurenderProject", args:Namespace):
+    from .project import PipelineError
+    from .utils.subprocess import run_command
+
+    if project.download_summary and not project.download_summary.ok:
+        project.download_summary.print("Download")
+        sys.exit(1)
+
     pipeline = project.get_pipeline(args.pipeline)
 
     if not pipeline:
@@ -28,40 +64,154 @@ def _run_command(args:Namespace):
         return
 
 
-    working_path = args.output
-    working_path = pipeline.run(working_path=working_path, no_skip_steps=args.no_skip)
-
     upload_url = args.upload_url or project.url
     print("Upload url:", upload_url)
+
+    working_path = args.output
+    fetch_ok = True
+    fetcher = project.fetch_for_pipeline(pipeline)
+    try:
+        working_path = pipeline.run(working_path=working_path, no_skip_steps=args.no_skip, upload_url=upload_url, fetcher=fetcher)
+    except PipelineError as e:
+        print_err(str(e))
+        sys.exit(1)
+    finally:
+        if fetcher:
+            fetcher.join()
+            fetcher.summary.print("Download")
+            project.download_summary.merge(fetcher.summary)
+            fetch_ok = fetcher.summary.ok
+
+    upload_ok = True
     if upload_url:
-        pipeline.upload_output_artifacts(Path(working_path), upload_url)
+        summary = pipeline.upload_output_artifacts(Path(working_path), upload_url)
+        summary.print("Upload")
+        upload_ok = summary.ok
+
+        if pipeline.stream_summary:
+            summary.merge(pipeline.stream_summary)
+        if project.download_summary:
+            summary.merge(project.download_summary)
+        _write_transfer_report(summary, args.transfer_report or Path(working_path) / TRANSFER_REPORT_FILE)
 
     if args.on_finished:
         run_command([args.on_finished])
 
+    if not upload_ok or not fetch_ok:
+        sys.exit(1)
+
 def _add_download_args(parser:ArgumentParser):
     parser.add_argument('src', type=str, help="Source directory")
     parser.add_argument('dst', type=str, default='', nargs='?', help="Destination directory")
     parser.add_argument('-s', '--select', type=str, default='', help="Select specific files by glob pattern. **/* selects all subdirectories and files")
+    _add_transfer_report_arg(parser, "Printed to stdout by default")
 
 # The `download` subcommand
 def _download_command(args:Namespace):
+    from .project import NeurenderProject
+
     print(f"Downloading {args.src} => {args.dst}")  
     project = NeurenderProject.load(args.src, args.dst, select=args.select)
+    if project.download_summary:
+        project.download_summary.print("Download")
+        _write_transfer_report(project.download_summary, args.transfer_report)
+        if not project.download_summary.ok:
+            sys.exit(1)
     print("Done.")
 
+def _add_upload_args(parser:ArgumentParser):
+    _add_download_args(parser)
+    parser.add_argument('--compress', action='store_true', help="Upload src as a single compressed tarball, streamed as it is compressed")
+    _add_compression_args(parser)
+
 # The `upload` subcommand
 def _upload_command(args:Namespace):
+    from . import storage
+    from .project import LOCAL_CACHE_PATHS, PIPELINES_PATH
+
+    if args.compress and args.select:
+        print_err("--select cannot be combined with --compress, which uploads all of src")
+        sys.exit(1)
+
     print(f"Uploading {args.src} => {args.dst}")  
-    storage.S3().sync_to_remote(args.src, args.dst, select=args.select)
+    if args.compress:
+        summary = storage.S3().upload_archive(args.src, args.dst, format=args.format, level=args.level, threads=args.threads)
+    else:
+        # The caches of a project folder stay local, other folders are uploaded whole
+        is_project = (Path(args.src).expanduser() / PIPELINES_PATH).is_dir()
+        summary = storage.S3().sync_to_remote(args.src, args.dst, select=args.select, exclude=LOCAL_CACHE_PATHS if is_project else [])
+    summary.print("Upload")
+    _write_transfer_report(summary, args.transfer_report)
+    if not summary.ok:
+        sys.exit(1)
     print("Done.")
     
 
+def _add_compression_args(parser:ArgumentParser):
+    parser.add_argument('--format', type=str, choices=['gz', 'zst'], default='gz', help="Archive compression. zst requires the zstandard package")
+    parser.add_argument('--level', type=int, default=None, help="Compression level. Defaults to 6 for gz and 3 for zst")
+    parser.add_argument('-t', '--threads', type=int, default=0, help="Compression threads. Defaults to one per core")
+
+def _add_compress_args(parser:ArgumentParser):
+    parser.add_argument('src', type=str, help="File or directory to compress")
+    parser.add_argument('dst', type=str, default='', nargs='?', help="Archive path or S3 url. Defaults to {src}.tar.gz")
+    _add_compression_args(parser)
+
+# The `compress` subcommand
+def _compress_command(args:Namespace):
+    from .utils.compression import ARCHIVE_SUFFIXES, write_tar
+
+    if args.dst.startswith('s3://'):
+        from . import storage
+        summary = storage.S3().upload_archive(args.src, args.dst, format=args.format, level=args.level, threads=args.threads)
+        summary.print("Upload")
+        if not summary.ok:
+            sys.exit(1)
+        return
+
+    suffix = ARCHIVE_SUFFIXES[args.format]
+    dst = args.dst or args.src.rstrip('/') + suffix
+    if not dst.endswith(suffix):
+        dst += suffix
+    print(f"Compressing {args.src} => {dst}")
+    try:
+        with open(dst, 'wb') as f:
+            files = write_tar(Path(args.src), f, args.format, args.level, args.threads)
+    except BaseException:
+        # No partial archive is left behind
+        Path(dst).unlink(missing_ok=True)
+        raise
+    print(f"Compressed {files} files")
+
+def _add_decompress_args(parser:ArgumentParser):
+    parser.add_argument('src', type=str, help="Path or S3 url of a .tar.gz or .tar.zst archive")
+    parser.add_argument('dst', type=str, default='', nargs='?', help="Directory to extract to. Defaults to the current directory")
+
+# The `decompress` subcommand
+def _decompress_command(args:Namespace):
+    from .utils.compression import archive_format, extract_tar
+
+    if args.src.startswith('s3://'):
+        from . import storage
+        summary = storage.S3().download_archive(args.src, args.dst)
+        summary.print("Download")
+        if not summary.ok:
+            sys.exit(1)
+        return
+
+    print(f"Extracting {args.src} => {args.dst or '.'}")
+    with open(args.src, 'rb') as f:
+        files = extract_tar(f, Path(args.dst or '.'), archive_format(args.src))
+    print(f"Extracted {files} files")
+
+
 def _add_config_args(parser:ArgumentParser):
     parser.add_argument('--set-all', type=str, default='', help='Provide full YAML config file contents as an argument string')
 
 # The `config` subcommand
 def _config_command(args:Namespace):
+    from . import config
+
     c = config.load()
 
     if args.set_all:
@@ -70,17 +220,82 @@ def _config_command(args:Namespace):
     config.write(c)
 
 
-def main():
-    parser = ArgumentParser(description="Interface to control Neurender pipelines and configuration")
+def _add_cache_args(parser:ArgumentParser):
+    parser.add_argument('--evict', action='store_true', help="Evict least recently used projects until the cache is within its configured size")
+
+# The `cache` subcommand
+def _cache_command(args:Namespace):
+    from .project_cache import ProjectCache
+
+    cache = ProjectCache.load()
+    if not cache:
+        print_err("No project cache configured, set cache.root with `neurender config`")
+        sys.exit(1)
+
+    if args.evict:
+        cache.evict()
+    cache.print()
+
+
+def _add_batch_args(parser:ArgumentParser):
+    parser.add_argument("projects", type=str, nargs='*', help="Paths or S3 bucket urls of project directories")
+    parser.add_argument("-f", "--file", type=str, default='', help="YAML file listing projects, with per-project pipeline, local_path, output and upload_url")
+    parser.add_argument("-p", "--pipeline", type=str, default="", help="Pipeline filename to run for projects which do not specify one")
+    parser.add_argument("--report", type=str, default='', help="Write the batch report as JSON to this path")
+
+# The `batch` subcommand
+def _batch_command(args:Namespace):
+    from .batch import BatchProject, BatchRunner, load_batch_file
+
+    specs = [BatchProject(project=project) for project in args.projects]
+    if args.file:
+        specs += load_batch_file(args.file).projects
+    if not specs:
+        print_err("No projects to run")
+        sys.exit(1)
+
+    report = BatchRunner(specs, default_pipeline=args.pipeline).run()
+    report.print()
+    if args.report:
+        Path(args.report).write_text(report.model_dump_json(indent=2))
+        print("Batch report written to", args.report)
+    if not report.ok:
+        sys.exit(1)
+
+
+def _add_serve_args(parser:ArgumentParser):
+    parser.add_argument('--host', type=str, default='127.0.0.1', help="Address to listen on")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="Number of jobs run at once, each by a warm worker process")
+    parser.add_argument('--jobs-path', type=str, default='', help="Where the job queue and job logs are kept. Defaults to ~/.neurender/jobs")
+
+# The `serve` subcommand
+def _serve_command(args:Namespace):
+    from .server import serve
+
+    serve(args.host, args.port, args.workers, args.jobs_path)
+
+
+def create_parser() -> ArgumentParser:
+    parser = ArgumentParser(prog="neurender", description="Interface to control Neurender pipelines and configuration")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     _add_run_args(subparsers.add_parser("run", help="Run a Neurender project pipeline"))
     _add_config_args(subparsers.add_parser("config", help="Set Neurender configuration options"))
+    _add_cache_args(subparsers.add_parser("cache", help="List the projects in the local project cache, or evict them"))
 
     _add_download_args(subparsers.add_parser("download", help="Download a Neurender project from an S3 bucket"))
-    _add_download_args(subparsers.add_parser("upload", help="Upload a Neurender project to an S3 bucket"))  # same args as download
+    _add_upload_args(subparsers.add_parser("upload", help="Upload a Neurender project to an S3 bucket"))
+    _add_compress_args(subparsers.add_parser("compress", help="Compress a file or directory into a tarball on all cores, locally or streamed to S3"))
+    _add_decompress_args(subparsers.add_parser("decompress", help="Extract a tarball, locally or streamed from S3"))
+
+    _add_batch_args(subparsers.add_parser("batch", help="Run the pipelines of several projects, scheduling their steps together"))
+    _add_serve_args(subparsers.add_parser("serve", help="Run jobs submitted over a local HTTP API, with warm worker processes"))
+    return parser
+
 
-    args = parser.parse_args()
+def main(argv:Optional[List[str]]=None):
+    args = create_parser().parse_args(argv)
 
     command = args.command
 
@@ -88,10 +303,20 @@ def main():
         _run_command(args)
     if command == "config":
         _config_command(args)
+    if command == "cache":
+        _cache_command(args)
     if command == "download":
         _download_command(args)
     if command == "upload":
         _upload_command(args)
+    if command == "compress":
+        _compress_command(args)
+    if command == "decompress":
+        _decompress_command(args)
+    if command == "batch":
+        _batch_command(args)
+    if command == "serve":
+        _serve_command(args)
 
 
 
@@ -0,0 +1,252 @@
+"""
+Runs the pipelines of several projects together (`neurender batch`). Project downloads,
+pipeline steps and artifact uploads of all projects are scheduled as one set of tasks,
+limited by resource class (see config.PipelineConfig), so that one project's transfers
+overlap with another's processing.
+"""
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, List, Literal, Optional
+from pydantic import BaseModel
+
+from . import config, storage
+from .pipeline.scheduler import StepScheduler, step_dependencies
+from .project import NeurenderPipeline, NeurenderProject, PipelineRun
+from .storage.telemetry import TransferReport
+from .utils import print_err
+from .utils.pydantic import read_yaml_file
+
+MB = 1024 * 1024
+
+
+class BatchProject(BaseModel):
+    # Path or S3 url of the project
+    project:str
+    # Pipeline filename, defaults to the project's default pipeline
+    pipeline:str = ''
+    # Where a remote project is downloaded, defaults to the project cache if configured,
+    # otherwise a folder named after it
+    local_path:str = ''
+    # Output path, defaults to {project}/output/{pipeline_filename}
+    output:str = ''
+    # Where artifacts are uploaded, defaults to the project url
+    upload_url:str = ''
+
+
+class BatchSpec(BaseModel):
+    projects:List[BatchProject]
+
+
+class BatchProjectReport(BaseModel):
+    project:str
+    pipeline:str = ''
+    status:Literal['ok', 'failed'] = 'ok'
+    error:str = ''
+    # From the project's first task starting to its last one finishing
+    wall_s:float = 0
+    busy_s:Dict[str, float] = {}
+    downloaded_bytes:int = 0
+    uploaded_bytes:int = 0
+
+
+class ResourceClassReport(BaseModel):
+    limit:int
+    tasks:int = 0
+    busy_s:float = 0
+    # Share of the batch's wall time the class's slots were busy
+    utilization:float = 0
+
+
+class BatchReport(BaseModel):
+    wall_s:float = 0
+    projects_per_hour:float = 0
+    projects:List[BatchProjectReport] = []
+    resource_classes:Dict[str, ResourceClassReport] = {}
+    transfers:TransferReport = TransferReport()
+
+    @property
+    def ok(self) -> bool:
+        return all(p.status == 'ok' for p in self.projects)
+
+    def print(self):
+        succeeded = sum(p.status == 'ok' for p in self.projects)
+        print(f"Batch summary: {succeeded}/{len(self.projects)} projects succeeded in {self.wall_s:.1f}s "
+              f"({self.projects_per_hour:.1f} projects/hour)")
+        print(f"  {'Project':<40} {'Status':<7} {'Wall s':>8} {'Down MB':>8} {'Up MB':>8}")
+        for p in self.projects:
+            print(f"  {p.project:<40} {p.status:<7} {p.wall_s:>8.1f} {p.downloaded_bytes / MB:>8.1f} {p.uploaded_bytes / MB:>8.1f}")
+            if p.error:
+                print_err(f"    => {p.error}")
+        for name, resource_class in self.resource_classes.items():
+            print(f"  => {name}: {resource_class.tasks} tasks, {resource_class.busy_s:.1f}s busy, "
+                  f"{resource_class.utilization * 100:.0f}% of {resource_class.limit} slots")
+        for direction, stats in self.transfers.directions.items():
+            print(f"  => {direction}: {stats}")
+
+
+class BatchTask:
+    """
+    A unit of work for the scheduler: a project download or upload, or a pipeline step
+    """
+    def __init__(self, name:str, resource_class:str, func:Callable, project:"_BatchProjectRun"):
+        self.name = name
+        self.resource_class = resource_class
+        self.func = func
+        self.project = project
+
+
+class _BatchProjectRun:
+    def __init__(self, spec:BatchProject, default_pipeline:str):
+        self.spec = spec
+        self.pipeline_name = spec.pipeline or default_pipeline
+        self.report = BatchProjectReport(project=spec.project, pipeline=self.pipeline_name)
+        self.project:Optional[NeurenderProject] = None
+        self.pipeline:Optional[NeurenderPipeline] = None
+        self.run:Optional[PipelineRun] = None
+        self.transfers = storage.TransferSummary()
+        self.started_at = 0.0
+        self.finished_at = 0.0
+        self.finished = False
+
+    def fail(self, error:str):
+        self.report.status = 'failed'
+        if not self.report.error:
+            self.report.error = error
+
+
+def _check_transfers(summary:storage.TransferSummary, label:str):
+    if not summary.ok:
+        raise storage.StorageError(f"{label} failed for {len(summary.failed)} files")
+
+
+class BatchRunner:
+    def __init__(self, specs:List[BatchProject], default_pipeline='', pipeline_config:Optional[config.PipelineConfig]=None):
+        self.pipeline_config = pipeline_config or config.load().pipeline or config.PipelineConfig()
+        self.projects = [_BatchProjectRun(spec, default_pipeline) for spec in specs]
+        self.report = BatchReport()
+        self._lock = Lock()
+
+    def _load(self, p:_BatchProjectRun):
+        # Only the pipelines are downloaded here, the files they read are downloaded by tasks
+        p.project = NeurenderProject.load(p.spec.project, p.spec.local_path, lazy=True, use_cache=True)
+        if p.project.download_summary:
+            p.transfers.merge(p.project.download_summary)
+            _check_transfers(p.project.download_summary, "Download")
+
+        p.pipeline = p.project.get_pipeline(p.pipeline_name)
+        if not p.pipeline:
+            raise ValueError(f"Pipeline {p.pipeline_name} not found")
+        p.report.pipeline = p.pipeline.path.stem
+        p.run = PipelineRun(p.pipeline, p.spec.output, upload_url=p.spec.upload_url or p.project.url,
+                            pipeline_config=self.pipeline_config)
+
+    def _fetch(self, p:_BatchProjectRun):
+        summary = p.project.download_for_pipeline(p.pipeline)
+        p.transfers.merge(summary)
+        _check_transfers(summary, "Download")
+
+    def _upload(self, p:_BatchProjectRun):
+        self._finish_run(p)
+        if not p.run.upload_url:
+            return
+        summary = p.pipeline.upload_output_artifacts(p.run.working_path, p.run.upload_url)
+        p.transfers.merge(summary)
+        if p.pipeline.stream_summary:
+            p.transfers.merge(p.pipeline.stream_summary)
+        _check_transfers(summary, "Upload")
+
+    def _finish_run(self, p:_BatchProjectRun):
+        if p.run and not p.finished:
+            p.finished = True
+            p.run.finish()
+
+    def _create_tasks(self):
+        tasks:List[BatchTask] = []
+        dependencies = []
+        for p in self.projects:
+            if not p.run:
+                continue
+            label = Path(p.spec.project).name
+
+            fetch_index = len(tasks)
+            tasks.append(BatchTask(f"{label}: download", 'network', lambda p=p: self._fetch(p), p))
+            dependencies.append(set())
+
+            step_offset = len(tasks)
+            for step, deps in zip(p.pipeline.pipeline, step_dependencies(p.pipeline.pipeline)):
+                tasks.append(BatchTask(f"{label}: {step.name}", step.resource_class,
+                                       lambda p=p, step=step: p.run.run_step(step), p))
+                dependencies.append({ step_offset + d for d in deps } | { fetch_index })
+
+            tasks.append(BatchTask(f"{label}: upload", 'network', lambda p=p: self._upload(p), p))
+            dependencies.append(set(range(fetch_index, len(tasks) - 1)))
+        return tasks, dependencies
+
+    def _run_task(self, task:BatchTask):
+        p = task.project
+        start_time = time.monotonic()
+        with self._lock:
+            if not p.started_at:
+                p.started_at = start_time
+        try:
+            task.func()
+        except Exception as e:
+            with self._lock:
+                p.fail(f"{task.name}: {e}")
+            raise
+        finally:
+            elapsed = time.monotonic() - start_time
+            with self._lock:
+                p.finished_at = time.monotonic()
+                p.report.busy_s[task.resource_class] = p.report.busy_s.get(task.resource_class, 0) + elapsed
+                resource_class = self.report.resource_classes.setdefault(task.resource_class, ResourceClassReport(limit=1))
+                resource_class.tasks += 1
+                resource_class.busy_s += elapsed
+
+    def run(self) -> BatchReport:
+        start_time = time.monotonic()
+        concurrency = self.pipeline_config.concurrency()
+        self.report.resource_classes = { name: ResourceClassReport(limit=max(1, limit)) for name, limit in concurrency.items() }
+
+        print(f"Loading {len(self.projects)} projects")
+        for p in self.projects:
+            try:
+                self._load(p)
+                p.run.start()
+            except Exception as e:
+                print_err(f"Project {p.spec.project} not loaded: {e}")
+                p.fail(str(e))
+
+        tasks, dependencies = self._create_tasks()
+        print(f"Running {len(tasks)} tasks of {sum(p.run is not None for p in self.projects)} projects")
+        try:
+            StepScheduler(tasks, concurrency, dependencies=dependencies, groups=[id(t.project) for t in tasks]).run(self._run_task)
+        finally:
+            for p in self.projects:
+                self._finish_run(p)
+                if p.project:
+                    p.project.release()
+
+        self.report.wall_s = time.monotonic() - start_time
+        succeeded = sum(p.report.status == 'ok' for p in self.projects)
+        self.report.projects_per_hour = succeeded * 3600 / self.report.wall_s if self.report.wall_s > 0 else 0
+        for name, resource_class in self.report.resource_classes.items():
+            if self.report.wall_s > 0:
+                resource_class.utilization = resource_class.busy_s / (self.report.wall_s * resource_class.limit)
+
+        all_transfers = storage.TransferSummary()
+        for p in self.projects:
+            directions = p.transfers.report().directions
+            p.report.downloaded_bytes = directions['download'].bytes if 'download' in directions else 0
+            p.report.uploaded_bytes = directions['upload'].bytes if 'upload' in directions else 0
+            if p.started_at:
+                p.report.wall_s = p.finished_at - p.started_at
+            all_transfers.merge(p.transfers)
+            self.report.projects.append(p.report)
+        self.report.transfers = all_transfers.report()
+        return self.report
+
+
+def load_batch_file(path:Path | str) -> BatchSpec:
+    return read_yaml_file(BatchSpec, path)
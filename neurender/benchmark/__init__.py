@@ -0,0 +1,279 @@
+"""
+Benchmarks of storage syncs, media import and pipeline overhead on synthetic projects,
+for comparing performance between commits. See `python -m neurender.benchmark --help`.
+"""
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Literal, Optional, Tuple
+from pydantic import BaseModel
+
+from .. import config
+from ..paths import PROJECT_ROOT
+from . import stub_tools, synthetic
+
+MB = 1024 * 1024
+
+BUCKET_NAME = 'neurender-benchmark'
+
+
+class BenchmarkParams(BaseModel):
+    images:int = 100
+    image_size:Tuple[int, int] = (4000, 3000)
+    small_files:int = 2000
+    small_file_kb:int = 16
+    blobs:int = 2
+    blob_mb:int = 256
+    scale_to_max:int = 1600
+    worker_processes:int = 0
+    backend:Literal['threads', 'asyncio'] = 'threads'
+
+
+class BenchmarkResult(BaseModel):
+    name:str
+    seconds:float
+    files:int = 0
+    bytes:int = 0
+    # Further measurements, such as per-step times
+    details:Dict[str, float] = {}
+
+    @property
+    def throughput_mb_s(self) -> float:
+        return self.bytes / MB / self.seconds if self.seconds > 0 else 0
+
+
+class BenchmarkRun(BaseModel):
+    commit:str = ''
+    created:str = ''
+    host:Dict[str, str] = {}
+    params:BenchmarkParams
+    results:List[BenchmarkResult] = []
+
+    def print(self, baseline:Optional["BenchmarkRun"]=None):
+        baseline_results = { r.name: r for r in baseline.results } if baseline else {}
+        print(f"Benchmark results ({self.commit or 'unknown commit'})")
+        for result in self.results:
+            line = f"  {result.name:<30} {result.seconds:>9.3f}s"
+            line += f" {result.throughput_mb_s:>9.1f} MB/s" if result.bytes else ' ' * 15
+            previous = baseline_results.get(result.name)
+            if previous and previous.seconds > 0:
+                line += f"   {(result.seconds / previous.seconds - 1) * 100:+6.1f}% vs {previous.seconds:.3f}s"
+            print(line.rstrip())
+            for name, seconds in result.details.items():
+                line = f"    {name:<28} {seconds:>9.3f}s" + ' ' * 15
+                if previous and previous.details.get(name):
+                    line += f"   {(seconds / previous.details[name] - 1) * 100:+6.1f}%"
+                print(line.rstrip())
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return ''
+
+
+@contextmanager
+def _timed(results:List[BenchmarkResult], name:str, files=0, bytes=0) -> Iterator[BenchmarkResult]:
+    result = BenchmarkResult(name=name, seconds=0, files=files, bytes=bytes)
+    print(f" ==> Benchmark {name}")
+    start_time = time.monotonic()
+    yield result
+    result.seconds = time.monotonic() - start_time
+    results.append(result)
+
+
+@contextmanager
+def local_s3(endpoint_url='') -> Iterator[config.S3Config]:
+    """
+    Yields the config of an S3 compatible endpoint: `endpoint_url` if set (such as a
+    MinIO server), otherwise an in-process moto server. moto keeps objects in memory,
+    so use a real endpoint for multi-GB blobs.
+    """
+    if endpoint_url:
+        yield config.S3Config(endpoint_url=endpoint_url,
+                              access_key=os.environ.get('AWS_ACCESS_KEY_ID', 'test'),
+                              access_secret_key=os.environ.get('AWS_SECRET_ACCESS_KEY', 'test'))
+        return
+
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        raise SystemExit("Install moto[server] for a local S3 stand-in, or pass --endpoint-url")
+
+    # Request logging would drown out the benchmark output
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    try:
+        host, port = server.get_host_and_port()
+        yield config.S3Config(endpoint_url=f"http://{host}:{port}", access_key='test', access_secret_key='test')
+    finally:
+        server.stop()
+
+
+def bench_storage(s3_config:config.S3Config, root:Path, params:BenchmarkParams) -> List[BenchmarkResult]:
+    from ..storage import S3
+
+    s3_config = s3_config.model_copy(update={ 'backend': params.backend })
+    s3 = S3(s3_config)
+    try:
+        s3.client.create_bucket(Bucket=BUCKET_NAME)
+    except s3.client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+
+    src_path = root / 'storage-src'
+    print("Generating synthetic project files")
+    small_bytes = synthetic.write_file_tree(src_path / 'small', params.small_files, params.small_file_kb)
+    total_bytes = small_bytes + synthetic.write_blobs(src_path / 'blobs', params.blobs, params.blob_mb)
+    total_bytes += synthetic.write_images(src_path / 'media', params.images, params.image_size)
+    total_files = params.small_files + params.blobs + params.images
+
+    url = f"s3://{BUCKET_NAME}/{root.name}"
+    results = []
+    with _timed(results, 'upload_cold', total_files, total_bytes):
+        S3(s3_config).sync_to_remote(src_path, url)
+    with _timed(results, 'upload_unchanged', total_files):
+        S3(s3_config).sync_to_remote(src_path, url)
+    with _timed(results, 'download_cold', total_files, total_bytes):
+        S3(s3_config).sync_to_local(url, root / 'storage-dst')
+    with _timed(results, 'download_unchanged', total_files):
+        S3(s3_config).sync_to_local(url, root / 'storage-dst')
+    with _timed(results, 'download_select_media', params.images):
+        S3(s3_config).sync_to_local(url, root / 'storage-media', select='media/**/*')
+
+    # The small files again, packed into bundles
+    bundled_config = s3_config.model_copy(update={ 'bundle_threshold_kb': max(params.small_file_kb * 2, 64) })
+    bundled_url = f"s3://{BUCKET_NAME}/{root.name}-bundled"
+    with _timed(results, 'upload_bundled', params.small_files, small_bytes):
+        S3(bundled_config).sync_to_remote(src_path / 'small', bundled_url)
+    with _timed(results, 'download_bundled', params.small_files, small_bytes):
+        S3(bundled_config).sync_to_local(bundled_url, root / 'storage-bundled')
+    return results
+
+
+def bench_import(root:Path, params:BenchmarkParams) -> List[BenchmarkResult]:
+    from ..pipeline import ImportImageBatch, RunContext
+
+    project_path = root / 'import-project'
+    print("Generating synthetic images")
+    total_bytes = synthetic.write_images(project_path / 'media', params.images, params.image_size)
+
+    results = []
+    ctx = RunContext(project_path, root / 'import-rescale', worker_processes=params.worker_processes)
+    with _timed(results, 'import_rescale', params.images, total_bytes):
+        ImportImageBatch(scale_to_max=params.scale_to_max).run(ctx)
+
+    ctx = RunContext(project_path, root / 'import-stage', worker_processes=params.worker_processes)
+    with _timed(results, 'import_stage', params.images, total_bytes):
+        ImportImageBatch().run(ctx)
+    return results
+
+
+_BENCHMARK_PIPELINE = """name: Benchmark
+pipeline:
+  - step: ImportImageBatch
+    scale_to_max: {scale_to_max}
+  - step: AlignImages
+  - step: SetupGaussianSplattingData
+  - step: TrainGaussianSplattingModel
+    iterations: 2000
+    save_frequency: 1000
+upload_artifacts: []
+"""
+
+def bench_pipeline(root:Path, params:BenchmarkParams) -> List[BenchmarkResult]:
+    """
+    Runs a full pipeline through the CLI with stand-ins for the GPU tools (see
+    stub_tools), first from scratch, then again reusing cached step results
+    """
+    project_path = root / 'pipeline-project'
+    print("Generating synthetic pipeline project")
+    synthetic.write_images(project_path / 'media', params.images, params.image_size)
+    (project_path / 'pipelines').mkdir(parents=True, exist_ok=True)
+    (project_path / 'pipelines' / 'default.nrp').write_text(_BENCHMARK_PIPELINE.format(scale_to_max=params.scale_to_max))
+
+    env = { **os.environ, **stub_tools.install(root / 'stubs') }
+    results = []
+    for name in ('pipeline_cold', 'pipeline_cached'):
+        output_path = root / name
+        with _timed(results, name, params.images) as result:
+            subprocess.run([sys.executable, '-m', 'neurender', 'run', str(project_path), '-o', str(output_path)],
+                           env=env, check=True, stdout=subprocess.DEVNULL)
+
+        profile = json.loads((output_path / 'run-profile.json').read_text())
+        for step in profile['steps']:
+            result.details[step['step']] = step['wall_s']
+        # Time outside of the tools the steps run: startup, staging, caching and scheduling
+        result.details['commands'] = sum(c['wall_s'] for step in profile['steps'] for c in step['commands'])
+        result.details['overhead'] = result.seconds - result.details['commands']
+    return results
+
+
+# Commands timed by bench_startup, which should not import S3 or imaging libraries
+_STARTUP_COMMANDS = {
+    'startup_help': ['-m', 'neurender', '--help'],
+    'startup_run_help': ['-m', 'neurender', 'run', '--help'],
+    'startup_import_project': ['-c', 'import neurender.project'],
+}
+_STARTUP_REPEATS = 5
+
+# Prints the modules `neurender --help` imported
+_HELP_MODULES_SCRIPT = """
+import contextlib, io, sys
+sys.argv = ['neurender', '--help']
+from neurender.__main__ import main
+with contextlib.redirect_stdout(io.StringIO()), contextlib.suppress(SystemExit):
+    main()
+print(' '.join(sys.modules))
+"""
+_HEAVY_MODULES = { 'boto3', 'PIL', 'cv2', 'numpy', 'pydantic_yaml' }
+
+def bench_startup() -> List[BenchmarkResult]:
+    """
+    Times CLI startup, taking the fastest of several runs. Also fails if --help
+    imports boto3, PIL or OpenCV, which only the commands and steps using them should.
+    """
+    results = []
+    for name, args in _STARTUP_COMMANDS.items():
+        result = BenchmarkResult(name=name, seconds=float('inf'))
+        print(f" ==> Benchmark {name}")
+        for _ in range(_STARTUP_REPEATS):
+            start_time = time.monotonic()
+            subprocess.run([sys.executable] + args, check=True, stdout=subprocess.DEVNULL)
+            result.seconds = min(result.seconds, time.monotonic() - start_time)
+        results.append(result)
+
+    modules = subprocess.check_output([sys.executable, '-c', _HELP_MODULES_SCRIPT], text=True)
+    heavy_modules = _HEAVY_MODULES & set(modules.split())
+    if heavy_modules:
+        raise RuntimeError(f"neurender --help imported {', '.join(sorted(heavy_modules))}")
+    return results
+
+
+SUITES = ('startup', 'storage', 'import', 'pipeline')
+
+def run(root:Path, params:BenchmarkParams, suites=SUITES, endpoint_url='') -> BenchmarkRun:
+    benchmark = BenchmarkRun(
+        commit=_git_commit(),
+        created=datetime.now(timezone.utc).isoformat(),
+        host={ 'platform': platform.platform(), 'python': platform.python_version(), 'cpus': str(os.cpu_count()) },
+        params=params,
+    )
+    if 'startup' in suites:
+        benchmark.results += bench_startup()
+    if 'storage' in suites:
+        with local_s3(endpoint_url) as s3_config:
+            benchmark.results += bench_storage(s3_config, root, params)
+    if 'import' in suites:
+        benchmark.results += bench_import(root, params)
+    if 'pipeline' in suites:
+        benchmark.results += bench_pipeline(root, params)
+    return benchmark
@@ -0,0 +1,57 @@
+import shutil
+import tempfile
+from argparse import ArgumentParser
+from pathlib import Path
+
+from . import SUITES, BenchmarkParams, BenchmarkRun, run
+
+
+def main():
+    defaults = BenchmarkParams()
+    parser = ArgumentParser(description="Benchmark storage syncs, media import and pipeline overhead on synthetic projects")
+    parser.add_argument("--suites", nargs='+', choices=SUITES, default=list(SUITES), help="Benchmark suites to run")
+    parser.add_argument("--images", type=int, default=defaults.images, help="Number of synthetic images")
+    parser.add_argument("--image-size", type=int, nargs=2, default=list(defaults.image_size), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument("--small-files", type=int, default=defaults.small_files, help="Number of small files in storage benchmarks")
+    parser.add_argument("--small-file-kb", type=int, default=defaults.small_file_kb)
+    parser.add_argument("--blobs", type=int, default=defaults.blobs, help="Number of large files in storage benchmarks")
+    parser.add_argument("--blob-mb", type=int, default=defaults.blob_mb)
+    parser.add_argument("--scale-to-max", type=int, default=defaults.scale_to_max, help="Rescaling applied by image import")
+    parser.add_argument("--worker-processes", type=int, default=defaults.worker_processes, help="Processes for image import. Defaults to the CPU count")
+    parser.add_argument("--backend", type=str, choices=['threads', 'asyncio'], default=defaults.backend, help="S3 transfer backend")
+    parser.add_argument("--endpoint-url", type=str, default='', help="S3 compatible endpoint to benchmark against. Defaults to an in-process moto server")
+    parser.add_argument("-w", "--working-path", type=str, default='', help="Where synthetic projects are written. Defaults to a temporary directory")
+    parser.add_argument("-o", "--output", type=str, default='', help="Write results as JSON to this path")
+    parser.add_argument("-c", "--compare", type=str, default='', help="Results JSON of a previous run to compare against")
+    args = parser.parse_args()
+
+    params = BenchmarkParams(
+        images=args.images,
+        image_size=tuple(args.image_size),
+        small_files=args.small_files,
+        small_file_kb=args.small_file_kb,
+        blobs=args.blobs,
+        blob_mb=args.blob_mb,
+        scale_to_max=args.scale_to_max,
+        worker_processes=args.worker_processes,
+        backend=args.backend,
+    )
+
+    root = Path(args.working_path or tempfile.mkdtemp(prefix='neurender-benchmark-'))
+    root.mkdir(parents=True, exist_ok=True)
+    try:
+        benchmark = run(root, params, suites=args.suites, endpoint_url=args.endpoint_url)
+    finally:
+        if not args.working_path:
+            shutil.rmtree(root, ignore_errors=True)
+
+    baseline = BenchmarkRun.model_validate_json(Path(args.compare).read_text()) if args.compare else None
+    benchmark.print(baseline)
+
+    if args.output:
+        Path(args.output).write_text(benchmark.model_dump_json(indent=2))
+        print(f"Wrote results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Stand-ins for the GPU tools pipelines run (ns-process-data, and gaussian-splatting's
+convert.py and train.py), which only write outputs shaped like the real ones, so
+benchmarks measure the pipeline around them.
+"""
+import os
+import shutil
+import stat
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Dict, List
+
+# Size of written model files, standing in for point clouds and checkpoints
+MODEL_FILE_SIZE = 8 * 1024 * 1024
+
+_SPARSE_FILES = ('cameras.bin', 'images.bin', 'points3D.bin')
+
+
+def _write_sparse_model(path:Path):
+    path.mkdir(parents=True, exist_ok=True)
+    for name in _SPARSE_FILES:
+        (path / name).write_bytes(os.urandom(64 * 1024))
+
+
+def _copy_images(src:Path, dst:Path):
+    dst.mkdir(parents=True, exist_ok=True)
+    for path in sorted(src.iterdir()):
+        if path.is_file():
+            shutil.copy(path, dst / path.name)
+
+
+def ns_process_data(argv:List[str]):
+    parser = ArgumentParser()
+    parser.add_argument('mode')
+    parser.add_argument('--data', required=True)
+    parser.add_argument('--output-dir', required=True)
+    args, _ = parser.parse_known_args(argv)
+
+    output_path = Path(args.output_dir)
+    _copy_images(Path(args.data), output_path / 'images')
+    _write_sparse_model(output_path / 'colmap' / 'sparse' / '0')
+    (output_path / 'transforms.json').write_text('{"frames": []}')
+
+
+def convert(argv:List[str]):
+    parser = ArgumentParser()
+    parser.add_argument('--source_path', required=True)
+    args, _ = parser.parse_known_args(argv)
+
+    source_path = Path(args.source_path)
+    _copy_images(source_path / 'input', source_path / 'images')
+    _write_sparse_model(source_path / 'sparse' / '0')
+
+
+def train(argv:List[str]):
+    parser = ArgumentParser()
+    parser.add_argument('--source_path', required=True)
+    parser.add_argument('--model_path', required=True)
+    parser.add_argument('--images', default='images')
+    parser.add_argument('--save_iterations', nargs='+', type=int, default=[])
+    args, _ = parser.parse_known_args(argv)
+
+    if not any((Path(args.source_path) / args.images).iterdir()):
+        raise SystemExit(f"No images in {args.images}")
+
+    model_path = Path(args.model_path)
+    for iteration in args.save_iterations:
+        point_cloud_path = model_path / 'point_cloud' / f'iteration_{iteration}'
+        point_cloud_path.mkdir(parents=True, exist_ok=True)
+        (point_cloud_path / 'point_cloud.ply').write_bytes(os.urandom(MODEL_FILE_SIZE))
+        (model_path / f'chkpnt{iteration}.pth').write_bytes(os.urandom(MODEL_FILE_SIZE))
+
+
+TOOLS = {
+    'ns-process-data': ns_process_data,
+    'convert': convert,
+    'train': train,
+}
+
+
+def install(root:Path) -> Dict[str, str]:
+    """
+    Writes the stand-in tools under `root`, returning the environment variables
+    which make pipelines run them instead of the real tools
+    """
+    package_root = Path(__file__).parent.parent.parent
+    bin_path = root / 'bin'
+    bin_path.mkdir(parents=True, exist_ok=True)
+    script_path = bin_path / 'ns-process-data'
+    script_path.write_text(f'#!/bin/sh\nexec "{sys.executable}" -c \'import sys\nfrom neurender.benchmark.stub_tools import TOOLS\nTOOLS["ns-process-data"](sys.argv[1:])\' "$@"\n')
+    script_path.chmod(script_path.stat().st_mode | stat.S_IEXEC)
+
+    gaussian_splatting_path = root / 'tools' / 'gaussian-splatting'
+    gaussian_splatting_path.mkdir(parents=True, exist_ok=True)
+    for name in ('convert', 'train'):
+        (gaussian_splatting_path / f'{name}.py').write_text(
+            f'import sys\nfrom neurender.benchmark.stub_tools import TOOLS\nTOOLS["{name}"](sys.argv[1:])\n')
+
+    return {
+        'PATH': f"{bin_path}{os.pathsep}{os.environ.get('PATH', '')}",
+        'PYTHONPATH': f"{package_root}{os.pathsep}{os.environ.get('PYTHONPATH', '')}",
+        'NEURENDER_TOOLS_ROOT': str(root / 'tools'),
+    }
+
+
+if __name__ == '__main__':
+    TOOLS[sys.argv[1]](sys.argv[2:])
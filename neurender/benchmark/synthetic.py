@@ -0,0 +1,56 @@
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+from PIL import Image
+
+MB = 1024 * 1024
+
+_BLOB_CHUNK_SIZE = 64 * MB
+
+
+def write_images(directory:Path, count:int, size:Tuple[int, int], seed=0) -> int:
+    """
+    Writes `count` JPEGs of `size`, of smooth noise so they compress like photos
+    rather than like pure noise. Returns the total bytes written.
+    """
+    rng = np.random.default_rng(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    width, height = size
+    total = 0
+    for i in range(count):
+        coarse = rng.integers(0, 255, (max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+        image = Image.fromarray(coarse).resize((width, height), Image.BILINEAR)
+        path = directory / f"IMG_{i:05}.jpg"
+        image.save(path, quality=90)
+        total += path.stat().st_size
+    return total
+
+
+def write_file_tree(directory:Path, count:int, size_kb:int, files_per_directory=100, seed=0) -> int:
+    """
+    Writes `count` files of random content, spread over nested directories like
+    COLMAP outputs and checkpoints are. Returns the total bytes written.
+    """
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        subdirectory = directory / f"d{i // (files_per_directory * files_per_directory):03}" / f"d{(i // files_per_directory) % files_per_directory:03}"
+        subdirectory.mkdir(parents=True, exist_ok=True)
+        (subdirectory / f"f{i:06}.bin").write_bytes(rng.bytes(size_kb * 1024))
+    return count * size_kb * 1024
+
+
+def write_blobs(directory:Path, count:int, size_mb:int, seed=0) -> int:
+    """
+    Writes `count` large files of random content. Returns the total bytes written.
+    """
+    rng = np.random.default_rng(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        remaining = size_mb * MB
+        with open(directory / f"blob{i:02}.bin", 'wb') as f:
+            while remaining:
+                chunk = min(remaining, _BLOB_CHUNK_SIZE)
+                f.write(rng.bytes(chunk))
+                remaining -= chunk
+    return count * size_mb * MB
@@ -1,6 +1,6 @@
 from io import IOBase, StringIO
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Literal, Optional
 from pydantic import BaseModel
 from .utils.pydantic import read_yaml_file, write_yaml_file
 from .paths import CONFIG_FILE
@@ -10,15 +10,88 @@ class S3Config(BaseModel):
     endpoint_url:str = ''
     access_key:str = ''
     access_secret_key:str = ''
+    # Number of files transferred concurrently
     process_count:int = 8
+    # Number of planned transfers queued ahead of the running ones, which bounds how far
+    # listing gets ahead of transfers. 0 defaults to process_count * 2
+    transfer_queue_size:int = 0
+    # 'threads' schedules transfers from the calling thread. 'asyncio' runs listing,
+    # filtering and transfers as a concurrent producer/consumer pipeline (see storage.aio).
+    # Both sync 50k small objects with a local S3 stand-in in the same time, so 'asyncio'
+    # is for callers in an event loop, which can await storage.AsyncS3 directly.
+    backend:Literal['threads', 'asyncio'] = 'threads'
+    # Size of the HTTP connection pool shared by concurrent transfers. Large files use up to
+    # `part_concurrency` connections each, so this should cover process_count * part_concurrency
+    # when transferring many large files.
+    max_pool_connections:int = 32
+
+    # Files at least this large are transferred in parts of `multipart_chunksize_mb`,
+    # as multipart uploads and ranged GETs, with up to `part_concurrency` parts in flight.
+    # Changing the upload part size changes the ETags of newly uploaded objects.
+    multipart_threshold_mb:int = 8
+    multipart_chunksize_mb:int = 8
+    part_concurrency:int = 10
+
+    # Interrupted downloads resume from the last checkpoint, taken every this many MB
+    resume_checkpoint_mb:int = 64
+
+    # Uploads pack files smaller than this into bundle objects of about `bundle_size_mb`,
+    # one request per bundle rather than per file (see storage.bundles). 0 disables
+    # bundling. Downloads unpack bundles whatever this is set to.
+    bundle_threshold_kb:int = 0
+    bundle_size_mb:int = 64
 
 
 class StorageConfig(BaseModel):
     s3:Optional[S3Config] = None
     
 
+class CacheConfig(BaseModel):
+    # Remote projects run without a local path are kept under this directory, one folder
+    # per project url, so repeat runs only download what changed (see project_cache).
+    # '' downloads them into a folder named after the url in the current directory.
+    root:str = ''
+    # Before a project is downloaded, the intermediates and the cached step results holding
+    # them, then the whole folders, of the least recently used projects are evicted to
+    # bring the cache under this size.
+    # Projects in use by a run are never evicted. 0 for no limit.
+    max_size_gb:float = 0
+
+
+class PipelineConfig(BaseModel):
+    # Maximum number of independent pipeline steps running at once, by resource class.
+    # 'network' limits project downloads and uploads in batch runs.
+    cpu_concurrency:int = 2
+    gpu_concurrency:int = 1
+    io_concurrency:int = 4
+    network_concurrency:int = 2
+
+    # Processes used within CPU bound steps, 0 for one per core
+    worker_processes:int = 0
+
+    # The least recently used resized images are evicted from a project's image cache
+    # to keep it under this size (see pipeline.pyramid). 0 for no limit.
+    image_cache_max_size_gb:float = 10
+
+    # Seconds between scans uploading finished artifacts while the pipeline runs, 0 to
+    # only upload once it is done
+    artifact_stream_interval_s:float = 30
+    # Seconds an artifact must be unchanged to be considered finished
+    artifact_stable_s:float = 10
+
+    def concurrency(self) -> Dict[str, int]:
+        return {
+            'cpu': self.cpu_concurrency,
+            'gpu': self.gpu_concurrency,
+            'io': self.io_concurrency,
+            'network': self.network_concurrency,
+        }
+
+
 class NeurenderConfig(BaseModel):
     storage:Optional[StorageConfig] = None
+    pipeline:Optional[PipelineConfig] = None
+    cache:Optional[CacheConfig] = None
 
 
 
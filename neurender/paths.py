@@ -2,9 +2,12 @@ import os
 from pathlib import Path
 
 PROJECT_ROOT = Path(__file__).parent.parent
-TOOLS_ROOT = PROJECT_ROOT / "tools"
+# Overridable to run pipelines against other builds of the tools, or stand-ins
+TOOLS_ROOT = Path(os.environ.get("NEURENDER_TOOLS_ROOT", PROJECT_ROOT / "tools"))
 
 GAUSSIAN_SPLATTING_ROOT = TOOLS_ROOT / "gaussian-splatting"
 NERFSTUDIO_GAUSSIAN_SPLATTING_ROOT = TOOLS_ROOT / "nerfstudio-gaussian-splatting-fork"
 
-CONFIG_FILE = Path("~/.neurender.conf").expanduser()
\ No newline at end of file
+CONFIG_FILE = Path("~/.neurender.conf").expanduser()
+# Queue and logs of jobs submitted to `neurender serve`
+JOBS_PATH = Path("~/.neurender/jobs").expanduser()
\ No newline at end of file
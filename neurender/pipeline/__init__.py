@@ -1,12 +1,16 @@
+import multiprocessing
 import os
 import shutil
-from typing import List, Literal, Tuple
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import ClassVar, Iterable, List, Literal, Optional, Set, Tuple
 from pathlib import Path
 from pydantic import BaseModel, root_validator
 from abc import ABCMeta, abstractmethod
-from PIL import Image
-from am_imaging.video.frame_selection import export_sharpest_frames
-from ..utils import path_str
+from ..utils import path_str, print_err
+from ..utils.files import list_images
+from ..utils.staging import StagingStats, stage_file, stage_tree
 from ..utils.subprocess import run_command
 
 from neurender.paths import GAUSSIAN_SPLATTING_ROOT, NERFSTUDIO_GAUSSIAN_SPLATTING_ROOT
@@ -14,19 +18,49 @@ from neurender.paths import GAUSSIAN_SPLATTING_ROOT, NERFSTUDIO_GAUSSIAN_SPLATTI
 
 SRC_MEDIA_PATH = 'media'
 STAGED_MEDIA_PATH = 'media-staged'
+PRUNED_MEDIA_PATH = 'media-pruned'
 REGISTERED_MEDIA_PATH = 'media-registered'
 REGISTERED_MEDIA_GS_PATH = 'media-registered-gaussian-splatting'
 
 NERF_MODEL_PATH = 'model-nerf'
 GS_MODEL_PATH = 'model-gaussian-splatting'
 
+# Relative to the project path
+STEP_CACHE_PATH = 'cache/steps'
+IMAGE_CACHE_PATH = 'cache/images'
+
+
+def _dir(path:str) -> str:
+    # Working path prefix of everything within a directory
+    return path.rstrip('/') + '/'
+
+def _flatten(path:str) -> str:
+    # Staged media file names flatten the source directory structure
+    return path.replace('/', '_')
+
+def _staged_prefix(select:str) -> str:
+    # Staged files are named after their source path, so the literal directory
+    # part of a media selection determines which staged files it may produce
+    literal = re.split(r'[*?\[]', select)[0]
+    literal = literal[:literal.rfind('/') + 1]
+    return _dir(STAGED_MEDIA_PATH) + _flatten(literal)
+
+
 class RunContext:
-    def __init__(self, project_path:Path, working_path:Path, no_skip_steps=[]):
+    def __init__(self, project_path:Path, working_path:Path, no_skip_steps=[], worker_processes=0, image_cache_max_size=0):
         self.project_path = project_path.absolute()
         self.working_path = working_path.absolute()
         self.no_skip_steps = no_skip_steps or []
+        # Processes a CPU bound step may use, 0 for one per core
+        self.worker_processes = worker_processes or os.cpu_count() or 1
+        # Bytes the project's image cache is kept under, 0 for no limit
+        self.image_cache_max_size = image_cache_max_size
+        # Working path files written or restored by steps of this run, which restoring
+        # a later step's cached result leaves in place (see cache.StepCache)
+        self.produced_files:Set[str] = set()
 
     def can_skip_step(self, step:"PipelineStep"):
+        # Steps not listed in no_skip_steps may reuse cached results
         name = step.name
         return name not in self.no_skip_steps
 
@@ -38,20 +72,67 @@ class RunContext:
     def staged_media_path(self) -> Path:
         return self.working_path / STAGED_MEDIA_PATH
 
+    def map_processes(self, func, *iterables, chunksize=1) -> List:
+        """
+        Maps `func` over `iterables` on up to worker_processes processes
+        """
+        if self.worker_processes == 1:
+            return list(map(func, *iterables))
+        # Spawned rather than forked, since other steps and transfers may be running threads
+        with ProcessPoolExecutor(self.worker_processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+            return list(executor.map(func, *iterables, chunksize=chunksize))
+
 
 class PipelineStep(BaseModel):
-     
+    # Concurrency limit the scheduler applies to the step: 'cpu', 'gpu' or 'io'
+    # (see config.PipelineConfig). Batch runs also schedule transfers as 'network'.
+    resource_class:ClassVar[str] = 'cpu'
+
+    # Whether results may be reused from the step cache (see cache.StepCache)
+    cache_results:ClassVar[bool] = True
+
+    # False for steps which replace their output files rather than modifying them, so
+    # outputs hardlinked to other files (see utils.staging) need not be copied beforehand
+    writes_outputs_in_place:ClassVar[bool] = True
+
+    @property
+    def inputs(self) -> Optional[List[str]]:
+        """
+        Prefixes of the working paths the step reads, for scheduling independent steps
+        concurrently. None if unknown, in which case the step runs alone, in order.
+        """
+        return None
+
+    @property
+    def outputs(self) -> Optional[List[str]]:
+        """
+        Prefixes of the working paths the step writes, see inputs.
+        """
+        return None
+
+    @property
+    def sources(self) -> Optional[List[str]]:
+        """
+        Glob patterns of the project files the step reads, relative to the project path,
+        so a remote project can be fetched selectively. None if unknown, in which case
+        the whole project is fetched before the step runs.
+        """
+        return [] if self.inputs is not None else None
+
+    def source_files(self, ctx:RunContext) -> Iterable[Path]:
+        """
+        Project files the step reads, which together with its inputs determine its result
+        """
+        return []
+
+    @property
+    def is_cacheable(self) -> bool:
+        return self.cache_results and self.inputs is not None and bool(self.outputs)
+
     @abstractmethod
     def run(self, ctx:RunContext):
         pass
 
-    def _skip_step(self, ctx:RunContext, output_path:Path, substep='main'):
-        result = output_path.exists() and ctx.can_skip_step(self)
-        if result:
-            print(f" ==> Skipping step {self.name}:{substep}")
-
-        return result
-
     @property
     def name(self):
         return self.__class__.__name__
@@ -93,52 +174,205 @@ class _BaseImportStep(PipelineStep):
 
 
 
+# EXIF orientations which rotate the image by 90 degrees, swapping width and height
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Reduced size decoding is used when scaling to at most this factor
+_DRAFT_MAX_SCALING = 0.5
+
 class ImportImageBatch(_BaseImportStep):
     select:str = "**/*"
 
+    writes_outputs_in_place:ClassVar[bool] = False
+
+    @property
+    def inputs(self):
+        return []
+
+    @property
+    def outputs(self):
+        return [_staged_prefix(self.select)]
+
+    @property
+    def sources(self):
+        return [f"{SRC_MEDIA_PATH}/{self.select}"]
+
+    def source_files(self, ctx:RunContext):
+        return [p for p in Path(ctx.src_media_path).glob(self.select) if p.is_file()]
+
     def run(self, ctx:RunContext):
         src_path = ctx.src_media_path
 
         print("Collecting images in", src_path)
-        for src_file_path in Path(src_path).glob(self.select):
-            if not src_file_path.is_file():
-                continue
+        src_file_paths = self.source_files(ctx)
+        stage_file_paths = [self._get_stage_file_path(ctx, p) for p in src_file_paths]
+
+        start_time = time.monotonic()
+        if self.is_rescaling_set:
+            print(f"Rescaling {len(src_file_paths)} images with {ctx.worker_processes} processes")
+            chunksize = max(1, min(16, len(src_file_paths) // (ctx.worker_processes * 4)))
+            ctx.map_processes(self._rescale_image, src_file_paths, stage_file_paths, chunksize=chunksize)
+        else:
+            stats = StagingStats()
+            for src_file_path, stage_file_path in zip(src_file_paths, stage_file_paths):
+                stage_file(src_file_path, stage_file_path, stats)
+            print(f" ==> Staged images: {stats}")
+
+        elapsed = time.monotonic() - start_time
+        rate = len(src_file_paths) / elapsed if elapsed > 0 else 0
+        print(f" ==> Imported {len(src_file_paths)} images in {elapsed:.1f}s ({rate:.1f} images/s)")
+
+    def _rescale_image(self, src_file_path:Path, stage_file_path:Path):
+        # Imported here rather than at startup, like the video step's OpenCV
+        from PIL import ExifTags, Image, ImageOps
+
+        with Image.open(src_file_path) as image:
+            scaling = self._get_scaling(image.size)
+            width, height = image.size
+            if image.getexif().get(ExifTags.Base.Orientation) in _TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+            new_size = (int(width * scaling), int(height * scaling))
+
+            if scaling <= _DRAFT_MAX_SCALING:
+                # JPEGs decode at 1/2, 1/4 or 1/8 scale, still no smaller than requested, instead of at full size
+                image.draft(image.mode, self._get_scaled_frame(image.size))
+
+            # Rotate pixels upright, since the rescaled image is saved with the orientation tag cleared
+            ImageOps.exif_transpose(image, in_place=True)
+            image.thumbnail(new_size, Image.LANCZOS)
+            stage_file_path.unlink(missing_ok=True)
+            image.save(stage_file_path, exif=image.getexif())
+
+
+class _BaseVideoImportStep(_BaseImportStep):
+    # Frames are selected as the sharpest of each block of this many frames
+    extraction_interval:int = 1
+    downscale:float = 1
+
+    writes_outputs_in_place:ClassVar[bool] = False
+
+    @property
+    def inputs(self):
+        return []
 
-            stage_file_path = self._get_stage_file_path(ctx, src_file_path)
+    def run(self, ctx:RunContext):
+        from .video import export_segment, split_video
 
-            if self._skip_step(ctx, stage_file_path, substep=str(src_file_path)):
-                continue
+        video_paths = list(self.source_files(ctx))
+        if not video_paths:
+            print("No videos to import")
+            return
 
-            if self.is_rescaling_set:
-                print(f"Rescaling image {src_file_path}")
-                image = Image.open(src_file_path)
+        # Long videos are split into segments, so a single video also uses all processes
+        segments = []
+        for video_path in video_paths:
+            output_frame_prefix = path_str(self._get_stage_file_path(ctx, video_path)) + '_'
+            segments += split_video(video_path, output_frame_prefix, self.extraction_interval, ctx.worker_processes)
 
-                new_size = self._get_scaled_frame(image.size)
-                image.thumbnail(new_size, Image.ANTIALIAS)
+        print(f"Extracting frames from {len(video_paths)} videos in {len(segments)} segments with {ctx.worker_processes} processes")
+        start_time = time.monotonic()
+        frame_counts = ctx.map_processes(export_segment, segments, [self._get_scaled_frame] * len(segments))
 
-                image.save(stage_file_path)
-            else:
-                shutil.copy(src_file_path, stage_file_path)
+        elapsed = time.monotonic() - start_time
+        video_time = sum(frame_counts) * self.extraction_interval / elapsed if elapsed > 0 else 0
+        print(f" ==> Extracted {sum(frame_counts)} frames in {elapsed:.1f}s ({video_time:.1f} video frames/s)")
 
 
-class ImportVideo(_BaseImportStep):
+class ImportVideo(_BaseVideoImportStep):
     # Relative to {project}/media path
     file_path:str
-    extraction_interval:int = 1
-    downscale:float = 1
+
+    @property
+    def outputs(self):
+        return [_dir(STAGED_MEDIA_PATH) + _flatten(self.file_path) + '_']
+
+    @property
+    def sources(self):
+        return [f"{SRC_MEDIA_PATH}/{self.file_path}"]
+
+    def source_files(self, ctx:RunContext):
+        return [ctx.src_media_path / self.file_path]
+
+
+class ImportVideoBatch(_BaseVideoImportStep):
+    # Videos to import, relative to {project}/media path
+    select:str = "**/*.mp4"
+
+    @property
+    def outputs(self):
+        return [_staged_prefix(self.select)]
+
+    @property
+    def sources(self):
+        return [f"{SRC_MEDIA_PATH}/{self.select}"]
+
+    def source_files(self, ctx:RunContext):
+        return [p for p in Path(ctx.src_media_path).glob(self.select) if p.is_file()]
+
+
+class PruneSimilarImages(PipelineStep):
+    # Relative to media-staged/
+    input_path:str = '.'
+
+    # Images at least this similar to an image kept before them (in file name order, which
+    # is frame order for videos) are pruned. Similarity is the share of equal perceptual
+    # hash bits, 1 for identical images. Lower values prune more.
+    max_similarity:float = 0.9
+    # Perceptual hashes have hash_size² bits. Larger hashes tell apart smaller camera moves.
+    hash_size:int = 16
+
+    # Pruned images are moved here, relative to the working path, along with a report
+    pruned_path:str = PRUNED_MEDIA_PATH
+
+    # Images are pruned in place, which restoring cached outputs could not undo
+    cache_results:ClassVar[bool] = False
+
+    @property
+    def inputs(self):
+        input_path = os.path.normpath(self.input_path)
+        if input_path == '.':
+            return [_dir(STAGED_MEDIA_PATH)]
+        return [_dir(STAGED_MEDIA_PATH) + _dir(input_path)]
+
+    @property
+    def outputs(self):
+        return self.inputs + [_dir(os.path.normpath(self.pruned_path))]
 
     def run(self, ctx:RunContext):
-        input_path = ctx.src_media_path / self.file_path
-        output_path = ctx.staged_media_path
-        output_frame_prefix = path_str(self._get_stage_file_path(ctx, input_path)) + '_'
-        export_sharpest_frames(input_path,
-                               output_path,
-                               output_frame_prefix,
-                               downscale=self.downscale,
-                               interval=self.extraction_interval)
-        
-    
-MatchingMethodID = Literal['exhaustive', 'sequential', 'vocab_tree']
+        from .prune import REPORT_FILE_NAME, PrunedImage, PruneReport, perceptual_hash, select_distinct
+
+        input_path = ctx.staged_media_path / self.input_path
+        pruned_path = ctx.working_path / self.pruned_path
+        shutil.rmtree(pruned_path, ignore_errors=True)
+        pruned_path.mkdir(parents=True)
+
+        image_paths = list_images(input_path)
+        print(f"Hashing {len(image_paths)} images with {ctx.worker_processes} processes")
+        start_time = time.monotonic()
+        chunksize = max(1, min(64, len(image_paths) // (ctx.worker_processes * 4)))
+        hashes = ctx.map_processes(perceptual_hash, image_paths, [self.hash_size] * len(image_paths), chunksize=chunksize)
+
+        bits = self.hash_size * self.hash_size
+        report = PruneReport(images=len(image_paths), max_similarity=self.max_similarity, hash_size=self.hash_size)
+        if hashes:
+            max_distance = int(bits * (1 - self.max_similarity))
+            for image_path, selected in zip(image_paths, select_distinct(hashes, max_distance)):
+                if selected is None:
+                    report.kept += 1
+                    continue
+                kept_index, distance = selected
+                os.replace(image_path, pruned_path / image_path.name)
+                report.pruned.append(PrunedImage(image=image_path.name, similar_to=image_paths[kept_index].name,
+                                                 similarity=round(1 - distance / bits, 4)))
+
+        (pruned_path / REPORT_FILE_NAME).write_text(report.model_dump_json(indent=2))
+        elapsed = time.monotonic() - start_time
+        share = len(report.pruned) / report.images if report.images else 0
+        print(f" ==> Pruned {len(report.pruned)} of {report.images} images ({share:.0%}) in {elapsed:.1f}s, "
+              f"{report.kept} kept. Report: {pruned_path / REPORT_FILE_NAME}")
+
+
+MatchingMethodID = Literal['auto', 'exhaustive', 'sequential', 'vocab_tree']
 MatcherTypeID = Literal['any', 'NN', 'superglue', 'superglue-fast', 'NN-superpoint', 'NN-ratio', 'NN-mutual', 'adalam']
 FeatureTypeID = Literal['any', 'sift', 'superpoint', 'superpoint_aachen', 'superpoint_max', 'superpoint_inloc', 'r2d2', 'd2net-ss', 'sosnet', 'disk']
 
@@ -149,28 +383,47 @@ class AlignImages(PipelineStep):
     # Relative to working path
     output_path:str = REGISTERED_MEDIA_PATH
 
-    matching_method:MatchingMethodID = 'exhaustive'
+    # 'auto' chooses by the number of images and whether they are video frames (see matching.plan_matching)
+    matching_method:MatchingMethodID = 'auto'
     matcher_type:MatcherTypeID = 'any'
     feature_type:FeatureTypeID = 'any'
     refine_pixsfm:bool = False
 
+    @property
+    def inputs(self):
+        input_path = os.path.normpath(self.input_path)
+        if input_path == '.':
+            return [_dir(STAGED_MEDIA_PATH)]
+        return [_dir(STAGED_MEDIA_PATH) + _dir(input_path)]
+
+    @property
+    def outputs(self):
+        return [_dir(os.path.normpath(self.output_path))]
+
     def run(self, ctx:RunContext):
+        from .matching import EXHAUSTIVE_MAX_IMAGES, plan_matching
+
         print("Processing data at path:", ctx.staged_media_path)
 
         input_path = ctx.staged_media_path / self.input_path
         output_path = ctx.working_path / self.output_path
 
-        # Skip registration if output dir already exists
-        if self._skip_step(ctx, output_path):
-            return
+        use_hloc = self.refine_pixsfm
+        use_hloc |= self.matcher_type not in ['any']
+        use_hloc |= self.feature_type not in ['any', 'sift']
 
+        plan = plan_matching([p.name for p in list_images(input_path)], self.matching_method, 'hloc' if use_hloc else 'colmap')
+        print(f" ==> Planned {plan.describe()}")
+        if plan.method == 'exhaustive' and plan.images > EXHAUSTIVE_MAX_IMAGES:
+            print_err(f"  ** Exhaustive matching scales with the square of the image count, "
+                      f"consider matching_method: auto or PruneSimilarImages")
 
         cmd = [
             'ns-process-data',
             'images',
             '--data', input_path,
             '--output-dir', output_path,
-            '--matching-method', self.matching_method,
+            '--matching-method', plan.method,
             '--matcher-type', self.matcher_type,
             '--feature-type', self.feature_type,
         ]
@@ -178,32 +431,39 @@ class AlignImages(PipelineStep):
         if self.refine_pixsfm:
             cmd += ['--refine-pixsfm']
 
-        use_hloc = self.refine_pixsfm
-        use_hloc |= self.matcher_type not in ['any']
-        use_hloc |= self.feature_type not in ['any', 'sift']
-
         if use_hloc:
             cmd += ['--sfm-tool', 'hloc']
 
-
+        start_time = time.monotonic()
         try:
             run_command(cmd)
         except:
-            print("When registration fails, try a different matching_method, matcher_type, or feature_type")
+            print(f"Registration failed with {plan.method} matching. Try a different matching_method, matcher_type, or feature_type"
+                  + (", or exhaustive matching, which finds the most pairs" if plan.method != 'exhaustive' else ''))
             raise
+        print(f" ==> Registered {plan.images} images in {time.monotonic() - start_time:.0f}s (estimated {plan.estimated_seconds:.0f}s)")
 
 
 class SetupGaussianSplattingData(PipelineStep):
+    # train.py --resolution values to build downscaled images for up front (see pyramid.py),
+    # such as [2, 4, 8] or [1920], for several training runs at different resolutions
+    resolutions:List[int] = []
+
+    @property
+    def inputs(self):
+        return [_dir(REGISTERED_MEDIA_PATH)]
+
+    @property
+    def outputs(self):
+        return [_dir(REGISTERED_MEDIA_GS_PATH)]
 
     def run(self, ctx:RunContext):
         input_path = ctx.working_path / REGISTERED_MEDIA_PATH
         output_path = ctx.working_path / REGISTERED_MEDIA_GS_PATH
 
-        if self._skip_step(ctx, output_path):
-            return
-
-        shutil.copytree(input_path / 'colmap', output_path / 'distorted', dirs_exist_ok=True)
-        shutil.copytree(input_path / 'images', output_path / 'input', dirs_exist_ok=True)
+        stats = stage_tree(input_path / 'colmap', output_path / 'distorted')
+        stage_tree(input_path / 'images', output_path / 'input', stats)
+        print(f" ==> Staged registered media: {stats}")
 
         # Undistort aligned images
         run_command([
@@ -211,12 +471,18 @@ class SetupGaussianSplattingData(PipelineStep):
              "--source_path", output_path,
              "--skip_matching",
         ], cwd=GAUSSIAN_SPLATTING_ROOT)
+
+        if self.resolutions:
+            from .pyramid import build_resolutions
+            build_resolutions(ctx, output_path, self.resolutions, ctx.project_path / IMAGE_CACHE_PATH)
         
     
 class TrainingStep(PipelineStep):
-        pass
+    resource_class:ClassVar[str] = 'gpu'
 
 class TrainGaussianSplattingModel(TrainingStep):
+    # As train.py --resolution: 1, 2, 4 or 8 to downscale by that factor, -1 to fit
+    # 1600 pixels, otherwise a width in pixels. Images are resized before training.
     resolution:int = 1920
     iterations:int = 30_000
     save_iterations:List[int] = []
@@ -225,14 +491,31 @@ class TrainGaussianSplattingModel(TrainingStep):
     white_background:bool = False
     sh_degree:int = 3
 
+    # Prevent reusing training results for now
+    cache_results:ClassVar[bool] = False
+
+    @property
+    def inputs(self):
+        return [_dir(REGISTERED_MEDIA_GS_PATH)]
+
+    @property
+    def outputs(self):
+        from .pyramid import resolution_dir
+        images_dir = resolution_dir(self.resolution)
+        if images_dir == 'images':
+            return [_dir(GS_MODEL_PATH)]
+        # Resized images are added to the source data
+        return [_dir(GS_MODEL_PATH), _dir(REGISTERED_MEDIA_GS_PATH) + _dir(images_dir)]
+
     def run(self, ctx:RunContext):
+        from .pyramid import build_resolutions, resolution_dir
 
         source_path = ctx.working_path / REGISTERED_MEDIA_GS_PATH
         model_path = ctx.working_path / GS_MODEL_PATH
 
-        # Prevent skipping training step for now
-        # if self._skip_step(ctx, model_path):
-        #     return
+        # Restored from the image cache if SetupGaussianSplattingData or an earlier run built them
+        images_dir = resolution_dir(self.resolution)
+        build_resolutions(ctx, source_path, [self.resolution], ctx.project_path / IMAGE_CACHE_PATH)
 
         save_iterations = self.save_iterations
         if self.save_frequency > 0:
@@ -246,7 +529,9 @@ class TrainGaussianSplattingModel(TrainingStep):
              "--model_path", model_path,
              "--iterations", self.iterations,
              "--sh_degree", self.sh_degree,
-             "--resolution", self.resolution,
+             # Images are already at the requested resolution
+             "--images", images_dir,
+             "--resolution", 1,
              "--save_iterations", *save_iterations,
              "--checkpoint_iterations", *save_iterations,
         ]
@@ -257,6 +542,17 @@ class TrainGaussianSplattingModel(TrainingStep):
 
         
 class RunNerfStudioGaussianSplattingViewer(PipelineStep):
+    # Serves the model rather than computing anything
+    resource_class:ClassVar[str] = 'io'
+
+    @property
+    def inputs(self):
+        return [_dir(GS_MODEL_PATH)]
+
+    @property
+    def outputs(self):
+        return []
+
     def run(self, ctx:RunContext):
         run_command([
             "python3",
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterator, List, Tuple
+from pydantic import BaseModel, PrivateAttr
+
+from ..utils import print_err
+from ..utils.files import iter_files
+from ..utils.staging import StagingStats, stage_file
+
+# Bump to invalidate existing entries when the fingerprint changes meaning
+CACHE_VERSION = 1
+
+ENTRY_FILE_NAME = 'entry.json'
+ENTRY_FILES_PATH = 'files'
+DIGESTS_FILE_NAME = 'digests.json'
+
+_READ_BLOCK_SIZE = 1024 * 1024
+
+
+def iter_prefix_files(root:Path, prefix:str) -> Iterator[Tuple[str, os.DirEntry]]:
+    """
+    Yields (relative path, DirEntry) for the files under `root` whose relative path
+    starts with `prefix`, as declared by PipelineStep.inputs and outputs
+    """
+    directory = prefix[:prefix.rfind('/') + 1]
+    for relative_path, entry in iter_files(root / directory):
+        relative_path = directory + relative_path
+        if relative_path.startswith(prefix):
+            yield relative_path, entry
+
+
+def _snapshot(step, ctx) -> Dict[str, Tuple[int, int, int, int]]:
+    # Identity of each file under the step's outputs. Hardlinking a file changes its ctime,
+    # so files the step re-staged from the same source differ too.
+    snapshot = {}
+    for prefix in step.outputs:
+        for relative_path, entry in iter_prefix_files(ctx.working_path, prefix):
+            stat = entry.stat()
+            snapshot[relative_path] = (stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns)
+    return snapshot
+
+
+def _unshare(path:Path):
+    # Replace a hardlinked file with its own copy, so writing to it leaves other links intact
+    tmp_path = path.with_name(path.name + '.unshare')
+    stage_file(path, tmp_path, hardlink=False)
+    os.replace(tmp_path, path)
+
+
+class _FileDigest(BaseModel):
+    size:int
+    mtime_ns:int
+    digest:str
+
+
+class DigestIndex(BaseModel):
+    """
+    Content digests of files by absolute path, reused while a file's size and
+    modification time are unchanged, so unchanged inputs are not re-read on each run
+    """
+    files:Dict[str, _FileDigest] = {}
+
+    _lock:Lock = PrivateAttr(default_factory=Lock)
+
+    @staticmethod
+    def load(path:Path) -> "DigestIndex":
+        try:
+            return DigestIndex.model_validate_json(path.read_bytes())
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print_err("Step cache digests not loaded:", e)
+        return DigestIndex()
+
+    def save(self, path:Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        with self._lock:
+            tmp_path.write_text(self.model_dump_json())
+        os.replace(tmp_path, path)
+
+    def digest(self, path:str, stat:os.stat_result) -> str:
+        with self._lock:
+            known = self.files.get(path)
+        if known and known.size == stat.st_size and known.mtime_ns == stat.st_mtime_ns:
+            return known.digest
+
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while block := f.read(_READ_BLOCK_SIZE):
+                hasher.update(block)
+        digest = hasher.hexdigest()
+
+        with self._lock:
+            self.files[path] = _FileDigest(size=stat.st_size, mtime_ns=stat.st_mtime_ns, digest=digest)
+        return digest
+
+
+class StepCacheEntry(BaseModel):
+    step:str
+    # Output files, relative to the working path
+    files:List[str] = []
+
+
+class StepCache:
+    """
+    Project level cache of pipeline step results, keyed by a fingerprint of the step's
+    settings and the content of everything it reads. A changed setting or input yields
+    a new fingerprint instead of reusing stale output, and pipelines within a project
+    share results of identical steps.
+
+    Entries hold reflinks or hardlinks to the files a step wrote (see stage_file), and
+    are restored into the working path the same way, so neither usually copies data.
+    """
+    def __init__(self, path:Path):
+        self.path = path
+        self.digests = DigestIndex.load(path / DIGESTS_FILE_NAME)
+
+    def fingerprint(self, step, ctx) -> str:
+        hasher = hashlib.sha256()
+        settings = { 'version': CACHE_VERSION, 'step': step.name, 'settings': step.model_dump(mode='json') }
+        hasher.update(json.dumps(settings, sort_keys=True).encode())
+
+        for path in sorted(step.source_files(ctx)):
+            stat = os.stat(path)
+            hasher.update(f"\nsource {path.relative_to(ctx.project_path).as_posix()} {self.digests.digest(str(path), stat)}".encode())
+
+        for prefix in step.inputs:
+            files = sorted(iter_prefix_files(ctx.working_path, prefix), key=lambda f: f[0])
+            for relative_path, entry in files:
+                hasher.update(f"\ninput {relative_path} {self.digests.digest(entry.path, entry.stat())}".encode())
+
+        return hasher.hexdigest()
+
+    def run(self, step, ctx) -> bool:
+        """
+        Runs `step`, or restores its result from the cache, returning True if restored.
+        Steps listed in RunContext.no_skip_steps are always run, and their results
+        replace cached ones.
+        """
+        if not step.is_cacheable:
+            step.run(ctx)
+            return False
+
+        fingerprint = self.fingerprint(step, ctx)
+        if ctx.can_skip_step(step) and self.restore(fingerprint, step, ctx):
+            print(f" ==> Skipping step {step.name}: restored cached result {fingerprint[:12]}")
+            return True
+
+        # Outputs may be hardlinks into the cache, which the step must not write through
+        if step.writes_outputs_in_place:
+            for prefix in step.outputs:
+                for _, entry in iter_prefix_files(ctx.working_path, prefix):
+                    if entry.stat().st_nlink > 1:
+                        _unshare(Path(entry.path))
+
+        before = _snapshot(step, ctx)
+        step.run(ctx)
+        # Only the files the step wrote, not leftovers of other steps or earlier runs
+        written = [path for path, state in _snapshot(step, ctx).items() if before.get(path) != state]
+        ctx.produced_files.update(written)
+        self.store(fingerprint, step, ctx, written)
+        self.digests.save(self.path / DIGESTS_FILE_NAME)
+        return False
+
+    def restore(self, fingerprint:str, step, ctx) -> bool:
+        entry_path = self.path / fingerprint
+        try:
+            entry = StepCacheEntry.model_validate_json((entry_path / ENTRY_FILE_NAME).read_bytes())
+        except FileNotFoundError:
+            return False
+
+        files_path = entry_path / ENTRY_FILES_PATH
+        if not all((files_path / f).is_file() for f in entry.files):
+            print_err(f"  ** Cached result {fingerprint[:12]} is incomplete, ignoring")
+            return False
+
+        # Files left under the outputs by other settings or earlier runs would mix with the
+        # result, but those written by earlier steps of this run are kept
+        stale = [path for prefix in step.outputs for path, _ in iter_prefix_files(ctx.working_path, prefix)
+                 if path not in ctx.produced_files]
+        for relative_path in stale:
+            (ctx.working_path / relative_path).unlink(missing_ok=True)
+
+        stats = StagingStats()
+        for relative_path in entry.files:
+            stage_file(files_path / relative_path, ctx.working_path / relative_path, stats)
+        ctx.produced_files.update(entry.files)
+        # Marks the entry as used, for eviction by the project cache
+        os.utime(entry_path / ENTRY_FILE_NAME)
+        print(f" ==> Restored {len(entry.files)} files: {stats}" + (f", removed {len(stale)} stale files" if stale else ''))
+        return True
+
+    def store(self, fingerprint:str, step, ctx, files:List[str]):
+        # Built under a temporary name, then renamed into place so entries are never partial
+        tmp_path = self.path / f"{fingerprint}.{uuid.uuid4().hex[:8]}.tmp"
+        files_path = tmp_path / ENTRY_FILES_PATH
+
+        entry = StepCacheEntry(step=step.name)
+        for relative_path in sorted(files):
+            stage_file(ctx.working_path / relative_path, files_path / relative_path)
+            entry.files.append(relative_path)
+
+        tmp_path.mkdir(parents=True, exist_ok=True)
+        (tmp_path / ENTRY_FILE_NAME).write_text(entry.model_dump_json())
+
+        entry_path = self.path / fingerprint
+        shutil.rmtree(entry_path, ignore_errors=True)
+        os.replace(tmp_path, entry_path)
@@ -0,0 +1,109 @@
+"""
+Chooses how AlignImages matches image pairs, and estimates what that will cost
+before the hours-long part starts.
+"""
+import math
+import re
+from typing import Dict, Iterable, Literal
+from pydantic import BaseModel
+
+MatchingMethod = Literal['exhaustive', 'sequential', 'vocab_tree']
+SfmTool = Literal['colmap', 'hloc']
+
+# Unordered images are matched exhaustively up to this many images (about 45k pairs)
+EXHAUSTIVE_MAX_IMAGES = 300
+# Frames of one video are matched sequentially once there are more than this many
+SEQUENTIAL_MIN_FRAMES = 150
+
+# Pairs each image is matched with, as ns-process-data runs the tools: COLMAP's
+# sequential matcher matches the next `overlap` images and, with quadratic overlap,
+# those 2^k images ahead, its vocab tree matcher the 100 most similar images, and
+# hloc's retrieval the 50 most similar for any method but exhaustive.
+COLMAP_SEQUENTIAL_OVERLAP = 10
+COLMAP_VOCAB_TREE_IMAGES = 100
+HLOC_RETRIEVAL_IMAGES = 50
+
+# Rough rates on a single GPU, to tell minutes from days rather than to schedule by
+_PAIRS_PER_SECOND:Dict[str, float] = { 'colmap': 200, 'hloc': 25 }
+# Feature extraction and incremental mapping
+_SECONDS_PER_IMAGE:Dict[str, float] = { 'colmap': 0.5, 'hloc': 1 }
+
+VIDEO_SUFFIXES = ('.mp4', '.mov', '.m4v', '.avi', '.mkv', '.webm')
+
+# Staged video frames are named {flattened video path}_{block:06}.{format} (see video.export_segment)
+_VIDEO_FRAME_PATTERN = re.compile(r'^(?P<video>.+)_\d{6}\.[A-Za-z]+$')
+
+
+class MatchingPlan(BaseModel):
+    method:MatchingMethod
+    sfm_tool:SfmTool
+    reason:str
+    images:int
+    video_frames:int = 0
+    videos:int = 0
+    pairs:int = 0
+    estimated_seconds:float = 0
+
+    def describe(self) -> str:
+        return (f"{self.method} matching of {self.images} images with {self.sfm_tool} ({self.reason}): "
+                f"~{self.pairs:,} pairs, estimated {format_duration(self.estimated_seconds)}")
+
+
+def format_duration(seconds:float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+def video_of_frame(image_name:str) -> str:
+    """
+    The flattened path of the video a staged image was extracted from, or '' for photos
+    """
+    match = _VIDEO_FRAME_PATTERN.match(image_name)
+    if match and match['video'].lower().endswith(VIDEO_SUFFIXES):
+        return match['video']
+    return ''
+
+
+def estimate_pairs(method:MatchingMethod, sfm_tool:SfmTool, images:int) -> int:
+    if images < 2:
+        return 0
+    if method == 'exhaustive':
+        return images * (images - 1) // 2
+    if sfm_tool == 'hloc':
+        return images * min(images - 1, HLOC_RETRIEVAL_IMAGES)
+    if method == 'sequential':
+        return images * min(images - 1, COLMAP_SEQUENTIAL_OVERLAP + int(math.log2(images)))
+    return images * min(images - 1, COLMAP_VOCAB_TREE_IMAGES)
+
+
+def plan_matching(image_names:Iterable[str], method:Literal['auto', MatchingMethod], sfm_tool:SfmTool) -> MatchingPlan:
+    """
+    Plans matching of the staged images. With 'auto', small sets are matched
+    exhaustively, frames of a single video sequentially, and anything larger using
+    a vocabulary tree, which finds overlapping images wherever they were taken.
+    """
+    videos = [video_of_frame(name) for name in image_names]
+    images = len(videos)
+    video_frames = sum(bool(v) for v in videos)
+    video_count = len(set(v for v in videos if v))
+    single_video = video_count == 1 and video_frames == images
+
+    if method != 'auto':
+        reason = 'configured'
+    elif single_video and images > SEQUENTIAL_MIN_FRAMES:
+        method, reason = 'sequential', "frames of a single video"
+    elif images <= EXHAUSTIVE_MAX_IMAGES:
+        method, reason = 'exhaustive', f"at most {EXHAUSTIVE_MAX_IMAGES} images"
+    else:
+        method = 'vocab_tree'
+        reason = f"{video_count} videos" if video_frames == images else f"{images - video_frames} unordered photos"
+        if video_frames and video_frames < images:
+            reason += f" and {video_frames} video frames"
+
+    pairs = estimate_pairs(method, sfm_tool, images)
+    estimated_seconds = images * _SECONDS_PER_IMAGE[sfm_tool] + pairs / _PAIRS_PER_SECOND[sfm_tool]
+    return MatchingPlan(method=method, sfm_tool=sfm_tool, reason=reason, images=images, video_frames=video_frames,
+                        videos=video_count, pairs=pairs, estimated_seconds=estimated_seconds)
@@ -0,0 +1,71 @@
+import time
+from pathlib import Path
+from threading import Lock
+from typing import List, Literal
+from pydantic import BaseModel, PrivateAttr
+
+from ..utils.subprocess import CommandProfile
+
+RUN_PROFILE_FILE = "run-profile.json"
+STEP_LOGS_PATH = "logs"
+
+MB = 1024 * 1024
+
+StepStatus = Literal['ok', 'cached', 'failed']
+
+
+class StepProfile(BaseModel):
+    step:str
+    status:StepStatus = 'ok'
+    error:str = ''
+    # Waiting for project files to be fetched, before the step started
+    fetch_wait_s:float = 0
+    wall_s:float = 0
+    # Totals of the thread running the step and its commands
+    user_cpu_s:float = 0
+    system_cpu_s:float = 0
+    peak_rss_mb:float = 0
+    read_bytes:int = 0
+    written_bytes:int = 0
+    log_path:str = ''
+    commands:List[CommandProfile] = []
+
+    def add_commands(self, commands:List[CommandProfile]):
+        self.commands += commands
+        self.user_cpu_s += sum(c.user_cpu_s for c in commands)
+        self.system_cpu_s += sum(c.system_cpu_s for c in commands)
+        self.peak_rss_mb = max([self.peak_rss_mb] + [c.peak_rss_mb for c in commands])
+        self.read_bytes += sum(c.read_bytes for c in commands)
+        self.written_bytes += sum(c.written_bytes for c in commands)
+
+
+class RunProfile(BaseModel):
+    """
+    Resources used by each step of a pipeline run, in the order steps finished
+    """
+    pipeline:str
+    wall_s:float = 0
+    steps:List[StepProfile] = []
+
+    _lock:Lock = PrivateAttr(default_factory=Lock)
+    _start_time:float = PrivateAttr(default_factory=time.monotonic)
+
+    def add(self, step:StepProfile):
+        with self._lock:
+            self.steps.append(step)
+
+    def finish(self):
+        self.wall_s = time.monotonic() - self._start_time
+
+    def save(self, working_path:Path) -> Path:
+        path = working_path / RUN_PROFILE_FILE
+        with self._lock:
+            path.write_text(self.model_dump_json(indent=2))
+        return path
+
+    def print(self):
+        print(f"Run profile: {len(self.steps)} steps in {self.wall_s:.1f}s")
+        print(f"  {'Step':<32} {'Status':<7} {'Wall s':>8} {'CPU s':>8} {'Peak MB':>8} {'Read MB':>8} {'Write MB':>8}")
+        for s in self.steps:
+            print(f"  {s.step:<32} {s.status:<7} {s.wall_s:>8.1f} {s.user_cpu_s + s.system_cpu_s:>8.1f} "
+                  f"{s.peak_rss_mb:>8.0f} {s.read_bytes / MB:>8.0f} {s.written_bytes / MB:>8.0f}")
@@ -0,0 +1,87 @@
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+from pydantic import BaseModel
+
+REPORT_FILE_NAME = 'prune-report.json'
+
+# Hashes are taken from the low frequencies of a thumbnail this many times the hash size
+_THUMBNAIL_SCALE = 4
+
+# Set bits of each byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class PrunedImage(BaseModel):
+    image:str
+    # The kept image it is a near-duplicate of
+    similar_to:str
+    similarity:float
+
+
+class PruneReport(BaseModel):
+    images:int = 0
+    kept:int = 0
+    max_similarity:float = 0
+    hash_size:int = 0
+    pruned:List[PrunedImage] = []
+
+
+def _dct_matrix(size:int) -> np.ndarray:
+    # Orthonormal DCT-II basis, so a 2D DCT is two matrix products
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+def perceptual_hash(path:Path, hash_size:int) -> np.ndarray:
+    """
+    DCT perceptual hash (pHash) of an image: whether each of the lowest `hash_size`²
+    frequencies of a grayscale thumbnail is above their median, packed into bytes.
+    Unaffected by scaling, compression and small exposure changes, while a camera
+    moving enough to change the view changes many bits.
+    """
+    size = hash_size * _THUMBNAIL_SCALE
+    with Image.open(path) as image:
+        # JPEGs decode straight to a reduced size grayscale image
+        image.draft('L', (size, size))
+        pixels = np.asarray(image.convert('L').resize((size, size), Image.BILINEAR), dtype=np.float32)
+
+    dct = _dct_matrix(size)
+    frequencies = (dct @ pixels @ dct.T)[:hash_size, :hash_size].flatten()
+    # The DC term is overall brightness, so it is left out of the median
+    return np.packbits(frequencies > np.median(frequencies[1:]))
+
+
+def hamming_distances(hash:np.ndarray, hashes:np.ndarray) -> np.ndarray:
+    """
+    Bits differing between a packed hash and each row of `hashes`
+    """
+    return _POPCOUNT[np.bitwise_xor(hashes, hash)].sum(axis=1, dtype=np.int32)
+
+
+def select_distinct(hashes:Sequence[np.ndarray], max_distance:int) -> List[Optional[Tuple[int, int]]]:
+    """
+    Greedily thins images, in order, to those differing from every image kept before
+    them by more than `max_distance` bits. Returns, for each image, None if it is kept,
+    or the index of the closest kept image and its distance.
+    """
+    hashes = np.stack(hashes)
+    kept_hashes = np.empty_like(hashes)
+    kept_indices:List[int] = []
+    selection:List[Optional[Tuple[int, int]]] = []
+    for i, hash in enumerate(hashes):
+        if kept_indices:
+            distances = hamming_distances(hash, kept_hashes[:len(kept_indices)])
+            closest = int(np.argmin(distances))
+            if distances[closest] <= max_distance:
+                selection.append((kept_indices[closest], int(distances[closest])))
+                continue
+        kept_hashes[len(kept_indices)] = hash
+        kept_indices.append(i)
+        selection.append(None)
+    return selection
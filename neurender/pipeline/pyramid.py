@@ -0,0 +1,159 @@
+"""
+Downscaled copies of the undistorted images Gaussian splatting trains on, built once
+on all cores rather than by train.py as it loads each image. Resized images are kept
+in a project level cache keyed by the digest of the source image and the size, so
+later runs at any resolution already built restore them as links. The least recently
+used images are evicted to keep the cache within its size budget.
+"""
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from ..utils.files import iter_files, list_images
+from ..utils.staging import stage_file
+
+# train.py treats these --resolution values as downscaling factors, larger ones as widths
+RESOLUTION_FACTORS = (1, 2, 4, 8)
+# With --resolution -1, train.py scales images wider than this down to this width
+AUTO_MAX_WIDTH = 1600
+
+# Resized JPEGs are saved at high quality, since they are compressed a second time
+_JPEG_QUALITY = 95
+
+_READ_BLOCK_SIZE = 1024 * 1024
+
+
+def resolution_dir(resolution:int) -> str:
+    """
+    Name of the image directory for a train.py --resolution value, 'images' for full
+    size, images_2, images_4 and images_8 as convert.py --resize names them, and
+    images_{width}px or images_auto otherwise
+    """
+    if resolution == 1:
+        return 'images'
+    if resolution in RESOLUTION_FACTORS:
+        return f"images_{resolution}"
+    if resolution == -1:
+        return 'images_auto'
+    return f"images_{resolution}px"
+
+
+def scaled_size(size:Tuple[int, int], resolution:int) -> Tuple[int, int]:
+    """
+    The size train.py loads an image of `size` at with --resolution `resolution`
+    """
+    width, height = size
+    if resolution in RESOLUTION_FACTORS:
+        return (round(width / resolution), round(height / resolution))
+    if resolution == -1:
+        scale = width / AUTO_MAX_WIDTH if width > AUTO_MAX_WIDTH else 1
+    else:
+        scale = width / resolution
+    return (int(width / scale), int(height / scale))
+
+
+def _file_digest(path:Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(_READ_BLOCK_SIZE):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def resize_image(src_path:Path, dst_paths:Dict[int, Path], cache_path:Path) -> int:
+    """
+    Places `src_path` resized for each --resolution at its path in `dst_paths`,
+    decoding the image at most once for all of them. Returns the number of sizes
+    resized rather than restored from the cache.
+    """
+    # Imported here rather than at startup, since scheduling uses resolution_dir
+    from PIL import Image
+
+    with Image.open(src_path) as image:
+        sizes = { resolution: scaled_size(image.size, resolution) for resolution in dst_paths }
+        digest = _file_digest(src_path)
+        cached_paths = { resolution: cache_path / digest[:2] / f"{digest}-{width}x{height}{src_path.suffix}"
+                         for resolution, (width, height) in sizes.items() }
+        missing = [resolution for resolution, path in cached_paths.items() if not path.is_file()]
+        for resolution, path in cached_paths.items():
+            if resolution not in missing:
+                # Marks the cached image as used, for evict_image_cache()
+                os.utime(path)
+
+        if missing:
+            # JPEGs decode at a reduced scale, still no smaller than the largest missing size
+            image.draft(image.mode, max((sizes[r] for r in missing), key=lambda s: s[0]))
+            image.load()
+        for resolution in missing:
+            cached_path = cached_paths[resolution]
+            cached_path.parent.mkdir(parents=True, exist_ok=True)
+            # Written under a temporary name, so concurrent runs never see a partial file
+            tmp_path = cached_path.with_name(f"{cached_path.stem}.{uuid.uuid4().hex[:8]}.tmp{cached_path.suffix}")
+            # Bicubic, as train.py resizes with PIL's default filter
+            resized = image.resize(sizes[resolution], Image.BICUBIC)
+            resized.save(tmp_path, format=image.format, quality=_JPEG_QUALITY)
+            os.replace(tmp_path, cached_path)
+
+    for resolution, dst_path in dst_paths.items():
+        stage_file(cached_paths[resolution], dst_path)
+    return len(missing)
+
+
+def evict_image_cache(cache_path:Path, max_size:int) -> int:
+    """
+    Removes the least recently used images from the image cache at `cache_path` until
+    its files take at most `max_size` bytes. Staged links to evicted images are left in
+    place. Returns the number of images removed.
+    """
+    images = []
+    for _, entry in iter_files(cache_path):
+        # Images being written by another run are not yet in use
+        if '.tmp.' in entry.name:
+            continue
+        stat = entry.stat(follow_symlinks=False)
+        images.append((stat.st_mtime, stat.st_size, entry.path))
+
+    size = sum(image_size for _, image_size, _ in images)
+    removed = 0
+    for _, image_size, path in sorted(images):
+        if size <= max_size:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        size -= image_size
+        removed += 1
+    return removed
+
+
+def build_resolutions(ctx, source_path:Path, resolutions:Iterable[int], cache_path:Path) -> List[str]:
+    """
+    Builds the image directories train.py needs for `resolutions` next to the full
+    size images in `source_path`, resizing on ctx.worker_processes processes.
+    Returns the names of the directories built.
+    """
+    dirs = { resolution: resolution_dir(resolution) for resolution in sorted(set(resolutions)) if resolution != 1 }
+    if not dirs:
+        return []
+
+    image_paths = list_images(source_path / 'images')
+    dst_paths = [{ resolution: source_path / name / image_path.name for resolution, name in dirs.items() }
+                 for image_path in image_paths]
+    for name in dirs.values():
+        (source_path / name).mkdir(parents=True, exist_ok=True)
+
+    print(f"Resizing {len(image_paths)} images for {', '.join(dirs.values())} with {ctx.worker_processes} processes")
+    chunksize = max(1, min(16, len(image_paths) // (ctx.worker_processes * 4)))
+    resized = ctx.map_processes(resize_image, image_paths, dst_paths, [cache_path] * len(image_paths), chunksize=chunksize)
+
+    total = len(image_paths) * len(dirs)
+    print(f" ==> Resized {sum(resized)} images, {total - sum(resized)} restored from the image cache")
+
+    if ctx.image_cache_max_size:
+        evicted = evict_image_cache(cache_path, ctx.image_cache_max_size)
+        if evicted:
+            print(f" ==> Evicted {evicted} least recently used images from the image cache")
+    return list(dirs.values())
@@ -0,0 +1,108 @@
+import sys
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Set
+
+
+def paths_overlap(a:str, b:str) -> bool:
+    """
+    Working path prefixes overlap if either contains the other. Directories end with '/',
+    other prefixes select files by name within their directory.
+    """
+    return a.startswith(b) or b.startswith(a)
+
+def _any_overlap(paths_a:Sequence[str], paths_b:Sequence[str]) -> bool:
+    return any(paths_overlap(a, b) for a in paths_a for b in paths_b)
+
+
+def step_dependencies(steps:Sequence) -> List[Set[int]]:
+    """
+    For each step, the indices of earlier steps it must wait for. A step depends on an
+    earlier one if it reads what the earlier one writes, writes what it reads, or writes
+    to the same place. Steps which do not declare their inputs and outputs (None) act as
+    barriers, depending on all earlier steps and blocking all later ones.
+    """
+    dependencies = []
+    for i, step in enumerate(steps):
+        deps = set()
+        for j in range(i):
+            earlier = steps[j]
+            if step.inputs is None or step.outputs is None or earlier.inputs is None or earlier.outputs is None:
+                deps.add(j)
+            elif (_any_overlap(step.inputs, earlier.outputs)
+                  or _any_overlap(step.outputs, earlier.inputs)
+                  or _any_overlap(step.outputs, earlier.outputs)):
+                deps.add(j)
+        dependencies.append(deps)
+    return dependencies
+
+
+class StepScheduler:
+    """
+    Runs pipeline steps concurrently as their dependencies complete, limiting the number
+    of running steps of each resource class (see PipelineStep.resource_class). Steps are
+    started in pipeline order whenever more than one is ready, so a linear pipeline runs
+    exactly as it would sequentially.
+
+    After a step fails, no further steps of its group are started, while running steps
+    finish. By default all steps are one group. Batch runs schedule the steps of several
+    pipelines together, passing their dependencies and grouping them by pipeline.
+    """
+    def __init__(self, steps:Sequence, concurrency:Dict[str, int],
+                 dependencies:Optional[List[Set[int]]]=None, groups:Optional[Sequence[Hashable]]=None):
+        self.steps = list(steps)
+        self.concurrency = concurrency
+        self.dependencies = dependencies if dependencies is not None else step_dependencies(self.steps)
+        self.groups = list(groups) if groups is not None else [None] * len(self.steps)
+
+    def _limit(self, resource_class:str) -> int:
+        return max(1, self.concurrency.get(resource_class, 1))
+
+    def run(self, run_step:Callable) -> bool:
+        """
+        Calls `run_step(step)` for every step. Returns False if any step raised.
+        """
+        pending = list(range(len(self.steps)))
+        done:Set[int] = set()
+        running:Dict[Future, int] = {}
+        running_by_class:Dict[str, int] = {}
+        failed_groups:Set[Hashable] = set()
+        not_run = 0
+
+        max_workers = max(1, sum(self._limit(c) for c in {s.resource_class for s in self.steps}))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='step') as executor:
+            while running or pending:
+                for i in list(pending):
+                    if self.groups[i] in failed_groups:
+                        pending.remove(i)
+                        not_run += 1
+                        continue
+                    step = self.steps[i]
+                    resource_class = step.resource_class
+                    if not self.dependencies[i] <= done:
+                        continue
+                    if running_by_class.get(resource_class, 0) >= self._limit(resource_class):
+                        continue
+                    pending.remove(i)
+                    running_by_class[resource_class] = running_by_class.get(resource_class, 0) + 1
+                    running[executor.submit(run_step, step)] = i
+
+                if not running:
+                    break
+
+                completed, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    i = running.pop(future)
+                    step = self.steps[i]
+                    running_by_class[step.resource_class] -= 1
+                    try:
+                        future.result()
+                        done.add(i)
+                    except Exception as e:
+                        print(f"Pipeline error in step {step.name}:", file=sys.stderr)
+                        traceback.print_exception(e)
+                        failed_groups.add(self.groups[i])
+
+        if not_run:
+            print(f"Exiting... ({not_run} steps not run)")
+        return not failed_groups
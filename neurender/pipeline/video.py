@@ -0,0 +1,120 @@
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from pydantic import BaseModel
+
+# Videos shorter than this are not split into segments, since each segment seeks from a keyframe
+MIN_SEGMENT_FRAMES = 600
+
+
+class VideoSegment(BaseModel):
+    """
+    A range of frame selection blocks of a video, of `interval` frames each. Frames
+    selected from the segment are numbered by block, so segments of a video can be
+    processed independently and still produce the same file names as a single pass.
+    """
+    video_path:Path
+    # Frame file names are {output_prefix}{block:06}.{format}
+    output_prefix:str
+    interval:int
+    first_block:int
+    # None to continue until the end of the video
+    block_count:Optional[int] = None
+
+
+def get_frame_count(video_path:Path | str) -> int:
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+
+
+def split_video(video_path:Path, output_prefix:str, interval:int, max_segments:int) -> List[VideoSegment]:
+    """
+    Splits a video into up to `max_segments` segments of whole blocks. The frame count
+    reported by containers can be inaccurate, so the last segment reads to the end.
+    """
+    total_blocks = -(-get_frame_count(video_path) // interval)
+    segment_count = max(1, min(max_segments, total_blocks * interval // MIN_SEGMENT_FRAMES))
+    blocks_per_segment = max(1, -(-total_blocks // segment_count))
+
+    segments = []
+    for first_block in range(0, max(total_blocks, 1), blocks_per_segment):
+        segments.append(VideoSegment(video_path=video_path, output_prefix=output_prefix, interval=interval,
+                                     first_block=first_block, block_count=blocks_per_segment))
+    segments[-1].block_count = None
+    return segments
+
+
+def frame_sharpness(frame:np.ndarray) -> float:
+    """
+    Variance of the Laplacian of the frame's luma
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+def _open_at(video_path:Path, frame_index:int) -> cv2.VideoCapture:
+    """
+    Opens a video positioned to read `frame_index` next. Seeking is not frame accurate
+    with every container and codec, so where the position after seeking is not the one
+    requested, frames are grabbed forward from the start instead.
+    """
+    cap = cv2.VideoCapture(str(video_path))
+    if not frame_index:
+        return cap
+    if cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index) and int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame_index:
+        return cap
+
+    cap.release()
+    cap = cv2.VideoCapture(str(video_path))
+    for _ in range(frame_index):
+        if not cap.grab():
+            break
+    return cap
+
+
+def export_segment(segment:VideoSegment, get_frame_size:Callable[[Tuple[int, int]], Tuple[int, int]], format='jpg') -> int:
+    """
+    Writes the sharpest frame of each block in the segment, scaled to
+    `get_frame_size((width, height))`. Returns the number of frames written.
+    """
+    cap = _open_at(segment.video_path, segment.first_block * segment.interval)
+
+    block = segment.first_block
+    exported = 0
+    try:
+        while segment.block_count is None or block < segment.first_block + segment.block_count:
+            # Frames are scored as they are read, keeping only the sharpest so far
+            frame = None
+            max_sharpness = -1.0
+            read = 0
+            while read < segment.interval:
+                ret, candidate = cap.read()
+                if not ret:
+                    break
+                read += 1
+                sharpness = frame_sharpness(candidate) if segment.interval > 1 else 0
+                if sharpness > max_sharpness:
+                    frame, max_sharpness = candidate, sharpness
+            if frame is None:
+                break
+
+            size = get_frame_size((frame.shape[1], frame.shape[0]))
+            if size != (frame.shape[1], frame.shape[0]):
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            # Replaced rather than overwritten, as it may be linked to other files (see utils.staging)
+            output_path = Path(f'{segment.output_prefix}{block:06}.{format}')
+            output_path.unlink(missing_ok=True)
+            cv2.imwrite(str(output_path), frame)
+
+            exported += 1
+            block += 1
+            if read < segment.interval:
+                break
+    finally:
+        cap.release()
+    return exported
@@ -0,0 +1,309 @@
+import sys, os
+import resource
+import time
+import pydantic
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+
+from .pipeline import IMAGE_CACHE_PATH, PipelineStep, RunContext, STEP_CACHE_PATH
+from .pipeline.cache import StepCache
+from .pipeline.profile import RunProfile, StepProfile, STEP_LOGS_PATH
+from .pipeline.scheduler import StepScheduler
+from .utils import path_str, unique_subpath
+from .utils.pydantic import pydantic_subclassof, read_yaml_file
+from .utils.subprocess import record_commands
+from . import config, storage
+from .storage.fetch import ProjectFetcher
+from .storage.streaming import ArtifactStreamer
+
+if TYPE_CHECKING:
+    from .project_cache import CachePin
+
+PIPELINE_FILE_SUFFIX = '.nrp'
+
+PIPELINES_PATH = "pipelines"
+SELECT_PIPELINE_FILES = f"{PIPELINES_PATH}/**/*"
+OUTPUT_PATH = "output"
+
+DEFAULT_PIPELINE = "default"
+
+# Project folders which are never synced: the step and image caches hold local paths,
+# and duplicate outputs
+LOCAL_CACHE_PATHS = [STEP_CACHE_PATH, IMAGE_CACHE_PATH]
+
+
+class PipelineError(Exception):
+    pass
+
+
+
+class NeurenderPipeline(pydantic.BaseModel):
+    @staticmethod
+    def load(path:Path):
+        _resolve_step_types()
+        pipeline = read_yaml_file(NeurenderPipeline, path)
+        pipeline.path = path
+        return pipeline
+    
+    # Union of all PipelineStep subclasses, resolved when the first pipeline is loaded
+    pipeline:List["PipelineStepType"]
+
+    # List of paths within the upload folder to upload. Supports glob syntax
+    upload_artifacts:List[str]
+    
+    name:str
+    path:Optional[Path] = None
+    project_path:Optional[Path] = None
+    # Artifacts uploaded while the pipeline ran
+    stream_summary:Optional[storage.TransferSummary] = None
+
+    @property
+    def default_output_subpath(self):
+        path = Path(OUTPUT_PATH)
+        if self.path:
+            return path / self.path.stem    # Pipeline name without extension
+        return path / "default"
+
+    def get_artifacts_url(self, project_url:str) -> str:
+        # Note: Using os.path.join() because (Path(project_url) / subpath) will mangle the URL
+        return os.path.join(project_url, self.default_output_subpath)
+
+    def run(self, working_path='', no_skip_steps=[], upload_url='', fetcher:Optional[ProjectFetcher]=None):
+        """
+        Runs the pipeline steps. If `upload_url` is set, artifacts are uploaded there as
+        they are completed, ahead of upload_output_artifacts(). If `fetcher` is set, it
+        is downloading the project files of each step, which waits for its own.
+        Raises PipelineError if a step failed.
+        """
+        pipeline_run = PipelineRun(self, working_path, no_skip_steps, upload_url, fetcher)
+        pipeline_run.start()
+        try:
+            ok = StepScheduler(self.pipeline, pipeline_run.pipeline_config.concurrency()).run(pipeline_run.run_step)
+        finally:
+            pipeline_run.finish()
+
+        if not ok:
+            raise PipelineError(f"Pipeline '{self.name}' failed, see the step logs in {path_str(pipeline_run.logs_path)}")
+        print("Done.")
+        return pipeline_run.working_path
+
+    def upload_output_artifacts(self, working_path:Path, project_url:str) -> storage.TransferSummary:
+        if not self.upload_artifacts:
+            print("No artifacts to upload")
+            return storage.TransferSummary()
+
+        dst_url = self.get_artifacts_url(project_url)
+
+        print(f"Checking upload paths for artifacts in {working_path}: {', '.join(self.upload_artifacts)}")
+        return storage.S3().sync_to_remote(working_path, dst_url, select=self.upload_artifacts)
+
+
+class PipelineRun:
+    """
+    A run of a pipeline: its context, step cache, profile and streamed artifacts.
+    NeurenderPipeline.run() schedules its steps, while batch runs schedule the steps
+    of several runs together (see neurender.batch).
+    """
+    def __init__(self, pipeline:NeurenderPipeline, working_path='', no_skip_steps=[], upload_url='',
+                 fetcher:Optional[ProjectFetcher]=None, pipeline_config:Optional[config.PipelineConfig]=None):
+        self.pipeline = pipeline
+        self.working_path = Path(working_path) if working_path else pipeline.project_path / pipeline.default_output_subpath
+        self.upload_url = upload_url
+        self.fetcher = fetcher
+        self.pipeline_config = pipeline_config or config.load().pipeline or config.PipelineConfig()
+
+        self.context = RunContext(pipeline.project_path, self.working_path,
+                                  no_skip_steps=no_skip_steps,
+                                  worker_processes=self.pipeline_config.worker_processes,
+                                  image_cache_max_size=int(self.pipeline_config.image_cache_max_size_gb * 1024**3))
+        self.cache = StepCache(pipeline.project_path / STEP_CACHE_PATH)
+        self.profile = RunProfile(pipeline=pipeline.name)
+        self.logs_path = self.working_path / STEP_LOGS_PATH
+        self._step_indices = { id(step): i for i, step in enumerate(pipeline.pipeline) }
+        self._streamer:Optional[ArtifactStreamer] = None
+
+    def start(self):
+        print(f"Running Neurender pipeline '{self.pipeline.name}' ({path_str(self.pipeline.path)})")
+        self.working_path.mkdir(parents=True, exist_ok=True)
+        self.logs_path.mkdir(exist_ok=True)
+        print("  => Processing outputs in:", path_str(self.working_path))
+
+        pipeline_config = self.pipeline_config
+        if self.upload_url and self.pipeline.upload_artifacts and pipeline_config.artifact_stream_interval_s > 0:
+            self._streamer = ArtifactStreamer(self.working_path, self.pipeline.get_artifacts_url(self.upload_url),
+                                              self.pipeline.upload_artifacts,
+                                              interval_s=pipeline_config.artifact_stream_interval_s,
+                                              stable_s=pipeline_config.artifact_stable_s)
+            self._streamer.start()
+
+    def run_step(self, step:PipelineStep):
+        index = self._step_indices[id(step)]
+        step_profile = StepProfile(step=step.name, log_path=str(self.logs_path / f"{index:02}-{step.name}.log"))
+
+        start_time = time.monotonic()
+        try:
+            if self.fetcher:
+                self.fetcher.wait(index)
+            step_profile.fetch_wait_s = time.monotonic() - start_time
+
+            print("  =>", step)
+            start_time = time.monotonic()
+            start_usage = resource.getrusage(resource.RUSAGE_THREAD)
+            with record_commands(Path(step_profile.log_path)) as commands:
+                try:
+                    if self.cache.run(step, self.context):
+                        step_profile.status = 'cached'
+                finally:
+                    usage = resource.getrusage(resource.RUSAGE_THREAD)
+                    step_profile.user_cpu_s = usage.ru_utime - start_usage.ru_utime
+                    step_profile.system_cpu_s = usage.ru_stime - start_usage.ru_stime
+                    step_profile.add_commands(commands)
+        except Exception as e:
+            step_profile.status = 'failed'
+            step_profile.error = str(e)
+            raise
+        finally:
+            step_profile.wall_s = time.monotonic() - start_time
+            self.profile.add(step_profile)
+
+    def finish(self):
+        if self._streamer:
+            self._streamer.stop()
+            self.pipeline.stream_summary = self._streamer.summary
+
+        self.profile.finish()
+        self.profile.print()
+        print("Run profile written to", self.profile.save(self.working_path))
+
+
+def _resolve_step_types():
+    """
+    Builds the union of step types on first use rather than at import, so it includes
+    steps defined after this module, and commands which never load a pipeline skip it
+    """
+    if not NeurenderPipeline.__pydantic_complete__:
+        NeurenderPipeline.model_rebuild(_types_namespace={ 'PipelineStepType': pydantic_subclassof(PipelineStep, "step") })
+
+
+class NeurenderProject:
+    @staticmethod
+    def load(src_url:str, local_path:str='', select='', lazy=False, use_cache=False) -> "NeurenderProject":
+        """
+        Loads a local project, or downloads a remote one. With `lazy`, only the pipelines
+        are downloaded, and the files a pipeline needs are fetched when it runs (see
+        fetch_for_pipeline()). With `use_cache`, a remote project without a local path is
+        kept in the project cache, if one is configured, and pinned there until release().
+        """
+        if src_url.startswith('s3://'):
+            cache = None
+            if use_cache and not local_path:
+                from .project_cache import ProjectCache
+                cache = ProjectCache.load()
+
+            cache_pin = None
+            if cache:
+                project_path = cache.project_path(src_url)
+                print(f"{'Reusing' if project_path.exists() else 'Using'} cached project folder {project_path}")
+                cache_pin = cache.pin(src_url)
+                # Makes room before downloading, without evicting the pinned project
+                cache.evict()
+            else:
+                # If local_path is not specified, save the project to a local folder based on the last
+                # element of the projects path url (same as git's behavior)
+                project_path = local_path if local_path else Path(src_url).name
+                project_path = Path(project_path).absolute()
+
+
+            if lazy:
+                select = SELECT_PIPELINE_FILES
+
+            print(f"Downloading project {src_url} => {project_path} (select: {select or storage.SELECT_ALL_FILES})")
+            try:
+                summary = storage.S3().sync_to_local(src_url, project_path, select=select, exclude=LOCAL_CACHE_PATHS)
+            except:
+                if cache_pin:
+                    cache_pin.release()
+                raise
+
+            project = NeurenderProject(project_path, src_url)
+            project.lazy = lazy
+            project.download_summary = summary
+            project.cache_pin = cache_pin
+            return project
+        else:
+            return NeurenderProject(src_url)
+        
+
+        
+    def __init__(self, path:str, url:str=None):
+        self.url = None
+        # Set when the project was downloaded from a remote url
+        self.download_summary:Optional[storage.TransferSummary] = None
+        # Whether only the pipelines were downloaded
+        self.lazy = False
+        # Set when the project is kept in the project cache
+        self.cache_pin:Optional["CachePin"] = None
+
+        if url:
+            self.url = url
+        else:
+            remote_meta = storage.load_remote_meta(path)
+            if remote_meta:
+                self.url = remote_meta.url
+
+        self.path = Path(path).expanduser()
+        self.pipelines_path = self.path / PIPELINES_PATH
+
+    def release(self):
+        """
+        Unpins the project in the project cache once runs are done with it, so it may be evicted
+        """
+        if self.cache_pin:
+            self.cache_pin.release()
+            self.cache_pin = None
+
+    def fetch_for_pipeline(self, pipeline:NeurenderPipeline) -> Optional[ProjectFetcher]:
+        """
+        For lazily loaded projects, starts downloading the project files the pipeline's
+        steps read, in step order. Pass the fetcher to NeurenderPipeline.run().
+        """
+        if not self.lazy:
+            return None
+        fetcher = ProjectFetcher(self.url, self.path, [step.sources for step in pipeline.pipeline], exclude=LOCAL_CACHE_PATHS)
+        fetcher.start()
+        return fetcher
+
+    def download_for_pipeline(self, pipeline:NeurenderPipeline) -> storage.TransferSummary:
+        """
+        For lazily loaded projects, downloads all the project files the pipeline's steps
+        read at once, rather than step by step like fetch_for_pipeline()
+        """
+        if not self.lazy:
+            return storage.TransferSummary()
+        sources = [step.sources for step in pipeline.pipeline]
+        select = '' if None in sources else sorted({ pattern for patterns in sources for pattern in patterns })
+        if select == []:
+            return storage.TransferSummary()
+        return storage.S3().sync_to_local(self.url, self.path, select=select, exclude=LOCAL_CACHE_PATHS)
+
+    def get_pipeline_paths(self):
+        return [p for p in self.pipelines_path.iterdir() if p.suffix.lower() == PIPELINE_FILE_SUFFIX]
+
+
+    def get_pipeline(self, name:str) -> NeurenderPipeline:
+        for path in self.get_pipeline_paths():
+            # If name is not specified, return the first available pipeline
+            filename = path.stem
+            if filename == name or filename == DEFAULT_PIPELINE:
+                return self._get_pipeline_by_path(path)
+
+        return None
+
+
+    def _get_pipeline_by_path(self, path:Path) -> NeurenderPipeline:
+        pipeline = NeurenderPipeline.load(path)
+        pipeline.path = path
+        pipeline.project_path = self.path
+        return pipeline
+        
+
@@ -0,0 +1,279 @@
+"""
+Managed local cache of remote projects (see config.CacheConfig). Remote projects run
+without a local path are kept in a folder per project url under the cache root, so a
+repeat run only syncs what changed rather than downloading the project again. The
+cache is kept under its size budget by evicting, least recently used first: the
+intermediates runs recreate, then the step cache entries holding copies of them, then
+whole project folders.
+
+Usage counts the blocks of each file once, however many hardlinks it has. Reflinked
+copies share blocks without saying so and are counted at full size, so on reflink
+filesystems the cache is kept within its budget conservatively.
+
+A run pins its project with a shared lock on the project's lock file, which eviction
+must take exclusively, so projects in use are never evicted, and the pins of crashed
+runs go away with their process.
+"""
+import hashlib
+import os
+import shutil
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+from pydantic import BaseModel
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where projects cannot be pinned, so none are evicted
+    fcntl = None
+
+from . import config, storage
+from .pipeline import (IMAGE_CACHE_PATH, PRUNED_MEDIA_PATH, REGISTERED_MEDIA_GS_PATH, STAGED_MEDIA_PATH,
+                       STEP_CACHE_PATH)
+from .pipeline.cache import ENTRY_FILE_NAME, StepCacheEntry
+from .project import OUTPUT_PATH
+from .utils import print_err
+from .utils.files import disk_usage, iter_files
+
+GB = 1024 * 1024 * 1024
+
+PROJECTS_PATH = 'projects'
+LOCKS_PATH = 'locks'
+
+# Prefixes of the working path contents which runs recreate, from the step cache or by
+# running steps again: staged media, and the undistortion inputs and resized images.
+# Uploaded artifacts, such as training checkpoints, are not intermediates, as the next
+# sync of the project would download them again.
+_INTERMEDIATE_PREFIXES = (
+    f"{STAGED_MEDIA_PATH}/",
+    f"{PRUNED_MEDIA_PATH}/",
+    f"{REGISTERED_MEDIA_GS_PATH}/distorted/",
+    f"{REGISTERED_MEDIA_GS_PATH}/input/",
+    f"{REGISTERED_MEDIA_GS_PATH}/images_",
+)
+
+
+class CachedProject(BaseModel):
+    name:str
+    path:Path
+    url:str = ''
+    # Bytes on disk
+    size:int = 0
+    # Time a run last pinned or released the project
+    last_used:float = 0
+    pinned:bool = False
+
+
+def _intermediate_paths(project_path:Path) -> List[Path]:
+    paths = [project_path / IMAGE_CACHE_PATH]
+    for working_path in (project_path / OUTPUT_PATH).glob('*'):
+        for prefix in _INTERMEDIATE_PREFIXES:
+            paths += working_path.glob(prefix[:-1] if prefix.endswith('/') else f"{prefix}*")
+    return [p for p in paths if p.exists()]
+
+
+def _intermediate_step_entries(project_path:Path) -> List[Tuple[float, Path]]:
+    # (last used, path) of the step cache entries holding intermediates
+    entries = []
+    for entry_file in (project_path / STEP_CACHE_PATH).glob(f"*/{ENTRY_FILE_NAME}"):
+        try:
+            entry = StepCacheEntry.model_validate_json(entry_file.read_bytes())
+            last_used = entry_file.stat().st_mtime
+        except (OSError, ValueError):
+            continue
+        if any(f.startswith(_INTERMEDIATE_PREFIXES) for f in entry.files):
+            entries.append((last_used, entry_file.parent))
+    return entries
+
+
+def _unlinked_size(path:Path) -> int:
+    # Bytes freed by removing `path`: those of files with no other hardlinks
+    size = 0
+    for _, entry in iter_files(path):
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_nlink == 1:
+            size += stat.st_blocks * 512 if hasattr(stat, 'st_blocks') else stat.st_size
+    return size
+
+
+def _remove(path:Path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+class CachePin:
+    """
+    Shared lock on a cached project held while a run uses it, see ProjectCache.pin()
+    """
+    def __init__(self, lock_path:Path):
+        self._lock_path = lock_path
+        self._file = open(lock_path, 'a')
+        if fcntl:
+            # Waits for an eviction of the project in progress
+            fcntl.flock(self._file, fcntl.LOCK_SH)
+        os.utime(lock_path)
+
+    def release(self):
+        if self._file.closed:
+            return
+        os.utime(self._lock_path)
+        # Closing releases the lock
+        self._file.close()
+
+
+class ProjectCache:
+    def __init__(self, cache_config:config.CacheConfig):
+        self.root = Path(cache_config.root).expanduser().absolute()
+        self.max_size = int(cache_config.max_size_gb * GB)
+
+    @staticmethod
+    def load() -> Optional["ProjectCache"]:
+        """
+        The project cache, if a cache root is configured
+        """
+        cache_config = config.load().cache
+        if not cache_config or not cache_config.root:
+            return None
+        return ProjectCache(cache_config)
+
+    def project_name(self, url:str) -> str:
+        # Named after the url's last element, like a project downloaded without a local path
+        url = url.rstrip('/')
+        return f"{url.rsplit('/', 1)[-1]}-{hashlib.sha256(url.encode()).hexdigest()[:12]}"
+
+    def project_path(self, url:str) -> Path:
+        return self.root / PROJECTS_PATH / self.project_name(url)
+
+    def _lock_path(self, name:str) -> Path:
+        return self.root / LOCKS_PATH / f"{name}.lock"
+
+    def pin(self, url:str) -> CachePin:
+        """
+        Pins the project at `url`, so it is not evicted until the pin is released
+        """
+        lock_path = self._lock_path(self.project_name(url))
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        return CachePin(lock_path)
+
+    @contextmanager
+    def _evicting(self, project:CachedProject) -> Iterator[bool]:
+        # Yields whether the project was locked exclusively, which fails while it is pinned
+        lock_path = self._lock_path(project.name)
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        created = not lock_path.exists()
+        with open(lock_path, 'a') as lock_file:
+            if created:
+                os.utime(lock_path, (project.last_used, project.last_used))
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            # Lock files are kept, since a run may be waiting to pin this one
+            yield True
+
+    def list(self) -> List[CachedProject]:
+        """
+        Cached projects, least recently used first
+        """
+        try:
+            paths = [p for p in (self.root / PROJECTS_PATH).iterdir() if p.is_dir()]
+        except FileNotFoundError:
+            return []
+
+        projects = []
+        for path in paths:
+            lock_path = self._lock_path(path.name)
+            project = CachedProject(name=path.name, path=path, size=disk_usage(path),
+                                    last_used=(lock_path if lock_path.exists() else path).stat().st_mtime)
+            if (path / storage.DIRECTORY_METAFILE_NAME).is_file():
+                remote_meta = storage.load_remote_meta(path)
+                project.url = remote_meta.url if remote_meta else ''
+            if fcntl:
+                with self._evicting(project) as locked:
+                    project.pinned = not locked
+            projects.append(project)
+        return sorted(projects, key=lambda p: p.last_used)
+
+    def evict(self) -> int:
+        """
+        Evicts from the projects which are not pinned, until the cache is within its size
+        budget: the intermediates of the least recently used projects, then the least
+        recently used step cache entries holding intermediates (which share their files,
+        so removing only one of the two frees nothing), then whole project folders.
+        Returns the number of bytes freed.
+        """
+        if not self.max_size:
+            return 0
+        projects = self.list()
+        usage = sum(p.size for p in projects)
+        if usage <= self.max_size:
+            return 0
+        if not fcntl:
+            print_err("  ** Project cache eviction requires file locks, which are not available on this platform")
+            return 0
+
+        print(f"Project cache uses {usage / GB:.2f} GB of {self.max_size / GB:.2f} GB, evicting least recently used projects")
+        freed = 0
+        for project in projects:
+            if usage - freed <= self.max_size:
+                break
+            with self._evicting(project) as locked:
+                if not locked:
+                    continue
+                for path in _intermediate_paths(project.path):
+                    _remove(path)
+                size = disk_usage(project.path)
+            if size < project.size:
+                print(f" ==> Evicted intermediates of {project.url or project.name} ({(project.size - size) / GB:.2f} GB)")
+            freed += project.size - size
+            project.size = size
+
+        entries = sorted((last_used, i, path) for i, project in enumerate(projects)
+                         for last_used, path in _intermediate_step_entries(project.path))
+        evicted_entries = 0
+        for _, i, entry_path in entries:
+            if usage - freed <= self.max_size:
+                break
+            project = projects[i]
+            with self._evicting(project) as locked:
+                if not locked:
+                    continue
+                size = _unlinked_size(entry_path)
+                shutil.rmtree(entry_path, ignore_errors=True)
+            evicted_entries += 1
+            freed += size
+            project.size -= size
+        if evicted_entries:
+            print(f" ==> Evicted {evicted_entries} cached step results")
+
+        for project in projects:
+            if usage - freed <= self.max_size:
+                break
+            if not project.size:
+                continue
+            with self._evicting(project) as locked:
+                if not locked:
+                    continue
+                shutil.rmtree(project.path, ignore_errors=True)
+            print(f" ==> Evicted project {project.url or project.name} ({project.size / GB:.2f} GB)")
+            freed += project.size
+            project.size = 0
+
+        if usage - freed > self.max_size:
+            print_err(f"  ** Project cache still uses {(usage - freed) / GB:.2f} GB, the rest is in use by runs")
+        return freed
+
+    def print(self):
+        projects = self.list()
+        usage = sum(p.size for p in projects)
+        budget = f"{self.max_size / GB:.2f} GB" if self.max_size else "no limit"
+        print(f"Project cache {self.root}: {len(projects)} projects, {usage / GB:.2f} GB ({budget})")
+        for project in reversed(projects):
+            last_used = datetime.fromtimestamp(project.last_used).strftime('%Y-%m-%d %H:%M')
+            print(f"  {project.url or project.name:<50} {project.size / GB:>8.2f} GB  {last_used}"
+                  + ("  in use" if project.pinned else ''))
@@ -0,0 +1,188 @@
+"""
+Local HTTP API running `neurender` commands as jobs on warm worker processes
+(`neurender serve`). Requests and responses are JSON:
+
+    POST /jobs                  {"args": ["run", "s3://bucket/project"], "cwd": "..."}  => job
+    GET  /jobs                  => [job, ...]
+    GET  /jobs/<id>             => job
+    GET  /jobs/<id>/log         ?offset=<bytes>&follow=1 streams the log until the job finishes
+    POST /jobs/<id>/cancel      => job
+"""
+import io
+import json
+import os
+import time
+from contextlib import redirect_stderr
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Lock
+from typing import List
+from urllib.parse import parse_qs, urlparse
+
+from ..paths import JOBS_PATH
+from .jobs import JOB_COMMANDS, Job, JobStore
+from .worker import WorkerPool
+
+# Seconds between reads of a followed log
+_LOG_POLL_INTERVAL_S = 0.5
+_LOG_READ_SIZE = 64 * 1024
+
+# argparse reports errors on sys.stderr, which is shared by request threads
+_parse_lock = Lock()
+
+
+class JobRequestError(Exception):
+    def __init__(self, status:HTTPStatus, message:str):
+        super().__init__(message)
+        self.status = status
+
+
+def _validate_args(args) -> List[str]:
+    from ..__main__ import create_parser
+
+    if not isinstance(args, list) or not args or not all(isinstance(a, str) for a in args):
+        raise JobRequestError(HTTPStatus.BAD_REQUEST, "args must be a non-empty list of strings")
+    if args[0] not in JOB_COMMANDS:
+        raise JobRequestError(HTTPStatus.BAD_REQUEST, f"Jobs may run the commands: {', '.join(JOB_COMMANDS)}")
+
+    errors = io.StringIO()
+    with _parse_lock, redirect_stderr(errors):
+        try:
+            create_parser().parse_args(args)
+        except SystemExit:
+            raise JobRequestError(HTTPStatus.BAD_REQUEST, errors.getvalue().strip())
+    return args
+
+
+class JobServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, store:JobStore, pool:WorkerPool):
+        super().__init__(address, JobRequestHandler)
+        self.store = store
+        self.pool = pool
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    server:JobServer
+
+    def log_message(self, format, *args):
+        # Requests are not logged, job progress is
+        pass
+
+    def _send_json(self, status:HTTPStatus, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _get_job(self, job_id:str) -> Job:
+        job = self.server.store.get(job_id)
+        if not job:
+            raise JobRequestError(HTTPStatus.NOT_FOUND, f"Job {job_id} not found")
+        return job
+
+    def _handle(self, method:str):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        try:
+            if parts[:1] != ['jobs']:
+                raise JobRequestError(HTTPStatus.NOT_FOUND, f"No route for {url.path}")
+
+            if method == 'GET' and len(parts) == 1:
+                self._send_json(HTTPStatus.OK, [job.model_dump() for job in self.server.store.list()])
+            elif method == 'POST' and len(parts) == 1:
+                self._submit()
+            elif method == 'GET' and len(parts) == 2:
+                self._send_json(HTTPStatus.OK, self._get_job(parts[1]).model_dump())
+            elif method == 'GET' and len(parts) == 3 and parts[2] == 'log':
+                self._stream_log(self._get_job(parts[1]), parse_qs(url.query))
+            elif method == 'POST' and len(parts) == 3 and parts[2] == 'cancel':
+                self._cancel(self._get_job(parts[1]))
+            else:
+                raise JobRequestError(HTTPStatus.NOT_FOUND, f"No route for {method} {url.path}")
+        except JobRequestError as e:
+            self._send_json(e.status, { 'error': str(e) })
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _submit(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            raise JobRequestError(HTTPStatus.BAD_REQUEST, f"Invalid JSON: {e}")
+        if not isinstance(request, dict):
+            raise JobRequestError(HTTPStatus.BAD_REQUEST, "Expected a JSON object")
+
+        args = _validate_args(request.get('args'))
+        cwd = request.get('cwd') or os.getcwd()
+        if not isinstance(cwd, str) or not Path(cwd).is_dir():
+            raise JobRequestError(HTTPStatus.BAD_REQUEST, f"cwd {cwd} is not a directory")
+
+        job = self.server.store.submit(args, str(Path(cwd).absolute()))
+        self._send_json(HTTPStatus.CREATED, job.model_dump())
+
+    def _cancel(self, job:Job):
+        if job.status == 'queued':
+            job = self.server.store.cancel(job.id)
+        if job.status == 'running' and self.server.pool.cancel(job.id):
+            # The pool records the cancellation once the worker has stopped
+            while not job.is_finished:
+                self.server.store.wait_changed(_LOG_POLL_INTERVAL_S)
+                job = self._get_job(job.id)
+        self._send_json(HTTPStatus.OK, job.model_dump())
+
+    def _stream_log(self, job:Job, query:dict):
+        """
+        Sends the job log from `offset`. With `follow`, the response stays open, sending
+        output as it is written, until the job finishes.
+        """
+        offset = int(query.get('offset', ['0'])[0])
+        follow = query.get('follow', ['0'])[0] not in ('0', 'false', '')
+        log_path = self.server.store.log_path(job.id)
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.end_headers()
+        # No Content-Length, so the end of the log is marked by closing the connection
+        self.close_connection = True
+
+        try:
+            with open(log_path, 'ab+') as log:
+                log.seek(offset)
+                while True:
+                    finished = job.is_finished
+                    while data := log.read(_LOG_READ_SIZE):
+                        self.wfile.write(data)
+                    self.wfile.flush()
+                    if not follow or finished:
+                        return
+                    time.sleep(_LOG_POLL_INTERVAL_S)
+                    job = self._get_job(job.id)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def serve(host:str, port:int, workers:int, jobs_path:str=''):
+    store = JobStore(Path(jobs_path) if jobs_path else JOBS_PATH)
+    pool = WorkerPool(store, workers)
+    server = JobServer((host, port), store, pool)
+    pool.start()
+
+    print(f"Serving Neurender jobs on http://{host}:{server.server_port} with {pool.count} workers (jobs in {store.path})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Stopping workers...")
+        server.server_close()
+        pool.stop()
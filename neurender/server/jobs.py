@@ -0,0 +1,137 @@
+import os
+import time
+import uuid
+from pathlib import Path
+from threading import Condition
+from typing import Dict, List, Literal, Optional
+from pydantic import BaseModel
+
+from ..utils import print_err
+
+JobStatus = Literal['queued', 'running', 'succeeded', 'failed', 'cancelled']
+
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+# CLI commands jobs may run
+JOB_COMMANDS = ('run', 'batch', 'download', 'upload')
+
+
+class Job(BaseModel):
+    id:str
+    # Command line arguments, as passed to `neurender`
+    args:List[str]
+    # Working directory relative paths in `args` are resolved against
+    cwd:str
+    status:JobStatus = 'queued'
+    exit_code:Optional[int] = None
+    error:str = ''
+    created:float = 0
+    started:Optional[float] = None
+    finished:Optional[float] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+
+class JobStore:
+    """
+    Job queue persisted as a JSON file per job under `path`, alongside each job's log,
+    so queued jobs survive server restarts. Jobs which were running when the server
+    stopped are marked failed, since their progress is unknown.
+    """
+    def __init__(self, path:Path):
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._jobs:Dict[str, Job] = {}
+        self._queue:List[str] = []
+        self._changed = Condition()
+
+        for job_path in sorted(self.path.glob('*.json')):
+            try:
+                job = Job.model_validate_json(job_path.read_text())
+            except Exception as e:
+                print_err(f"Job {job_path.name} not loaded: {e}")
+                continue
+            if job.status == 'running':
+                job.status = 'failed'
+                job.error = 'Interrupted by a server restart'
+                job.finished = time.time()
+                self._save(job)
+            self._jobs[job.id] = job
+
+        self._queue = [job.id for job in sorted(self._jobs.values(), key=lambda j: j.created) if job.status == 'queued']
+        if self._queue:
+            print(f" ==> Resuming {len(self._queue)} queued jobs")
+
+    def log_path(self, job_id:str) -> Path:
+        return self.path / f"{job_id}.log"
+
+    def _save(self, job:Job):
+        job_path = self.path / f"{job.id}.json"
+        tmp_path = job_path.with_suffix('.json.tmp')
+        tmp_path.write_text(job.model_dump_json(indent=2))
+        os.replace(tmp_path, job_path)
+
+    def submit(self, args:List[str], cwd:str) -> Job:
+        # Time ordered ids, so listing the directory lists jobs in submission order
+        job = Job(id=f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}", args=args, cwd=cwd, created=time.time())
+        with self._changed:
+            self._save(job)
+            self._jobs[job.id] = job
+            self._queue.append(job.id)
+            print(f" ==> Queued job {job.id}: neurender {' '.join(args)}")
+            self._changed.notify_all()
+        return job
+
+    def get(self, job_id:str) -> Optional[Job]:
+        with self._changed:
+            job = self._jobs.get(job_id)
+            return job.model_copy() if job else None
+
+    def list(self) -> List[Job]:
+        with self._changed:
+            return [job.model_copy() for job in sorted(self._jobs.values(), key=lambda j: j.created)]
+
+    def next(self, timeout:Optional[float]=None) -> Optional[Job]:
+        """
+        Takes the oldest queued job, marking it running. Waits up to `timeout` for one.
+        """
+        with self._changed:
+            if not self._changed.wait_for(lambda: self._queue, timeout):
+                return None
+            job = self._jobs[self._queue.pop(0)]
+            job.status = 'running'
+            job.started = time.time()
+            self._save(job)
+            return job.model_copy()
+
+    def finish(self, job_id:str, status:JobStatus, exit_code:Optional[int]=None, error=''):
+        with self._changed:
+            job = self._jobs[job_id]
+            if job.is_finished:
+                return
+            job.status = status
+            job.exit_code = exit_code
+            job.error = error
+            job.finished = time.time()
+            self._save(job)
+            self._changed.notify_all()
+
+    def cancel(self, job_id:str) -> Optional[Job]:
+        """
+        Cancels a queued job. Running jobs are cancelled by their worker (see WorkerPool.cancel).
+        """
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job and job.status == 'queued':
+                self._queue.remove(job_id)
+                job.status = 'cancelled'
+                job.finished = time.time()
+                self._save(job)
+                self._changed.notify_all()
+            return job.model_copy() if job else None
+
+    def wait_changed(self, timeout:float):
+        with self._changed:
+            self._changed.wait(timeout)
@@ -0,0 +1,176 @@
+import multiprocessing
+import os
+import signal
+import sys
+import traceback
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Set
+
+from ..utils import print_err
+from .jobs import JobStore
+
+# Seconds between checks for a stopped pool while waiting for jobs
+_POLL_INTERVAL_S = 1
+
+
+def _run_job(args:List[str], cwd:str, log_path:str) -> int:
+    """
+    Runs a CLI command in this process with its output, and that of the commands it
+    runs, redirected to the job log. Returns its exit code.
+    """
+    from ..__main__ import main
+
+    log_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = (os.dup(1), os.dup(2))
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+    os.close(log_fd)
+    previous_cwd = os.getcwd()
+    try:
+        os.chdir(cwd)
+        main(args)
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.chdir(previous_cwd)
+        for fd, saved_fd in zip((1, 2), saved_fds):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+
+
+def _worker_main(conn):
+    """
+    Worker process loop. Imports and S3 clients are set up once and reused by every
+    job the worker runs.
+    """
+    # Own process group, so cancelling a job also stops the commands it started
+    os.setpgrp()
+    sys.stdout.reconfigure(line_buffering=True)
+    sys.stderr.reconfigure(line_buffering=True)
+
+    # Imported ahead of the first job
+    import boto3
+    from .. import project, storage
+    storage.share_clients()
+
+    while True:
+        try:
+            args, cwd, log_path = conn.recv()
+        except EOFError:
+            return
+        conn.send(_run_job(args, cwd, log_path))
+
+
+class WorkerPool:
+    """
+    Runs queued jobs on `count` warm worker processes, one job each at a time. A worker
+    which exits, because it crashed or its job was cancelled, is replaced.
+    """
+    def __init__(self, store:JobStore, count:int):
+        self.store = store
+        self.count = max(1, count)
+        self._threads:List[Thread] = []
+        self._stopping = Event()
+        self._lock = Lock()
+        # Worker processes by the id of the job they are running
+        self._running:Dict[str, multiprocessing.Process] = {}
+        self._cancelled:Set[str] = set()
+        self._processes:List[multiprocessing.Process] = []
+
+    def start(self):
+        for i in range(self.count):
+            thread = Thread(target=self._run_slot, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            self._kill(process)
+        for thread in self._threads:
+            thread.join()
+
+    def cancel(self, job_id:str) -> bool:
+        """
+        Stops the worker running `job_id`, returning False if it is not running
+        """
+        with self._lock:
+            process = self._running.get(job_id)
+            if not process:
+                return False
+            self._cancelled.add(job_id)
+        self._kill(process)
+        return True
+
+    @staticmethod
+    def _kill(process:multiprocessing.Process):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            # Not yet in its own process group
+            process.terminate()
+
+    def _start_worker(self):
+        # Workers may start process pools themselves, so they cannot be daemons
+        context = multiprocessing.get_context('spawn')
+        conn, worker_conn = context.Pipe()
+        process = context.Process(target=_worker_main, args=(worker_conn,), name='neurender-worker')
+        process.start()
+        worker_conn.close()
+        with self._lock:
+            self._processes.append(process)
+        return process, conn
+
+    def _run_slot(self):
+        process:Optional[multiprocessing.Process] = None
+        conn = None
+        while not self._stopping.is_set():
+            if not process:
+                process, conn = self._start_worker()
+
+            job = self.store.next(timeout=_POLL_INTERVAL_S)
+            if not job:
+                continue
+
+            with self._lock:
+                self._running[job.id] = process
+            print(f" ==> Running job {job.id}: neurender {' '.join(job.args)}")
+            try:
+                conn.send((job.args, job.cwd, str(self.store.log_path(job.id))))
+                exit_code = conn.recv()
+                self.store.finish(job.id, 'succeeded' if exit_code == 0 else 'failed', exit_code)
+            except (EOFError, OSError):
+                process.join()
+                if job.id in self._cancelled:
+                    self.store.finish(job.id, 'cancelled', process.exitcode)
+                elif self._stopping.is_set():
+                    self.store.finish(job.id, 'failed', process.exitcode, 'Interrupted by server shutdown')
+                else:
+                    print_err(f"Worker running job {job.id} exited with status {process.exitcode}")
+                    self.store.finish(job.id, 'failed', process.exitcode, 'Worker process exited')
+                with self._lock:
+                    self._processes.remove(process)
+                conn.close()
+                process = None
+            finally:
+                with self._lock:
+                    self._running.pop(job.id, None)
+                    self._cancelled.discard(job.id)
+            print(f" ==> Job {job.id} {self.store.get(job.id).status}")
+
+        if process:
+            conn.close()
+            process.join()
@@ -0,0 +1,603 @@
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from pathlib import Path, PurePath
+from threading import Lock
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import urllib
+from datetime import datetime
+from pydantic import BaseModel
+
+from neurender.utils.pydantic import read_yaml_file, write_yaml_file
+from .. import config
+from ..utils.subprocess import run_command
+from ..utils import path_str, print_err
+from ..utils.files import GlobMatcher, iter_files
+from . import bundles
+from .bundles import BundledFile, BundleTransfer, is_bundle_key, is_index_key
+from .manifest import SyncManifest, ManifestEntry, ETagHasher, HashingReader, MANIFEST_FILE_NAME
+from .resumable import download_resumable, upload_multipart_resumable, PART_SUFFIX, PART_STATE_SUFFIX
+from .transfer import TransferEngine, TransferTask, TransferSummary, TransferFailure
+from .telemetry import RetryTracker, TransferRecord, TransferReport
+
+if TYPE_CHECKING:
+    from ..utils.compression import ArchiveFormat
+
+SELECT_ALL_FILES = "**/*"
+
+@staticmethod
+def parse_s3_url(url) -> Tuple[str, str]:
+    """Splits an AWS S3 URL into the bucket name and key.
+
+    Args:
+        url: The AWS S3 URL.
+
+    Returns:
+        A tuple containing (bucket name, key), or (None, None) if the url/path is not valid
+    """
+
+    parsed_url = urllib.parse.urlparse(url)
+
+    bucket_name = parsed_url.netloc
+    key = parsed_url.path.lstrip('/')
+
+    # If bucket_name is not set
+    if not bucket_name:
+        if key:
+            bucket_name, key = key.split('/', 1)
+
+    return (bucket_name, key)
+
+def as_dir_prefix(prefix:str) -> str:
+    # Lists 'path/to/dir/' rather than every key starting with 'path/to/dir'
+    return prefix.rstrip('/') + '/' if prefix else ''
+
+def is_s3_dir(s3_obj):
+    return s3_obj['Size'] == 0 and s3_obj['Key'][-1] == '/'
+
+def load_remote_meta(directory:Path|str):
+    remote_meta_path = Path(directory) / DIRECTORY_METAFILE_NAME
+    try:
+        return read_yaml_file(RemoteFileMeta, remote_meta_path)
+    except Exception as e:
+        print_err("Remote folder metadata not loaded:", e)
+
+
+def _run_coroutine(coroutine_factory):
+    # Runs a coroutine to completion for a synchronous caller. asyncio.run() refuses to
+    # run within an event loop, so a caller already running one blocks on a thread of its own.
+    import asyncio
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine_factory())
+    with ThreadPoolExecutor(1, thread_name_prefix='sync') as executor:
+        return executor.submit(lambda: asyncio.run(coroutine_factory())).result()
+
+
+class StorageError(Exception):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+
+DIRECTORY_METAFILE_NAME = ".remote.meta"
+class RemoteFileMeta(BaseModel):
+    url:str = ''
+
+# Local bookkeeping files which are never synced
+METADATA_FILE_NAMES = (DIRECTORY_METAFILE_NAME, MANIFEST_FILE_NAME)
+METADATA_FILE_SUFFIXES = (PART_SUFFIX, PART_STATE_SUFFIX)
+
+def _create_s3_client(s3_config:config.S3Config):
+    # boto3 is imported with the first client, so commands which never reach S3 start faster
+    import boto3
+    from botocore.config import Config as BotoConfig
+
+    # Clients are thread safe and shared by all transfers of an S3 instance,
+    # so the connection pool must cover every concurrent request.
+    # Unset options fall back to boto3's defaults, such as credentials from the environment.
+    return boto3.client('s3',
+                        aws_access_key_id=s3_config.access_key or None,
+                        aws_secret_access_key=s3_config.access_secret_key or None,
+                        endpoint_url=s3_config.endpoint_url or None,
+                        config=BotoConfig(max_pool_connections=s3_config.max_pool_connections))
+
+
+# Clients by config, once enabled by share_clients()
+_shared_clients:Optional[Dict[str, Tuple[object, RetryTracker]]] = None
+_shared_clients_lock = Lock()
+
+def share_clients():
+    """
+    Makes S3 instances with the same config share one client, along with its connection
+    pool and credentials, rather than each creating their own. For long-running
+    processes running many transfers, such as `neurender serve` workers.
+    """
+    global _shared_clients
+    with _shared_clients_lock:
+        if _shared_clients is None:
+            _shared_clients = {}
+
+def _get_shared_client(s3_config:config.S3Config) -> Tuple[object, RetryTracker]:
+    key = s3_config.model_dump_json()
+    with _shared_clients_lock:
+        if key not in _shared_clients:
+            client = _create_s3_client(s3_config)
+            retries = RetryTracker()
+            retries.attach(client)
+            _shared_clients[key] = (client, retries)
+        return _shared_clients[key]
+
+
+MB = 1024 * 1024
+
+def _create_transfer_config(s3_config:config.S3Config) -> "TransferConfig":
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(multipart_threshold=s3_config.multipart_threshold_mb * MB,
+                          multipart_chunksize=s3_config.multipart_chunksize_mb * MB,
+                          max_concurrency=s3_config.part_concurrency)
+
+def _create_hasher(s3_config:config.S3Config) -> ETagHasher:
+    return ETagHasher(multipart_threshold=s3_config.multipart_threshold_mb * MB,
+                      multipart_chunksize=s3_config.multipart_chunksize_mb * MB)
+
+
+def _s3_download_file(s3, s3_config:config.S3Config, bucket_name:str, file_key:str, local_path:Path, size:int, last_modified_time:datetime, etag:str) -> ManifestEntry:
+    """
+    Downloads an object, hashing its content as it is written so the file does not
+    need to be read again to record it in the sync manifest.
+
+    Objects above the multipart threshold are fetched as parallel ranged GETs. boto3
+    buffers out of order ranges so they reach the (non-seekable) writer in sequence.
+    Downloads go through a .part file, and resume from it if interrupted (see download_resumable).
+    """
+    hasher = download_resumable(s3, bucket_name, str(file_key), local_path, size, etag,
+                                transfer_config=_create_transfer_config(s3_config),
+                                new_hasher=lambda: _create_hasher(s3_config),
+                                checkpoint_bytes=s3_config.resume_checkpoint_mb * MB)
+    timestamp = last_modified_time.timestamp()
+    os.utime(local_path, times=(timestamp, timestamp))
+    return ManifestEntry(size=hasher.size, etag=etag, digest=hasher.digest)
+
+def _s3_upload_file(s3, s3_config:config.S3Config, file_path:Path, bucket_name:str, file_key:str) -> ManifestEntry:
+    """
+    Uploads a file, hashing its content as it is read. The resulting ETag is computed
+    locally from the same part size boto3 uploads with.
+
+    Files above the multipart threshold are uploaded in resumable multipart uploads
+    (see upload_multipart_resumable).
+    """
+    hasher = _create_hasher(s3_config)
+    if os.path.getsize(file_path) >= hasher.multipart_threshold:
+        upload_multipart_resumable(s3, file_path, bucket_name, file_key, hasher, s3_config.part_concurrency)
+    else:
+        with open(file_path, 'rb') as f:
+            s3.upload_fileobj(HashingReader(f, hasher), bucket_name, file_key, Config=_create_transfer_config(s3_config))
+    return ManifestEntry(size=hasher.size, etag=hasher.etag, digest=hasher.digest)
+
+
+def get_relative_file_key(bucket_prefix, file_key) -> str:
+    return str(PurePath(file_key).relative_to(bucket_prefix))
+
+
+class S3:
+    _config:config.S3Config
+
+    def __init__(self, s3_config:Optional[config.S3Config]=None):
+        self._config = s3_config or config.load().storage.s3
+        self._client = None
+        self.retries = RetryTracker()
+        if _shared_clients is not None:
+            self._client, self.retries = _get_shared_client(self._config)
+
+    @property
+    def client(self):
+        if not self._client:
+            self._client = _create_s3_client(self._config)
+            self.retries.attach(self._client)
+        return self._client
+
+    def iter_s3_pages(self, bucket, prefix, allow_empty=False) -> Iterator[List[dict]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        print(f"  ** Listing S3 bucket: {bucket}:{prefix}")
+        pages = paginator.paginate(Bucket=bucket, Prefix=prefix)
+
+        for i, page in enumerate(pages):
+            print(f"  ** Loading S3 page {i+1}")
+
+            s3_contents = page.get('Contents')
+            if not s3_contents:
+                if allow_empty:
+                    return
+                print(f"S3 bucket {bucket}:{prefix} (page: {page}) returned no content")
+                raise StorageError('No remote content found')
+
+            yield s3_contents
+
+    def iter_s3_content(self, bucket, prefix, allow_empty=False):
+        for page in self.iter_s3_pages(bucket, prefix, allow_empty):
+            yield from page
+
+    def list_remote_lookup(self, bucket, prefix) -> Dict[str, dict]:
+        try:
+            # Nothing uploaded yet is not an error
+            return { o['Key']: o for o in self.iter_s3_content(bucket, prefix, allow_empty=True) }
+        except Exception as e:
+            print(f"Error retreiving existing content for bucket: {bucket}:{prefix}")
+            return {}
+
+
+    def sync_to_local(self, src:str, dst:Path | str='', select:str | List[str]="", exclude:Iterable[str]=()):
+        """
+        Syncs an S3 bucket url folder `src` to the local filesystem at `dst`.
+        The s3 prefix is optional in `src`, which can be of the following forms:
+            s3://bucket_name/path/to/directory
+            /bucket_name/path
+            bucket_name/path
+
+        `select` is a glob pattern, or list of patterns, matched against paths relative to `src`.
+        Path.match() is not used, because it does not properly expand the pattern '**'.
+        See GlobMatcher. `exclude` lists directories, relative to `src`, which are never downloaded.
+
+        Files packed into bundles by `sync_to_remote` are unpacked as if they were objects.
+
+        Returns a TransferSummary, listing any files which failed to download along with
+        per-file transfer statistics. Coroutines should await AsyncS3.sync_to_local() instead.
+        """
+        if self._config.backend == 'asyncio':
+            return _run_coroutine(lambda: AsyncS3(self).sync_to_local(src, dst, select, exclude))
+
+        download = self._prepare_download(src, dst, select, exclude)
+        try:
+            with TransferEngine(self._config.process_count, self._config.transfer_queue_size, self.retries) as engine:
+                has_bundles = download.list_parent_bundles()
+                engine.run(download.download_tasks(chain.from_iterable(download.list_pages(has_bundles))))
+                engine.run(download.bundle_download_tasks())
+        finally:
+            download.manifest.save(download.local_path)
+
+        return engine.summary
+
+
+    def sync_to_remote(self, src:Path | str, dst:str, select:str | List[str]="", exclude:Iterable[str]=()):
+        """
+        Syncs the local file system folder `src` to the S3 bucket path/url `dst`.
+
+        `select` is a glob pattern, or list of patterns, matched against paths relative to `src`.
+        The remote prefix is listed once and `src` is walked once, whatever the number of
+        patterns, with files queued for upload as they are found. `exclude` lists directories,
+        relative to `src`, which are never uploaded. With `bundle_threshold_kb`
+        set, small files are uploaded packed into bundles (see storage.bundles).
+
+        Returns a TransferSummary, listing any files which failed to upload along with
+        per-file transfer statistics. Coroutines should await AsyncS3.sync_to_remote() instead.
+        """
+        if self._config.backend == 'asyncio':
+            return _run_coroutine(lambda: AsyncS3(self).sync_to_remote(src, dst, select, exclude))
+
+        upload = self._prepare_upload(src, dst, select, exclude)
+        remote_lookup = upload.remote_lookup()
+        try:
+            with TransferEngine(self._config.process_count, self._config.transfer_queue_size, self.retries) as engine:
+                engine.run(upload.upload_tasks(upload.iter_local_files(), remote_lookup))
+            upload.delete_superseded_bundles()
+        finally:
+            upload.manifest.save(upload.local_path)
+
+        return engine.summary
+
+
+    def upload_archive(self, src:Path | str, dst:str, format:"ArchiveFormat"='gz', level:Optional[int]=None,
+                       threads:int=0, arcname:Optional[str]=None) -> TransferSummary:
+        """
+        Uploads the file or folder `src` as a compressed tarball, compressed on `threads`
+        threads (all cores by default) and streamed into a multipart upload as it is written.
+        `dst` is the url of the archive, or of a folder to upload `{src name}.tar.gz` to.
+        See utils.compression.write_tar for `arcname`.
+        """
+        from ..utils.compression import ARCHIVE_SUFFIXES
+        from .archive import upload_archive
+
+        src = Path(src).expanduser()
+        bucket_name, key = parse_s3_url(dst)
+        if not key.endswith(tuple(ARCHIVE_SUFFIXES.values())):
+            key = as_dir_prefix(key) + src.name + ARCHIVE_SUFFIXES[format]
+
+        print(f" ==> Compressing {src} to {bucket_name}:{key}")
+        return self._run_single_transfer(TransferTask(
+            str(src), upload_archive,
+            (self.client, bucket_name, key, src, format, level, threads,
+             self._config.multipart_chunksize_mb * MB, self._config.part_concurrency, arcname),
+            direction='upload', key=key))
+
+    def download_archive(self, src:str, dst:Path | str='') -> TransferSummary:
+        """
+        Extracts the compressed tarball at the url `src` into `dst` (by default the
+        current directory) as it is downloaded
+        """
+        from ..utils.compression import archive_format
+        from .archive import download_archive
+
+        bucket_name, key = parse_s3_url(src)
+        dst = Path(dst or '.').expanduser()
+        print(f" ==> Extracting {bucket_name}:{key} => {dst}")
+        return self._run_single_transfer(TransferTask(
+            key, download_archive, (self.client, bucket_name, key, dst, archive_format(key)),
+            direction='download', key=key))
+
+    def _run_single_transfer(self, task:TransferTask) -> TransferSummary:
+        with TransferEngine(1, 0, self.retries) as engine:
+            engine.run([task])
+        return engine.summary
+
+
+    def _prepare_download(self, src:str, dst:Path | str, select:str | List[str], exclude:Iterable[str]=()) -> "_SyncPlan":
+        if not dst:
+            dst = Path(Path(src).name)
+        else:
+            dst = Path(dst).expanduser()
+
+        bucket_name, bucket_prefix = parse_s3_url(src)
+        bucket_prefix = as_dir_prefix(bucket_prefix)
+
+        print(f"Copying S3 to local '{bucket_name}:{bucket_prefix}' => '{dst}'")
+
+        dst.mkdir(parents=True, exist_ok=True)
+
+        # Write remote directory metadata
+        meta_file = dst / DIRECTORY_METAFILE_NAME
+        meta = RemoteFileMeta(url=src)
+        write_yaml_file(meta, meta_file)
+
+        return _SyncPlan(self, dst, src, bucket_name, bucket_prefix, select, exclude)
+
+    def _prepare_upload(self, src:Path | str, dst:str, select:str | List[str], exclude:Iterable[str]=()) -> "_SyncPlan":
+        src = Path(src).expanduser()
+
+        if not dst:
+            # check for remote.meta file if no dst provided
+            try:
+                dst = load_remote_meta(src).url
+            except Exception as e:
+                raise StorageError(f"No destination URL provided and {DIRECTORY_METAFILE_NAME} could not be loaded from source directory")
+
+        bucket_name, bucket_prefix = parse_s3_url(dst)
+        bucket_prefix = as_dir_prefix(bucket_prefix)
+
+        return _SyncPlan(self, src, dst, bucket_name, bucket_prefix, select, exclude)
+
+
+class _SyncPlan:
+    """
+    Decides which files a sync between `local_path` and the remote `url` transfers.
+    Shared by the threaded and asyncio transfer paths, which only differ in how
+    listings are consumed and transfers are scheduled.
+    """
+    def __init__(self, s3:S3, local_path:Path, url:str, bucket_name:str, bucket_prefix:str, select:str | List[str],
+                 exclude:Iterable[str]=()):
+        self.s3 = s3
+        self.local_path = local_path
+        self.url = url
+        self.bucket_name = bucket_name
+        self.bucket_prefix = bucket_prefix
+        self.matcher = GlobMatcher(select or SELECT_ALL_FILES)
+        # Relative paths of the directories which are not synced
+        self.exclude_dirs = tuple(path.strip('/') for path in exclude)
+        self.manifest = SyncManifest.load(local_path, url)
+        # Bundle indexes found remotely, and listed plain objects, which take precedence
+        # over bundled copies of the same files
+        self._index_keys:Set[str] = set()
+        self._plain_keys:Set[str] = set()
+        # Object keys of the files an upload packed into new bundles
+        self._bundled_keys:Set[str] = set()
+
+    @property
+    def listing_prefix(self) -> str:
+        # Only the part of the remote directory which can hold selected files is listed
+        return self.bucket_prefix + self.matcher.common_directory
+
+    def list_pages(self, has_bundles:bool) -> Iterator[List[dict]]:
+        # Only an empty remote directory is an error, not an empty selection within it,
+        # nor one with its files all in bundles
+        allow_empty = has_bundles or self.listing_prefix != self.bucket_prefix
+        return self.s3.iter_s3_pages(self.bucket_name, self.listing_prefix, allow_empty)
+
+    def iter_local_files(self) -> Iterator[str]:
+        exclude_names = (*METADATA_FILE_NAMES, bundles.BUNDLES_DIR)
+        for key, entry in iter_files(self.local_path, self.matcher, exclude_names=exclude_names, exclude_suffixes=METADATA_FILE_SUFFIXES,
+                                     exclude_dirs=self.exclude_dirs):
+            yield key
+
+    def is_excluded(self, relative_key:str) -> bool:
+        return any(relative_key.startswith(f"{path}/") for path in self.exclude_dirs)
+
+    def _record(self, key:str, path:Path):
+        return lambda entry: self.manifest.record(key, path, entry.etag, entry.digest)
+
+    def _record_bundled(self, transfer:BundleTransfer):
+        for key, path, digest in transfer.files:
+            self.manifest.record(key, path, digest, digest)
+
+    def list_parent_bundles(self) -> bool:
+        """
+        Finds the bundles of the directories between the sync root and the listing prefix,
+        which may hold selected files but are not themselves listed. Returns whether any exist.
+        """
+        prefixes = [self.bucket_prefix]
+        for part in self.matcher.common_directory.split('/')[:-1]:
+            prefixes.append(prefixes[-1] + part + '/')
+        self._index_keys.update(bundles.list_index_keys(self.s3.client, self.bucket_name, prefixes[:-1]))
+        return bool(self._index_keys)
+
+    def _load_bundled_files(self) -> Dict[str, BundledFile]:
+        # Selected bundled files by object key, unless shadowed by a plain object
+        if not self._index_keys:
+            return {}
+        files = bundles.load_bundled_files(self.s3.client, self.bucket_name, self._index_keys, self.s3._config.process_count)
+        return { key: f for key, f in files.items()
+                 if key not in self._plain_keys and key.startswith(self.bucket_prefix)
+                 and self.matcher.matches(get_relative_file_key(self.bucket_prefix, key))
+                 and not self.is_excluded(get_relative_file_key(self.bucket_prefix, key)) }
+
+    def remote_lookup(self) -> Dict[str, dict]:
+        """
+        Lists the remote objects an upload compares local files with, by key, including
+        bundled files, which are flagged `Bundled`
+        """
+        lookup = self.s3.list_remote_lookup(self.bucket_name, self.listing_prefix)
+        try:
+            self.list_parent_bundles()
+            self._index_keys.update(key for key in lookup if is_index_key(key))
+            self._plain_keys = { key for key in lookup if not is_bundle_key(key) }
+            for key, bundled in self._load_bundled_files().items():
+                lookup[key] = { 'Key': key, 'Size': bundled.entry.size, 'ETag': bundled.entry.digest, 'Bundled': True }
+        except Exception as e:
+            print_err(f"Error loading bundle indexes for bucket: {self.bucket_name}:{self.listing_prefix}: {e}")
+        return lookup
+
+    def download_tasks(self, objects:Iterable[dict]) -> Iterator[Optional[TransferTask]]:
+        """
+        Yields a download task for each listed object matching the selection which is not
+        already present locally, or None for each one which is up to date.
+        """
+        s3_config = self.s3._config
+        for obj in objects:
+            file_key = obj['Key']
+            relative_file_key = get_relative_file_key(self.bucket_prefix, file_key)
+
+            if is_bundle_key(relative_file_key):
+                if is_index_key(relative_file_key):
+                    self._index_keys.add(file_key)
+                continue
+            self._plain_keys.add(file_key)
+
+            if not self.matcher.matches(relative_file_key) or self.is_excluded(relative_file_key):
+                continue
+
+            if PurePath(relative_file_key).name in METADATA_FILE_NAMES:
+                continue
+
+            local_path = self.local_path / relative_file_key
+
+            if is_s3_dir(obj):
+                local_path.mkdir(exist_ok=True, parents=True)
+                continue
+
+            if self.manifest.is_synced(relative_file_key, local_path, obj['Size'], obj['ETag'], _create_hasher(s3_config)):
+                yield None
+                continue
+
+            print(f" ==> Downloading remote S3 file at {self.bucket_name}/{file_key} => {local_path}")
+            local_path.parent.mkdir(exist_ok=True, parents=True)
+
+            yield TransferTask(
+                file_key, _s3_download_file,
+                (self.s3.client, s3_config, self.bucket_name, file_key, local_path, obj['Size'], obj['LastModified'], obj['ETag']),
+                callback=self._record(relative_file_key, local_path),
+                direction='download', key=file_key)
+
+    def bundle_download_tasks(self) -> Iterator[Optional[TransferTask]]:
+        """
+        Yields a task for each run of selected bundled files to fetch with one ranged GET,
+        or None for each bundled file which is up to date. Runs after `download_tasks`
+        has consumed the listing, which finds bundles and the plain objects shadowing them.
+        """
+        s3_config = self.s3._config
+        missing = []
+        for file_key, bundled in self._load_bundled_files().items():
+            relative_file_key = get_relative_file_key(self.bucket_prefix, file_key)
+            local_path = self.local_path / relative_file_key
+            if self.manifest.is_synced(relative_file_key, local_path, bundled.entry.size, bundled.entry.digest, _create_hasher(s3_config)):
+                yield None
+                continue
+            local_path.parent.mkdir(exist_ok=True, parents=True)
+            missing.append((bundled, relative_file_key, local_path))
+
+        for files in bundles.group_ranges(missing):
+            bundle_key = files[0][0].bundle_key
+            print(f" ==> Unbundling {len(files)} files from S3 bundle at {self.bucket_name}/{bundle_key} => {self.local_path}")
+            yield TransferTask(
+                f"{bundle_key} ({len(files)} files)", bundles.download_range,
+                (self.s3.client, self.bucket_name, files, PART_SUFFIX),
+                callback=self._record_bundled,
+                direction='download', key=bundle_key)
+
+    def _bundle_task(self, files:List[Tuple[str, Path]], replaced_keys:List[str]) -> TransferTask:
+        size = sum(os.path.getsize(path) for _, path in files)
+        self._bundled_keys.update(self.bucket_prefix + key for key, _ in files)
+        print(f" ==> Bundling {len(files)} files ({size / MB:.1f} MB) from {self.local_path} to {self.bucket_name}:{self.bucket_prefix}{bundles.BUNDLES_DIR}/")
+        return TransferTask(
+            f"{self.local_path} ({len(files)} files)", bundles.upload_bundle,
+            (self.s3.client, self.bucket_name, self.bucket_prefix, files, _create_transfer_config(self.s3._config), replaced_keys),
+            callback=self._record_bundled,
+            direction='upload', key=f"{self.bucket_prefix}{bundles.BUNDLES_DIR}/")
+
+    def delete_superseded_bundles(self):
+        """
+        Deletes the bundles of the sync root whose files all have newer copies, once an
+        upload has added bundles
+        """
+        if not self._bundled_keys:
+            return
+        # The plain objects listed before the upload, except those it replaced with bundled copies
+        plain_keys = self._plain_keys - self._bundled_keys
+        try:
+            deleted = bundles.delete_superseded(self.s3.client, self.bucket_name, self.bucket_prefix, plain_keys,
+                                                self.s3._config.process_count)
+        except Exception as e:
+            print_err(f"Error deleting superseded bundles in {self.bucket_name}:{self.bucket_prefix}: {e}")
+            return
+        if deleted:
+            print(f" ==> Deleted {deleted} superseded bundles from {self.bucket_name}:{self.bucket_prefix}{bundles.BUNDLES_DIR}/")
+
+    def upload_tasks(self, keys:Iterable[str], remote_lookup:Dict[str, dict]) -> Iterator[Optional[TransferTask]]:
+        """
+        Yields an upload task for each local file (by relative key) which differs from
+        its remote copy in `remote_lookup`, or None for each one which is up to date.
+        Files below `bundle_threshold_kb` are gathered into bundle upload tasks instead.
+        """
+        s3_config = self.s3._config
+        bundle_threshold = s3_config.bundle_threshold_kb * 1024
+        bundle_files:List[Tuple[str, Path]] = []
+        bundle_size = 0
+        # Plain objects of bundled files, deleted once their bundle is uploaded
+        replaced_keys:List[str] = []
+        for key in keys:
+            src_path = self.local_path / key
+            dst_path = self.bucket_prefix + key
+
+            verb = "Uploading"
+            existing_obj = remote_lookup.get(dst_path)
+            if existing_obj:
+                if self.manifest.is_synced(key, src_path, existing_obj['Size'], existing_obj['ETag'], _create_hasher(s3_config)):
+                    yield None
+                    continue
+                verb = "Replacing"
+
+            if bundle_threshold:
+                size = os.path.getsize(src_path)
+                if size < bundle_threshold:
+                    bundle_files.append((key, src_path))
+                    bundle_size += size
+                    if existing_obj and not existing_obj.get('Bundled'):
+                        replaced_keys.append(dst_path)
+                    if bundle_size >= s3_config.bundle_size_mb * MB:
+                        yield self._bundle_task(bundle_files, replaced_keys)
+                        bundle_files, bundle_size, replaced_keys = [], 0, []
+                    continue
+
+            print(f" ==> {verb} file at {src_path} to {self.bucket_name}:{dst_path}")
+
+            yield TransferTask(
+                str(src_path), _s3_upload_file,
+                (self.s3.client, s3_config, src_path, self.bucket_name, dst_path),
+                callback=self._record(key, src_path),
+                direction='upload', key=dst_path)
+
+        if bundle_files:
+            yield self._bundle_task(bundle_files, replaced_keys)
+
+
+# Awaitable versions of the sync methods of S3
+from .aio import AsyncS3
@@ -0,0 +1,116 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, Optional
+
+from . import S3, _SyncPlan
+from .transfer import TransferSummary, TransferTask
+
+
+class AsyncS3:
+    """
+    asyncio front end to S3 syncs, for embedding in a long running service or event loop.
+
+    A sync runs as a bounded producer/consumer pipeline: listing pages (or walking local
+    files) and deciding what to transfer happen in a producer, while up to `max_in_flight`
+    consumers run transfers. The producer blocks once `queue_size` transfers are pending,
+    so listing overlaps with transfers without running unboundedly ahead of them.
+
+    boto3 is synchronous, so listing and transfers run on dedicated thread pools
+    sharing the wrapped S3 instance's client.
+    """
+    def __init__(self, s3:Optional[S3]=None, max_in_flight:int=0, queue_size:int=0):
+        self.s3 = s3 or S3()
+        s3_config = self.s3._config
+        self.max_in_flight = max_in_flight or s3_config.process_count
+        self.queue_size = queue_size or s3_config.transfer_queue_size or self.max_in_flight * 2
+
+    async def sync_to_local(self, src:str, dst:Path | str='', select:str | List[str]='', exclude:Iterable[str]=()) -> TransferSummary:
+        """
+        Coroutine version of S3.sync_to_local()
+        """
+        download = self.s3._prepare_download(src, dst, select, exclude)
+        try:
+            return await self._run(lambda executor: self._download_producer(download, executor))
+        finally:
+            download.manifest.save(download.local_path)
+
+    async def sync_to_remote(self, src:Path | str, dst:str, select:str | List[str]='', exclude:Iterable[str]=()) -> TransferSummary:
+        """
+        Coroutine version of S3.sync_to_remote()
+        """
+        upload = self.s3._prepare_upload(src, dst, select, exclude)
+        try:
+            summary = await self._run(lambda executor: self._upload_producer(upload, executor))
+            await _run_in_executor(None, upload.delete_superseded_bundles)
+            return summary
+        finally:
+            upload.manifest.save(upload.local_path)
+
+    async def _download_producer(self, download:_SyncPlan, executor:ThreadPoolExecutor) -> AsyncIterator[Optional[TransferTask]]:
+        has_bundles = await _run_in_executor(executor, download.list_parent_bundles)
+        pages = download.list_pages(has_bundles)
+        # Planning may hash local files, so it runs off the event loop along with listing
+        async for page in _iterate_in_executor(executor, pages):
+            for task in await _run_in_executor(executor, list, download.download_tasks(page)):
+                yield task
+        async for task in _iterate_in_executor(executor, download.bundle_download_tasks()):
+            yield task
+
+    async def _upload_producer(self, upload:_SyncPlan, executor:ThreadPoolExecutor) -> AsyncIterator[Optional[TransferTask]]:
+        # The remote listing is needed to decide on any file, so walk the local tree while it loads
+        remote_lookup = asyncio.ensure_future(_run_in_executor(executor, upload.remote_lookup))
+        keys = await _run_in_executor(executor, list, upload.iter_local_files())
+        tasks = upload.upload_tasks(keys, await remote_lookup)
+        async for task in _iterate_in_executor(executor, tasks):
+            yield task
+
+    async def _run(self, producer_factory:Callable[[ThreadPoolExecutor], AsyncIterator[Optional[TransferTask]]]) -> TransferSummary:
+        summary = TransferSummary()
+        producer_error = None
+        queue = asyncio.Queue(self.queue_size)
+        loop = asyncio.get_running_loop()
+
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='listing') as list_executor, \
+             ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='transfer') as transfer_executor:
+
+            async def produce():
+                nonlocal producer_error
+                try:
+                    async for task in producer_factory(list_executor):
+                        if task is None:
+                            summary.skipped += 1
+                        else:
+                            task.queue()
+                            await queue.put(task)
+                except Exception as e:
+                    # Raised once in-flight transfers have drained
+                    producer_error = e
+                finally:
+                    for _ in range(self.max_in_flight):
+                        await queue.put(None)
+
+            async def consume():
+                while (task := await queue.get()) is not None:
+                    future = loop.run_in_executor(transfer_executor, task.execute)
+                    await asyncio.wait([future])
+                    task.finish(summary, future.result, self.s3.retries)
+
+            await asyncio.gather(produce(), *[consume() for _ in range(self.max_in_flight)])
+
+        if producer_error:
+            raise producer_error
+        return summary
+
+
+async def _run_in_executor(executor:ThreadPoolExecutor, func, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+_END = object()
+
+async def _iterate_in_executor(executor:ThreadPoolExecutor, iterator:Iterator) -> AsyncIterator:
+    """
+    Iterates a blocking iterator, advancing it on `executor`
+    """
+    while (item := await _run_in_executor(executor, next, iterator, _END)) is not _END:
+        yield item
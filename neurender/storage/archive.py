@@ -0,0 +1,148 @@
+"""
+Compressed tarballs streamed to and from S3: archives are compressed straight into a
+multipart upload, and extracted as they are downloaded, without a temporary file.
+See utils.compression for the compression itself.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Optional
+
+from ..utils.compression import ArchiveFormat, extract_tar, write_tar
+
+MB = 1024 * 1024
+
+# S3 limits
+_MIN_PART_SIZE = 5 * MB
+_MAX_PARTS = 10000
+# The part size grows by the base part size every this many parts, since the archive
+# size is unknown until it is written. With 8MB parts, archives up to 440GB fit.
+_PART_SIZE_STEP = _MAX_PARTS // 10
+
+
+class ArchiveTransfer:
+    def __init__(self, size:int, files:int):
+        # Compressed bytes sent or received
+        self.size = size
+        self.files = files
+
+
+class MultipartWriter:
+    """
+    Write-only file object uploading what is written to `key` as a multipart upload,
+    with up to `part_concurrency` parts in flight. Objects smaller than one part are
+    uploaded with a single PUT on close. On error, use abort() so no incomplete
+    upload is left behind.
+    """
+    def __init__(self, s3, bucket_name:str, key:str, part_size:int, part_concurrency:int):
+        self._s3 = s3
+        self._bucket_name = bucket_name
+        self._key = key
+        self._base_part_size = max(part_size, _MIN_PART_SIZE)
+        self._part_concurrency = part_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=part_concurrency, thread_name_prefix='upload-part')
+        self._in_flight = set()
+        self._completed = {}
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._part_number = 1
+        self.size = 0
+        self.closed = False
+
+    def _part_size(self) -> int:
+        return self._base_part_size * (1 + (self._part_number - 1) // _PART_SIZE_STEP)
+
+    def _upload_part(self, part_number:int, data:bytes):
+        response = self._s3.upload_part(Bucket=self._bucket_name, Key=self._key, UploadId=self._upload_id,
+                                        PartNumber=part_number, Body=data)
+        self._completed[part_number] = response['ETag']
+
+    def _submit(self, data:bytes):
+        if not self._upload_id:
+            self._upload_id = self._s3.create_multipart_upload(Bucket=self._bucket_name, Key=self._key)['UploadId']
+        # Bound the parts held in memory
+        if len(self._in_flight) >= self._part_concurrency:
+            done, self._in_flight = wait(self._in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+        self._in_flight.add(self._executor.submit(self._upload_part, self._part_number, data))
+        self._part_number += 1
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self._part_size():
+            part_size = self._part_size()
+            part = bytes(self._buffer[:part_size])
+            del self._buffer[:part_size]
+            self._submit(part)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if not self._upload_id:
+                self._s3.put_object(Bucket=self._bucket_name, Key=self._key, Body=bytes(self._buffer))
+                return
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+            for future in self._in_flight:
+                future.result()
+            parts = [{'PartNumber': n, 'ETag': self._completed[n]} for n in sorted(self._completed)]
+            self._s3.complete_multipart_upload(Bucket=self._bucket_name, Key=self._key, UploadId=self._upload_id,
+                                               MultipartUpload={'Parts': parts})
+        finally:
+            self._executor.shutdown()
+
+    def abort(self):
+        self.closed = True
+        self._executor.shutdown(cancel_futures=True)
+        if self._upload_id:
+            self._s3.abort_multipart_upload(Bucket=self._bucket_name, Key=self._key, UploadId=self._upload_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type:
+            self.abort()
+        else:
+            self.close()
+
+
+class _CountingReader:
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.size = 0
+
+    def read(self, size=-1) -> bytes:
+        data = self._fileobj.read(size)
+        self.size += len(data)
+        return data
+
+
+def upload_archive(s3, bucket_name:str, key:str, src:Path, format:ArchiveFormat, level:Optional[int], threads:int,
+                   part_size:int, part_concurrency:int, arcname:Optional[str]=None) -> ArchiveTransfer:
+    """
+    Compresses `src` into a tarball uploaded to `key` as it is written
+    """
+    with MultipartWriter(s3, bucket_name, key, part_size, part_concurrency) as writer:
+        files = write_tar(src, writer, format, level, threads, arcname)
+    return ArchiveTransfer(writer.size, files)
+
+
+def download_archive(s3, bucket_name:str, key:str, dst:Path, format:ArchiveFormat) -> ArchiveTransfer:
+    """
+    Extracts the tarball at `key` into `dst` as it is downloaded
+    """
+    body = s3.get_object(Bucket=bucket_name, Key=key)['Body']
+    reader = _CountingReader(body)
+    try:
+        files = extract_tar(reader, dst, format)
+    finally:
+        body.close()
+    return ArchiveTransfer(reader.size, files)
@@ -0,0 +1,277 @@
+"""
+Bundles pack many small files into one object, so syncing them costs a few requests
+rather than one per file. A bundle is the files' contents concatenated, uploaded as
+`.bundles/<id>.bundle` under the sync root, with a sidecar `.bundles/<id>.index`
+recording each file's offset, size and digest. Files are fetched back with ranged
+GETs, one per run of nearby files, and unpacked transparently on download.
+
+A bundle only counts once its index exists. Plain objects take precedence over
+bundled copies of the same file, and newer bundles over older ones. Once every file of
+a bundle is superseded, an upload adding a bundle next to it deletes it.
+"""
+import hashlib
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePath
+from typing import Collection, Dict, Iterable, Iterator, List, Tuple
+from pydantic import BaseModel
+
+BUNDLES_DIR = ".bundles"
+BUNDLE_SUFFIX = ".bundle"
+INDEX_SUFFIX = ".index"
+
+MB = 1024 * 1024
+
+# Bundled files closer together than this are fetched in one ranged GET, gap included
+RANGE_MERGE_GAP = 1 * MB
+# Bundled files fetched in one ranged GET, at most
+RANGE_MAX_SIZE = 64 * MB
+
+_READ_BLOCK_SIZE = 1024 * 1024
+# delete_objects() accepts at most this many keys
+_DELETE_BATCH_SIZE = 1000
+
+
+class BundleEntry(BaseModel):
+    offset:int
+    size:int
+    # MD5 of the file content, which is also the ETag of the file as a plain object
+    digest:str
+    mtime:float = 0
+
+
+class BundleIndex(BaseModel):
+    # Name of the bundle object, within the index's directory
+    bundle:str
+    created:float
+    # By path relative to the directory holding .bundles/
+    files:Dict[str, BundleEntry] = {}
+
+
+class BundledFile:
+    def __init__(self, bundle_key:str, entry:BundleEntry, created:float):
+        self.bundle_key = bundle_key
+        self.entry = entry
+        self.created = created
+
+
+class BundleTransfer:
+    """
+    Result of a bundle upload or ranged download. `files` are the (relative key, local
+    path, digest) of each file transferred, for recording in the sync manifest.
+    """
+    def __init__(self, size:int, files:List[Tuple[str, Path, str]]):
+        self.size = size
+        self.files = files
+
+
+def is_bundle_key(key:str) -> bool:
+    return BUNDLES_DIR in PurePath(key).parts[:-1]
+
+def is_index_key(key:str) -> bool:
+    return is_bundle_key(key) and key.endswith(INDEX_SUFFIX)
+
+def _store_prefix(index_key:str) -> str:
+    # The directory holding the .bundles/ directory of an index, as a key prefix
+    return index_key[:index_key.rindex(BUNDLES_DIR + '/')]
+
+
+def list_index_keys(client, bucket_name:str, directory_prefixes:Iterable[str]) -> List[str]:
+    """
+    Lists the bundle indexes stored in each directory (key prefixes ending with '/', or '')
+    """
+    keys = []
+    paginator = client.get_paginator("list_objects_v2")
+    for prefix in directory_prefixes:
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=f"{prefix}{BUNDLES_DIR}/"):
+            keys += [o['Key'] for o in page.get('Contents', []) if o['Key'].endswith(INDEX_SUFFIX)]
+    return keys
+
+
+def _load_indexes(client, bucket_name:str, index_keys:Iterable[str], workers:int) -> List[Tuple[str, BundleIndex]]:
+    # (key, index) of each index, oldest first
+    def load(index_key:str) -> Tuple[str, BundleIndex]:
+        body = client.get_object(Bucket=bucket_name, Key=index_key)['Body'].read()
+        return index_key, BundleIndex.model_validate_json(body)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='bundle-index') as executor:
+        indexes = list(executor.map(load, sorted(set(index_keys))))
+    return sorted(indexes, key=lambda i: i[1].created)
+
+
+def load_bundled_files(client, bucket_name:str, index_keys:Iterable[str], workers:int) -> Dict[str, BundledFile]:
+    """
+    Reads bundle indexes, returning the latest bundled copy of each file by object key
+    """
+    files:Dict[str, BundledFile] = {}
+    for index_key, index in _load_indexes(client, bucket_name, index_keys, workers):
+        store_prefix = _store_prefix(index_key)
+        bundle_key = f"{store_prefix}{BUNDLES_DIR}/{index.bundle}"
+        for key, entry in index.files.items():
+            files[store_prefix + key] = BundledFile(bundle_key, entry, index.created)
+    return files
+
+
+def _delete_keys(client, bucket_name:str, keys:List[str]):
+    for i in range(0, len(keys), _DELETE_BATCH_SIZE):
+        batch = keys[i:i + _DELETE_BATCH_SIZE]
+        client.delete_objects(Bucket=bucket_name, Delete={ 'Objects': [{ 'Key': k } for k in batch], 'Quiet': True })
+
+
+def delete_superseded(client, bucket_name:str, store_prefix:str, plain_keys:Collection[str], workers:int) -> int:
+    """
+    Deletes the bundles in `store_prefix` none of whose files are the latest copy, since
+    a newer bundle or a plain object (by object key, in `plain_keys`) holds each of them.
+    Returns the number of bundles deleted.
+    """
+    indexes = _load_indexes(client, bucket_name, list_index_keys(client, bucket_name, [store_prefix]), workers)
+    latest:Dict[str, str] = {}
+    for index_key, index in indexes:
+        for key in index.files:
+            latest[key] = index_key
+
+    superseded = [(index_key, index) for index_key, index in indexes
+                  if all(latest[key] != index_key or store_prefix + key in plain_keys for key in index.files)]
+    # Indexes first, so bundles stop counting before they are gone
+    _delete_keys(client, bucket_name, [index_key for index_key, _ in superseded])
+    _delete_keys(client, bucket_name, [f"{store_prefix}{BUNDLES_DIR}/{index.bundle}" for _, index in superseded])
+    return len(superseded)
+
+
+def group_ranges(files:List[Tuple[BundledFile, str, Path]]) -> Iterator[List[Tuple[BundledFile, str, Path]]]:
+    """
+    Splits (bundled file, relative key, local path) tuples into runs which are each
+    fetched with one ranged GET
+    """
+    by_bundle:Dict[str, List[Tuple[BundledFile, str, Path]]] = {}
+    for f in files:
+        by_bundle.setdefault(f[0].bundle_key, []).append(f)
+
+    for bundle_files in by_bundle.values():
+        bundle_files.sort(key=lambda f: f[0].entry.offset)
+        group = []
+        for f in bundle_files:
+            if group:
+                start = group[0][0].entry.offset
+                end = group[-1][0].entry.offset + group[-1][0].entry.size
+                if f[0].entry.offset - end > RANGE_MERGE_GAP or f[0].entry.offset + f[0].entry.size - start > RANGE_MAX_SIZE:
+                    yield group
+                    group = []
+            group.append(f)
+        if group:
+            yield group
+
+
+def download_range(client, bucket_name:str, files:List[Tuple[BundledFile, str, Path]], part_suffix:str) -> BundleTransfer:
+    """
+    Fetches a run of files of one bundle with a single ranged GET, writing each through
+    a part file which replaces it once its digest is verified
+    """
+    bundle_key = files[0][0].bundle_key
+    start = files[0][0].entry.offset
+    end = files[-1][0].entry.offset + files[-1][0].entry.size
+    body = client.get_object(Bucket=bucket_name, Key=bundle_key, Range=f"bytes={start}-{end - 1}")['Body']
+
+    position = start
+    transferred = []
+    for bundled, key, local_path in files:
+        entry = bundled.entry
+        while position < entry.offset:
+            position += len(body.read(min(entry.offset - position, _READ_BLOCK_SIZE)))
+
+        md5 = hashlib.md5()
+        part_path = local_path.with_name(local_path.name + part_suffix)
+        with open(part_path, 'wb') as f:
+            remaining = entry.size
+            while remaining:
+                data = body.read(min(remaining, _READ_BLOCK_SIZE))
+                if not data:
+                    raise IOError(f"Bundle {bundle_key} ended before {key}")
+                md5.update(data)
+                f.write(data)
+                remaining -= len(data)
+        position += entry.size
+
+        if md5.hexdigest() != entry.digest:
+            part_path.unlink()
+            raise IOError(f"Digest of {key} does not match bundle index of {bundle_key}")
+        os.replace(part_path, local_path)
+        if entry.mtime:
+            os.utime(local_path, times=(entry.mtime, entry.mtime))
+        transferred.append((key, local_path, entry.digest))
+
+    body.close()
+    return BundleTransfer(end - start, transferred)
+
+
+class _BundleReader:
+    """
+    Reads files one after another as a single stream, recording where each one starts
+    and its digest. Not seekable, so boto3 reads it strictly in order.
+    """
+    def __init__(self, files:List[Tuple[str, Path]]):
+        self._files = iter(files)
+        self._current = None
+        self._current_key = ''
+        self._md5 = None
+        self.size = 0
+        self.entries:Dict[str, BundleEntry] = {}
+        self.paths:Dict[str, Path] = {}
+
+    def _next_file(self) -> bool:
+        if self._current:
+            self._current.close()
+            self.entries[self._current_key].digest = self._md5.hexdigest()
+            self._current = None
+        try:
+            key, path = next(self._files)
+        except StopIteration:
+            return False
+        self._current = open(path, 'rb')
+        self._current_key = key
+        self._md5 = hashlib.md5()
+        self.entries[key] = BundleEntry(offset=self.size, size=0, digest='', mtime=os.fstat(self._current.fileno()).st_mtime)
+        self.paths[key] = path
+        return True
+
+    def read(self, size=-1) -> bytes:
+        chunks = []
+        remaining = size if size >= 0 else float('inf')
+        while remaining:
+            if not self._current and not self._next_file():
+                break
+            data = self._current.read(min(remaining, _READ_BLOCK_SIZE))
+            if not data:
+                self._next_file()
+                continue
+            self._md5.update(data)
+            self.entries[self._current_key].size += len(data)
+            self.size += len(data)
+            remaining -= len(data)
+            chunks.append(data)
+        return b''.join(chunks)
+
+
+def upload_bundle(client, bucket_name:str, store_prefix:str, files:List[Tuple[str, Path]], transfer_config,
+                  replaced_keys:List[str]=[]) -> BundleTransfer:
+    """
+    Uploads `files` (relative key, local path) as a bundle in `store_prefix`, then its
+    index. `replaced_keys` are plain objects of the same files, deleted once the bundle
+    is complete so they no longer take precedence.
+    """
+    bundle_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    bundle_key = f"{store_prefix}{BUNDLES_DIR}/{bundle_id}{BUNDLE_SUFFIX}"
+
+    reader = _BundleReader(files)
+    client.upload_fileobj(reader, bucket_name, bundle_key, Config=transfer_config)
+    reader.read()   # Closes the last file
+
+    index = BundleIndex(bundle=bundle_id + BUNDLE_SUFFIX, created=time.time(), files=reader.entries)
+    client.put_object(Bucket=bucket_name, Key=f"{store_prefix}{BUNDLES_DIR}/{bundle_id}{INDEX_SUFFIX}",
+                      Body=index.model_dump_json().encode())
+
+    _delete_keys(client, bucket_name, replaced_keys)
+
+    return BundleTransfer(reader.size, [(key, reader.paths[key], entry.digest) for key, entry in reader.entries.items()])
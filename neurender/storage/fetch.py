@@ -0,0 +1,61 @@
+from pathlib import Path
+from threading import Event, Thread
+from typing import Iterable, List, Optional
+
+from . import S3, StorageError
+from .transfer import TransferSummary
+
+
+class ProjectFetcher:
+    """
+    Downloads the parts of a remote project a pipeline needs in the background, in the
+    order its steps need them, so steps can start as soon as their own files arrive.
+
+    `selections` holds the glob patterns each step reads (see PipelineStep.sources).
+    None stands for the whole project, for steps which do not declare what they read.
+    `exclude` lists project directories which are never downloaded.
+    """
+    def __init__(self, url:str, local_path:Path | str, selections:List[Optional[List[str]]], s3:Optional[S3]=None,
+                 exclude:Iterable[str]=()):
+        self.url = url
+        self.local_path = Path(local_path)
+        self.selections = selections
+        self.exclude = list(exclude)
+        self.s3 = s3 or S3()
+        self.summary = TransferSummary()
+
+        self._fetched = [Event() for _ in selections]
+        self._errors:List[Optional[Exception]] = [None] * len(selections)
+        self._thread:Optional[Thread] = None
+
+    def start(self):
+        self._thread = Thread(target=self._run, name='project-fetcher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        fetched_all = False
+        for i, select in enumerate(self.selections):
+            try:
+                if not fetched_all and (select is None or select):
+                    print(f" ==> Fetching project files: {', '.join(select) if select else 'all files'}")
+                    summary = self.s3.sync_to_local(self.url, self.local_path, select=select or '', exclude=self.exclude)
+                    self.summary.merge(summary)
+                    if not summary.ok:
+                        raise StorageError(f"{len(summary.failed)} project files failed to download")
+                    fetched_all = select is None
+            except Exception as e:
+                self._errors[i] = e
+            finally:
+                self._fetched[i].set()
+
+    def wait(self, index:int):
+        """
+        Blocks until the files of selection `index` are downloaded, raising if they could not be
+        """
+        self._fetched[index].wait()
+        if self._errors[index]:
+            raise StorageError(f"Project files not fetched: {self._errors[index]}")
+
+    def join(self):
+        if self._thread:
+            self._thread.join()
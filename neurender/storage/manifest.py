@@ -0,0 +1,181 @@
+import hashlib
+import os
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional
+from pydantic import BaseModel, PrivateAttr
+
+from ..utils import print_err
+
+MANIFEST_FILE_NAME = ".remote.manifest"
+
+# boto3's default TransferConfig values. The ETag S3 assigns to an object depends on
+# how it was split into parts, so hashers must match the config used for uploads.
+DEFAULT_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+DEFAULT_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+
+_READ_BLOCK_SIZE = 1024 * 1024
+
+
+def normalize_etag(etag:str) -> str:
+    return etag.strip('"') if etag else ''
+
+
+class ETagHasher:
+    """
+    Incrementally computes the MD5 digest of a stream along with the ETag S3 assigns
+    to the same content, which for multipart uploads is the MD5 of the part digests.
+    """
+    def __init__(self, multipart_threshold=DEFAULT_MULTIPART_THRESHOLD, multipart_chunksize=DEFAULT_MULTIPART_CHUNKSIZE):
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.size = 0
+        self._md5 = hashlib.md5()
+        self._part_md5 = hashlib.md5()
+        self._part_size = 0
+        self._part_digests = []
+
+    def update(self, data:bytes):
+        self._md5.update(data)
+        self.size += len(data)
+
+        view = memoryview(data)
+        while view:
+            n = min(len(view), self.multipart_chunksize - self._part_size)
+            self._part_md5.update(view[:n])
+            self._part_size += n
+            view = view[n:]
+            if self._part_size == self.multipart_chunksize:
+                self._part_digests.append(self._part_md5.digest())
+                self._part_md5 = hashlib.md5()
+                self._part_size = 0
+
+    @property
+    def digest(self) -> str:
+        return self._md5.hexdigest()
+
+    @property
+    def etag(self) -> str:
+        if self.size < self.multipart_threshold:
+            return self.digest
+
+        digests = list(self._part_digests)
+        if self._part_size:
+            digests.append(self._part_md5.digest())
+        return f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+
+class HashingReader:
+    """
+    Wraps a readable file, hashing data as it is consumed. Deliberately not seekable,
+    so boto3 reads it strictly in order.
+    """
+    def __init__(self, fileobj, hasher:ETagHasher):
+        self._fileobj = fileobj
+        self.hasher = hasher
+
+    def read(self, size=-1) -> bytes:
+        data = self._fileobj.read(size)
+        self.hasher.update(data)
+        return data
+
+
+class HashingWriter:
+    """
+    Wraps a writable file, hashing data as it is written. Deliberately not seekable,
+    so boto3 writes ranged downloads strictly in order.
+    """
+    def __init__(self, fileobj, hasher:ETagHasher):
+        self._fileobj = fileobj
+        self.hasher = hasher
+
+    def write(self, data:bytes) -> int:
+        self.hasher.update(data)
+        return self._fileobj.write(data)
+
+
+def hash_file(path:Path | str, hasher:Optional[ETagHasher]=None) -> ETagHasher:
+    hasher = hasher or ETagHasher()
+    with open(path, 'rb') as f:
+        while block := f.read(_READ_BLOCK_SIZE):
+            hasher.update(block)
+    return hasher
+
+
+class ManifestEntry(BaseModel):
+    size:int
+    # ETag of the remote object, without quotes
+    etag:str = ''
+    # MD5 of the local file content
+    digest:str = ''
+    # Local modification time when the entry was recorded
+    mtime_ns:int = 0
+
+
+class SyncManifest(BaseModel):
+    """
+    Record of the files last synced between a local directory and the remote `url`,
+    keyed by path relative to the directory. Lets a re-sync skip unchanged files with
+    a stat instead of a transfer, and survive copies which only touch modification times.
+    """
+    url:str = ''
+    entries:Dict[str, ManifestEntry] = {}
+
+    # Entries are recorded from transfer callbacks
+    _lock:Lock = PrivateAttr(default_factory=Lock)
+
+    @staticmethod
+    def load(directory:Path | str, url:str) -> "SyncManifest":
+        path = Path(directory) / MANIFEST_FILE_NAME
+        try:
+            # Stored as JSON rather than YAML, since large projects hold tens of thousands of entries
+            manifest = SyncManifest.model_validate_json(path.read_bytes())
+            if manifest.url == url:
+                return manifest
+            print(f"  ** Sync manifest in {directory} is for {manifest.url}, ignoring")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print_err("Sync manifest not loaded:", e)
+        return SyncManifest(url=url)
+
+    def save(self, directory:Path | str):
+        path = Path(directory) / MANIFEST_FILE_NAME
+        tmp_path = path.with_name(path.name + '.tmp')
+        with self._lock:
+            tmp_path.write_text(self.model_dump_json())
+        os.replace(tmp_path, path)
+
+    def record(self, key:str, local_path:Path, etag:str, digest:str):
+        stat = os.stat(local_path)
+        entry = ManifestEntry(size=stat.st_size, etag=normalize_etag(etag), digest=digest, mtime_ns=stat.st_mtime_ns)
+        with self._lock:
+            self.entries[key] = entry
+
+    def is_synced(self, key:str, local_path:Path, size:int, etag:str, hasher:Optional[ETagHasher]=None) -> bool:
+        """
+        Returns True if the local file at `local_path` holds the same content as the
+        remote object (`size`, `etag`). Unchanged files are decided from the manifest
+        entry and a stat; the file is only read when its stat no longer matches, using
+        `hasher` (configured with the upload part size) to reproduce multipart ETags.
+        """
+        etag = normalize_etag(etag)
+        try:
+            stat = os.stat(local_path)
+        except FileNotFoundError:
+            return False
+
+        if stat.st_size != size:
+            return False
+
+        entry = self.entries.get(key)
+        if entry and entry.size == size and entry.etag == etag and entry.mtime_ns == stat.st_mtime_ns:
+            return True
+
+        # Modification time changed or no record of the file: compare content digests
+        hasher = hash_file(local_path, hasher)
+        matches = etag in (hasher.digest, hasher.etag)
+        matches |= bool(entry) and entry.etag == etag and entry.digest == hasher.digest
+        if matches:
+            self.record(key, local_path, etag, hasher.digest)
+        return matches
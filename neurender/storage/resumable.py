@@ -0,0 +1,195 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Dict, Optional
+from pydantic import BaseModel
+
+from ..utils import print_err
+from .manifest import ETagHasher, HashingWriter, hash_file, normalize_etag
+
+# In-progress downloads are written next to their destination, and renamed into place once complete
+PART_SUFFIX = '.part'
+PART_STATE_SUFFIX = '.part.state'
+
+_READ_BLOCK_SIZE = 1024 * 1024
+
+
+def part_path(local_path:Path) -> Path:
+    return local_path.with_name(local_path.name + PART_SUFFIX)
+
+def part_state_path(local_path:Path) -> Path:
+    return local_path.with_name(local_path.name + PART_STATE_SUFFIX)
+
+
+class PartialDownload(BaseModel):
+    etag:str
+    # Length of the .part file prefix known to be on disk
+    offset:int = 0
+
+    @staticmethod
+    def load(path:Path) -> Optional["PartialDownload"]:
+        try:
+            return PartialDownload.model_validate_json(path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print_err(f"Ignoring partial download state {path}:", e)
+            return None
+
+    def save(self, path:Path):
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_text(self.model_dump_json())
+        os.replace(tmp_path, path)
+
+
+class CheckpointWriter(HashingWriter):
+    """
+    Hashing writer for in-order downloads which periodically flushes the written
+    prefix to disk and records its length, so an interrupted download can resume
+    from the last checkpoint rather than from the start.
+    """
+    def __init__(self, fileobj, hasher:ETagHasher, state_path:Path, etag:str, offset:int, checkpoint_bytes:int):
+        super().__init__(fileobj, hasher)
+        self._state = PartialDownload(etag=etag, offset=offset)
+        self._state_path = state_path
+        self._checkpoint_bytes = checkpoint_bytes
+        self.offset = offset
+
+    def write(self, data:bytes) -> int:
+        written = super().write(data)
+        self.offset += len(data)
+        if self.offset - self._state.offset >= self._checkpoint_bytes:
+            self.checkpoint()
+        return written
+
+    def checkpoint(self):
+        self._fileobj.flush()
+        os.fsync(self._fileobj.fileno())
+        self._state.offset = self.offset
+        self._state.save(self._state_path)
+
+
+def _resume_offset(local_path:Path, etag:str, hasher:ETagHasher) -> int:
+    """
+    Returns the offset to resume a download of the object version `etag` into
+    `local_path`'s .part file from, after truncating it to the last checkpoint and
+    hashing the retained prefix. Returns 0 if there is nothing to resume.
+    """
+    state = PartialDownload.load(part_state_path(local_path))
+    path = part_path(local_path)
+    if not state or normalize_etag(state.etag) != normalize_etag(etag) or not path.exists():
+        return 0
+    if path.stat().st_size < state.offset:
+        return 0
+
+    os.truncate(path, state.offset)
+    hash_file(path, hasher)
+    return state.offset
+
+
+def download_resumable(s3, bucket_name:str, file_key:str, local_path:Path, size:int, etag:str,
+                       transfer_config, new_hasher, checkpoint_bytes:int) -> ETagHasher:
+    """
+    Downloads an object to `local_path` through a .part file which is atomically renamed
+    into place once complete. If a previous download of the same object version was
+    interrupted, only the bytes after its last checkpoint are fetched.
+    """
+    hasher = new_hasher()
+    offset = _resume_offset(local_path, etag, hasher)
+    path = part_path(local_path)
+    state_path = part_state_path(local_path)
+
+    if offset:
+        print(f" ==> Resuming download of {file_key} at {offset}/{size} bytes")
+        try:
+            with open(path, 'r+b') as f:
+                f.seek(offset)
+                writer = CheckpointWriter(f, hasher, state_path, etag, offset, checkpoint_bytes)
+                if offset < size:
+                    # IfMatch fails the request if the object changed since the download began
+                    response = s3.get_object(Bucket=bucket_name, Key=file_key, Range=f'bytes={offset}-', IfMatch=etag)
+                    for chunk in response['Body'].iter_chunks(_READ_BLOCK_SIZE):
+                        writer.write(chunk)
+        except s3.exceptions.ClientError as e:
+            print_err(f"Could not resume download of {file_key}, restarting: {e}")
+            offset = 0
+            hasher = new_hasher()
+
+    if not offset:
+        with open(path, 'wb') as f:
+            writer = CheckpointWriter(f, hasher, state_path, etag, 0, checkpoint_bytes)
+            s3.download_fileobj(bucket_name, file_key, writer, Config=transfer_config)
+
+    os.replace(path, local_path)
+    state_path.unlink(missing_ok=True)
+    return hasher
+
+
+def _find_multipart_upload(s3, bucket_name:str, file_key:str) -> Optional[str]:
+    # Most recently started incomplete upload of the key, if any
+    uploads = s3.list_multipart_uploads(Bucket=bucket_name, Prefix=file_key).get('Uploads', [])
+    uploads = [u for u in uploads if u['Key'] == file_key]
+    if not uploads:
+        return None
+    return max(uploads, key=lambda u: u['Initiated'])['UploadId']
+
+def _list_uploaded_parts(s3, bucket_name:str, file_key:str, upload_id:str) -> Dict[int, dict]:
+    parts = {}
+    paginator = s3.get_paginator('list_parts')
+    for page in paginator.paginate(Bucket=bucket_name, Key=file_key, UploadId=upload_id):
+        for part in page.get('Parts', []):
+            parts[part['PartNumber']] = part
+    return parts
+
+
+def upload_multipart_resumable(s3, file_path:Path, bucket_name:str, file_key:str,
+                               hasher:ETagHasher, part_concurrency:int) -> ETagHasher:
+    """
+    Uploads a file as a multipart upload with parts of `hasher.multipart_chunksize`.
+    If an earlier upload of the same key was interrupted, its upload is continued:
+    parts already uploaded with identical content are kept rather than sent again.
+
+    The file is read once, in order, hashing it along the way. Up to
+    `part_concurrency` parts are uploaded in parallel.
+    """
+    upload_id = _find_multipart_upload(s3, bucket_name, file_key)
+    uploaded_parts = {}
+    if upload_id:
+        uploaded_parts = _list_uploaded_parts(s3, bucket_name, file_key, upload_id)
+        print(f" ==> Resuming upload of {file_key} ({len(uploaded_parts)} parts already uploaded)")
+    else:
+        upload_id = s3.create_multipart_upload(Bucket=bucket_name, Key=file_key)['UploadId']
+
+    chunk_size = hasher.multipart_chunksize
+    completed = {}
+    in_flight = set()
+
+    def upload_part(part_number:int, data:bytes):
+        response = s3.upload_part(Bucket=bucket_name, Key=file_key, UploadId=upload_id, PartNumber=part_number, Body=data)
+        completed[part_number] = response['ETag']
+
+    with ThreadPoolExecutor(max_workers=part_concurrency, thread_name_prefix='upload-part') as executor:
+        with open(file_path, 'rb') as f:
+            part_number = 1
+            while data := f.read(chunk_size):
+                hasher.update(data)
+
+                existing = uploaded_parts.get(part_number)
+                if existing and existing['Size'] == len(data) and normalize_etag(existing['ETag']) == hashlib.md5(data).hexdigest():
+                    completed[part_number] = existing['ETag']
+                else:
+                    # Bound the parts held in memory
+                    if len(in_flight) >= part_concurrency:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                    in_flight.add(executor.submit(upload_part, part_number, data))
+                part_number += 1
+
+        for future in in_flight:
+            future.result()
+
+    parts = [{'PartNumber': n, 'ETag': completed[n]} for n in sorted(completed)]
+    s3.complete_multipart_upload(Bucket=bucket_name, Key=file_key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+    return hasher
@@ -0,0 +1,100 @@
+import glob
+import time
+from pathlib import Path
+from threading import Event, Thread
+from typing import Dict, List, Optional, Tuple
+
+from ..utils import print_err
+from ..utils.files import GlobMatcher, iter_files
+from . import S3, METADATA_FILE_NAMES, METADATA_FILE_SUFFIXES
+from .transfer import TransferSummary
+
+
+class ArtifactStreamer:
+    """
+    Uploads files matching `select` from `local_path` to `url` in the background while
+    they are being produced, such as training checkpoints, so the upload after a pipeline
+    only sends what changed since.
+
+    The directory is scanned every `interval_s`. A file is uploaded once its size and
+    modification time are unchanged across two scans and it is at least `stable_s` old,
+    and uploaded again if it changes afterwards.
+    """
+    def __init__(self, local_path:Path | str, url:str, select:List[str], interval_s:float=30, stable_s:float=10, s3:Optional[S3]=None):
+        self.local_path = Path(local_path)
+        self.url = url
+        self.select = select
+        self.interval_s = interval_s
+        self.stable_s = stable_s
+        self.s3 = s3 or S3()
+        self.summary = TransferSummary()
+
+        self._matcher = GlobMatcher(select)
+        # (size, mtime_ns) of each file at the last scan, and when last uploaded
+        self._seen:Dict[str, Tuple[int, int]] = {}
+        self._uploaded:Dict[str, Tuple[int, int]] = {}
+        self._stopped = Event()
+        self._thread:Optional[Thread] = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def start(self):
+        print(f"Streaming artifacts in {self.local_path} to {self.url} every {self.interval_s}s: {', '.join(self.select)}")
+        self._thread = Thread(target=self._run, name='artifact-streamer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops scanning, after any upload in progress. Files which were not yet stable
+        are left to the final upload.
+        """
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        if self.summary.transferred or self.summary.failed:
+            self.summary.print("Streamed upload")
+
+    def _run(self):
+        while not self._stopped.wait(self.interval_s):
+            try:
+                self.poll()
+            except Exception as e:
+                # Retried on the next scan, and by the final upload
+                print_err("Artifact streaming error:", e)
+
+    def _scan_stable_files(self) -> Dict[str, Tuple[int, int]]:
+        stable = {}
+        seen = {}
+        now_ns = time.time_ns()
+        for key, entry in iter_files(self.local_path, self._matcher, exclude_names=METADATA_FILE_NAMES, exclude_suffixes=METADATA_FILE_SUFFIXES):
+            stat = entry.stat()
+            state = (stat.st_size, stat.st_mtime_ns)
+            seen[key] = state
+            if self._seen.get(key) == state and self._uploaded.get(key) != state \
+                    and now_ns - stat.st_mtime_ns >= self.stable_s * 1e9:
+                stable[key] = state
+        self._seen = seen
+        return stable
+
+    def poll(self):
+        """
+        Scans for stable files, and uploads those which changed since they were last uploaded
+        """
+        stable = self._scan_stable_files()
+        if not stable:
+            return
+
+        print(f" ==> Streaming {len(stable)} stable artifacts to {self.url}")
+        # Literal paths, so each selects exactly one file
+        summary = self.s3.sync_to_remote(self.local_path, self.url, select=[glob.escape(key) for key in stable])
+        self.summary.merge(summary)
+
+        failed = {failure.path for failure in summary.failed}
+        for key, state in stable.items():
+            if str(self.local_path / key) not in failed:
+                self._uploaded[key] = state
@@ -0,0 +1,111 @@
+from collections import defaultdict
+from threading import Lock
+from typing import Dict, List
+from pydantic import BaseModel
+
+MB = 1024 * 1024
+
+
+class TransferRecord(BaseModel):
+    path:str
+    direction:str
+    bytes:int = 0
+    # Time from being queued until a worker started the transfer
+    queue_wait_s:float = 0
+    duration_s:float = 0
+    retries:int = 0
+    ok:bool = True
+    # time.monotonic() at start and end, to measure aggregate throughput
+    started_at:float = 0
+    finished_at:float = 0
+
+
+class Percentiles(BaseModel):
+    p50:float = 0
+    p95:float = 0
+    p99:float = 0
+    max:float = 0
+
+    @staticmethod
+    def of(values:List[float]) -> "Percentiles":
+        if not values:
+            return Percentiles()
+        values = sorted(values)
+        # Nearest rank
+        rank = lambda p: values[min(len(values) - 1, int(p / 100 * len(values)))]
+        return Percentiles(p50=rank(50), p95=rank(95), p99=rank(99), max=values[-1])
+
+
+class DirectionStats(BaseModel):
+    files:int = 0
+    failed:int = 0
+    bytes:int = 0
+    retries:int = 0
+    # From the first transfer starting to the last one finishing
+    wall_time_s:float = 0
+    throughput_mb_s:float = 0
+    latency_s:Percentiles = Percentiles()
+    queue_wait_s:Percentiles = Percentiles()
+
+    @staticmethod
+    def of(records:List[TransferRecord]) -> "DirectionStats":
+        wall_time = max(r.finished_at for r in records) - min(r.started_at for r in records)
+        total_bytes = sum(r.bytes for r in records)
+        return DirectionStats(
+            files=len(records),
+            failed=sum(not r.ok for r in records),
+            bytes=total_bytes,
+            retries=sum(r.retries for r in records),
+            wall_time_s=wall_time,
+            throughput_mb_s=total_bytes / MB / wall_time if wall_time > 0 else 0,
+            latency_s=Percentiles.of([r.duration_s for r in records]),
+            queue_wait_s=Percentiles.of([r.queue_wait_s for r in records]),
+        )
+
+    def __str__(self):
+        return (f"{self.files} files ({self.failed} failed), {self.bytes / MB:.1f} MB in {self.wall_time_s:.1f}s "
+                f"= {self.throughput_mb_s:.2f} MB/s, latency p50/p95/p99 "
+                f"{self.latency_s.p50:.3f}/{self.latency_s.p95:.3f}/{self.latency_s.p99:.3f}s, "
+                f"queue wait p95 {self.queue_wait_s.p95:.3f}s, {self.retries} retries")
+
+
+class TransferReport(BaseModel):
+    """
+    Aggregate transfer statistics, keyed by direction ('download' or 'upload')
+    """
+    directions:Dict[str, DirectionStats] = {}
+
+    @staticmethod
+    def of(records:List[TransferRecord]) -> "TransferReport":
+        by_direction = defaultdict(list)
+        for record in records:
+            by_direction[record.direction].append(record)
+        return TransferReport(directions={ d: DirectionStats.of(r) for d, r in by_direction.items() })
+
+
+class RetryTracker:
+    """
+    Counts retries botocore makes on behalf of each object key, including retries of
+    the individual part requests boto3 issues for multipart transfers.
+    """
+    def __init__(self):
+        self._counts:Dict[str, int] = defaultdict(int)
+        self._lock = Lock()
+
+    def attach(self, client):
+        client.meta.events.register('before-parameter-build.s3', self._on_request)
+        client.meta.events.register('after-call.s3', self._on_response)
+
+    def _on_request(self, params, context, **kwargs):
+        context['transfer_key'] = params.get('Key')
+
+    def _on_response(self, parsed, context, **kwargs):
+        retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        key = context.get('transfer_key')
+        if retries and key:
+            with self._lock:
+                self._counts[key] += retries
+
+    def pop(self, key:str) -> int:
+        with self._lock:
+            return self._counts.pop(key, 0)
@@ -0,0 +1,148 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from typing import Callable, Iterable, List, Optional, Tuple
+from pydantic import BaseModel
+
+from ..utils import print_err
+from .telemetry import RetryTracker, TransferRecord, TransferReport
+
+
+class TransferFailure(BaseModel):
+    path:str
+    error:str
+
+
+class TransferSummary(BaseModel):
+    transferred:int = 0
+    skipped:int = 0
+    failed:List[TransferFailure] = []
+    records:List[TransferRecord] = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def merge(self, other:"TransferSummary"):
+        self.transferred += other.transferred
+        self.skipped += other.skipped
+        self.failed += other.failed
+        self.records += other.records
+
+    def report(self) -> TransferReport:
+        return TransferReport.of(self.records)
+
+    def print(self, label='Transfer'):
+        print(f"{label} summary: {self.transferred} transferred, {self.skipped} up to date, {len(self.failed)} failed")
+        for direction, stats in self.report().directions.items():
+            print(f"  => {direction}: {stats}")
+        for failure in self.failed:
+            print_err(f"  => Failed: {failure.path}: {failure.error}")
+
+
+class TransferTask:
+    """
+    A single file transfer: `func(*args)`, with `callback` receiving its result.
+    `path` identifies the file in summaries, and `key` is the object key, used to
+    attribute retries.
+    """
+    def __init__(self, path:str, func:Callable, args:Tuple=(), callback:Optional[Callable]=None, direction='', key=''):
+        self.path = path
+        self.func = func
+        self.args = args
+        self.callback = callback
+        self.direction = direction
+        self.key = key
+        self.queued_at = 0.0
+        self.started_at = 0.0
+        self.finished_at = 0.0
+
+    def queue(self):
+        self.queued_at = time.monotonic()
+
+    def execute(self):
+        self.started_at = time.monotonic()
+        try:
+            return self.func(*self.args)
+        finally:
+            self.finished_at = time.monotonic()
+
+    def finish(self, summary:TransferSummary, get_result:Callable, retries:Optional[RetryTracker]=None):
+        """
+        Records the outcome of the executed task in `summary`. `get_result` returns the
+        result of execute(), or raises its exception.
+        """
+        record = TransferRecord(path=self.path,
+                                direction=self.direction,
+                                queue_wait_s=self.started_at - self.queued_at,
+                                duration_s=self.finished_at - self.started_at,
+                                retries=retries.pop(self.key) if retries else 0,
+                                started_at=self.started_at,
+                                finished_at=self.finished_at)
+        try:
+            result = get_result()
+            record.bytes = getattr(result, 'size', 0)
+            if self.callback:
+                self.callback(result)
+        except Exception as e:
+            print_err(f"Transfer failed for {self.path}: {e}")
+            record.ok = False
+            summary.failed.append(TransferFailure(path=self.path, error=str(e)))
+        else:
+            summary.transferred += 1
+        summary.records.append(record)
+
+
+class TransferEngine:
+    """
+    Runs file transfers on a thread pool. Transfers share the caller's boto3 client,
+    which is thread safe, so connections are pooled across files instead of being
+    set up for each one.
+
+    Submitting blocks once `queue_size` transfers are pending, so listings are
+    consumed at the pace transfers complete. Failures are collected in `summary`
+    rather than aborting the remaining transfers.
+    """
+    def __init__(self, worker_count=8, queue_size=0, retries:Optional[RetryTracker]=None):
+        self.summary = TransferSummary()
+        self._executor = ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix='transfer')
+        self._pending = BoundedSemaphore(queue_size or worker_count * 2)
+        self._retries = retries
+        self._lock = Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self._executor.shutdown(wait=True)
+
+    def run(self, tasks:Iterable[Optional[TransferTask]]):
+        """
+        Submits each task as it is produced. None marks a file which was up to date.
+        """
+        for task in tasks:
+            if task is None:
+                self.skip()
+            else:
+                self.submit(task)
+
+    def skip(self):
+        with self._lock:
+            self.summary.skipped += 1
+
+    def submit(self, task:TransferTask):
+        self._pending.acquire()
+        task.queue()
+        try:
+            future = self._executor.submit(task.execute)
+        except:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda f: self._on_done(task, f))
+
+    def _on_done(self, task:TransferTask, future:Future):
+        try:
+            with self._lock:
+                task.finish(self.summary, future.result, self._retries)
+        finally:
+            self._pending.release()
@@ -0,0 +1,205 @@
+"""
+Multi-threaded, streaming tar compression.
+
+gzip archives are compressed in blocks on a thread pool, the way pigz does it: each
+block is deflated independently, primed with the end of the previous block as a
+dictionary, and the results are concatenated into one ordinary gzip stream which any
+gzip/tar can read. zlib releases the GIL while compressing, so blocks compress in
+parallel. zstd archives use zstandard's own worker threads, if it is installed.
+
+Archives are written to and read from file objects, so they can be streamed to and
+from S3 (see storage.archive) without a temporary file.
+"""
+import gzip
+import os
+import struct
+import tarfile
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import Literal, Optional
+
+ArchiveFormat = Literal['gz', 'zst']
+
+ARCHIVE_SUFFIXES = { 'gz': '.tar.gz', 'zst': '.tar.zst' }
+DEFAULT_LEVELS = { 'gz': 6, 'zst': 3 }
+
+# Uncompressed size of the blocks compressed in parallel
+GZIP_BLOCK_SIZE = 1024 * 1024
+# Deflate back-references reach at most 32KB, so that much of the previous block primes the next
+_DICTIONARY_SIZE = 32 * 1024
+
+
+def archive_format(path:str) -> ArchiveFormat:
+    """
+    The format of an archive, from its file name
+    """
+    if path.endswith(('.tar.gz', '.tgz')):
+        return 'gz'
+    if path.endswith('.tar.zst'):
+        return 'zst'
+    raise ValueError(f"{path} is not a .tar.gz or .tar.zst archive")
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd archives require the zstandard package")
+    return zstandard
+
+
+def _deflate_block(data:bytes, dictionary:bytes, level:int, last:bool) -> bytes:
+    # Raw deflate, so blocks join into one stream. Non-final blocks end with a sync
+    # flush, which byte-aligns them without marking the end of the stream.
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipWriter:
+    """
+    Write-only file object gzip compressing what is written to `fileobj`, with blocks
+    compressed on `threads` threads (all cores by default). Output is written in order
+    as blocks complete, holding at most two blocks per thread in memory.
+    """
+    def __init__(self, fileobj, level=6, threads=0, block_size=GZIP_BLOCK_SIZE):
+        self._fileobj = fileobj
+        self._level = level
+        self._block_size = block_size
+        threads = threads or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='gzip')
+        self._max_pending = threads * 2
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._dictionary = b''
+        self._crc = 0
+        self._size = 0
+        self.closed = False
+
+        # Header: magic, deflate, no flags, mtime, no extra flags, unknown OS
+        fileobj.write(b'\x1f\x8b\x08\x00' + struct.pack('<I', int(time.time())) + b'\x00\xff')
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._block_size:
+            block = bytes(self._buffer[:self._block_size])
+            del self._buffer[:self._block_size]
+            self._submit(block, last=False)
+        return len(data)
+
+    def _submit(self, block:bytes, last:bool):
+        self._crc = zlib.crc32(block, self._crc)
+        self._size += len(block)
+        self._pending.append(self._executor.submit(_deflate_block, block, self._dictionary, self._level, last))
+        self._dictionary = block[-_DICTIONARY_SIZE:]
+
+        while len(self._pending) >= self._max_pending or (self._pending and self._pending[0].done()):
+            self._fileobj.write(self._pending.popleft().result())
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._submit(bytes(self._buffer), last=True)
+            while self._pending:
+                self._fileobj.write(self._pending.popleft().result())
+            self._fileobj.write(struct.pack('<II', self._crc & 0xffffffff, self._size & 0xffffffff))
+        finally:
+            self._executor.shutdown()
+
+    def abort(self):
+        self.closed = True
+        self._executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type:
+            self.abort()
+        else:
+            self.close()
+
+
+def open_compressor(fileobj, format:ArchiveFormat='gz', level:Optional[int]=None, threads=0):
+    """
+    Opens a write-only file object compressing into `fileobj`, which it does not close
+    """
+    level = DEFAULT_LEVELS[format] if level is None else level
+    if format == 'zst':
+        zstandard = _import_zstandard()
+        return zstandard.ZstdCompressor(level=level, threads=threads or -1).stream_writer(fileobj, closefd=False)
+    return ParallelGzipWriter(fileobj, level, threads)
+
+
+def open_decompressor(fileobj, format:ArchiveFormat='gz'):
+    """
+    Opens a read-only file object decompressing `fileobj` as it is read
+    """
+    if format == 'zst':
+        return _import_zstandard().ZstdDecompressor().stream_reader(fileobj, closefd=False)
+    return gzip.GzipFile(fileobj=fileobj, mode='rb')
+
+
+def write_tar(src:Path, fileobj, format:ArchiveFormat='gz', level:Optional[int]=None, threads=0, arcname:Optional[str]=None) -> int:
+    """
+    Streams a compressed tarball of `src` into `fileobj`. Entries are under `arcname`,
+    by default the name of `src` as with `tar -czf`, or at the root of the archive if
+    `arcname` is ''. Returns the number of files archived.
+    """
+    src = Path(src)
+    files = 0
+    def count(info:tarfile.TarInfo) -> tarfile.TarInfo:
+        nonlocal files
+        files += info.isfile()
+        return info
+
+    with open_compressor(fileobj, format, level, threads) as compressed:
+        with tarfile.open(fileobj=compressed, mode='w|') as tar:
+            if arcname == '' and src.is_dir():
+                for child in sorted(src.iterdir()):
+                    tar.add(child, arcname=child.name, filter=count)
+            else:
+                tar.add(src, arcname=src.name if arcname is None else arcname, filter=count)
+    return files
+
+
+def _check_member(member:tarfile.TarInfo):
+    # Without tarfile.data_filter, only plain files and directories within `dst` are extracted
+    path = PurePosixPath(member.name)
+    if path.is_absolute() or '..' in path.parts:
+        raise tarfile.TarError(f"{member.name} is outside the destination")
+    if not (member.isfile() or member.isdir()):
+        raise tarfile.TarError(f"{member.name} is a link or special file")
+
+
+def extract_tar(fileobj, dst:Path, format:ArchiveFormat='gz') -> int:
+    """
+    Extracts a compressed tarball into `dst` as it is read from `fileobj`, in one pass.
+    Returns the number of files extracted. Raises tarfile.TarError for members which
+    would be written outside `dst`, and for links and special files where Python lacks
+    the 'data' extraction filter.
+    """
+    dst = Path(dst)
+    dst.mkdir(parents=True, exist_ok=True)
+    files = 0
+    with open_decompressor(fileobj, format) as decompressed:
+        with tarfile.open(fileobj=decompressed, mode='r|') as tar:
+            for member in tar:
+                # The 'data' filter rejects absolute paths, links out of `dst` and special files
+                if hasattr(tarfile, 'data_filter'):
+                    tar.extract(member, dst, filter='data')
+                else:
+                    _check_member(member)
+                    tar.extract(member, dst)
+                files += member.isfile()
+    return files
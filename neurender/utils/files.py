@@ -1,6 +1,31 @@
+import os
+import re
 from pathlib import Path
 from datetime import datetime as dt
 from datetime import timezone
+from typing import Iterable, Iterator, List, Tuple
+
+# Image formats of the media the pipeline stages and aligns
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp')
+
+def list_images(directory:Path) -> List[Path]:
+    # Images directly within `directory`, sorted by name
+    return sorted(p for p in directory.iterdir() if p.is_file() and p.suffix.lower() in IMAGE_SUFFIXES)
+
+def disk_usage(path:Path | str) -> int:
+    """
+    Bytes allocated to the files under `path`, counting files hardlinked within it once
+    """
+    inodes = set()
+    usage = 0
+    for _, entry in iter_files(path):
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_nlink > 1:
+            if (stat.st_dev, stat.st_ino) in inodes:
+                continue
+            inodes.add((stat.st_dev, stat.st_ino))
+        usage += stat.st_blocks * 512 if hasattr(stat, 'st_blocks') else stat.st_size
+    return usage
 
 def get_last_modified(path:Path | str, tz=None):
     timestamp = Path(path).stat().st_mtime
@@ -8,3 +33,124 @@ def get_last_modified(path:Path | str, tz=None):
         tz = timezone.utc
     return dt.fromtimestamp(timestamp, tz=tz)
 
+
+_GLOB_CHARS = re.compile(r'[*?\[]')
+
+def glob_to_regex(pattern:str) -> str:
+    """
+    Translates a glob pattern over '/' separated relative paths into a regex.
+    Unlike fnmatch, '*' and '?' do not cross directory boundaries, and '**/' matches
+    zero or more directories, so 'media/**/*' also matches files directly in 'media'.
+    """
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+        if c == '*':
+            regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif c == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1:
+                regex += re.escape(c)
+            else:
+                chars = pattern[i + 1:end]
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                regex += f'[{chars}]'
+                i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+    return regex
+
+
+class GlobMatcher:
+    """
+    Matches relative paths against a set of glob patterns, compiled once into a
+    single regex. Also tells which directories can contain a match, so walks can
+    skip unrelated subtrees.
+    """
+    def __init__(self, patterns:str | Iterable[str]):
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        self.patterns:List[str] = [p.strip('/') for p in patterns]
+        self._regex = re.compile('|'.join(f'(?:{glob_to_regex(p)})' for p in self.patterns) + r'\Z')
+        self._literal_prefixes = [self._literal_prefix(p) for p in self.patterns]
+
+    @staticmethod
+    def _literal_prefix(pattern:str) -> Tuple[List[str], bool]:
+        # Leading path segments without wildcards, and whether that is the whole pattern
+        parts = pattern.split('/')
+        for i, part in enumerate(parts):
+            if _GLOB_CHARS.search(part):
+                return parts[:i], False
+        return parts, True
+
+    @property
+    def common_directory(self) -> str:
+        """
+        The deepest directory containing every match, as a prefix ending with '/', or ''
+        """
+        directories = [prefix if not is_literal else prefix[:-1] for prefix, is_literal in self._literal_prefixes]
+        common = []
+        for parts in zip(*directories):
+            if any(part != parts[0] for part in parts):
+                break
+            common.append(parts[0])
+        return ''.join(part + '/' for part in common)
+
+    def matches(self, relative_path:str) -> bool:
+        return self._regex.match(relative_path) is not None
+
+    def may_contain(self, relative_dir:str) -> bool:
+        dir_parts = relative_dir.split('/') if relative_dir else []
+        for prefix, is_literal in self._literal_prefixes:
+            n = min(len(dir_parts), len(prefix))
+            if dir_parts[:n] != prefix[:n]:
+                continue
+            if is_literal and len(dir_parts) >= len(prefix):
+                continue
+            return True
+        return False
+
+
+def iter_files(root:Path | str, matcher:GlobMatcher=None, exclude_names:Iterable[str]=(), exclude_suffixes:Tuple[str, ...]=(),
+               exclude_dirs:Iterable[str]=()) -> Iterator[Tuple[str, os.DirEntry]]:
+    """
+    Walks `root` with os.scandir, yielding (relative posix path, DirEntry) for each file
+    matching `matcher`. Directories which cannot contain a match are not descended into,
+    and directory symlinks are not followed. `exclude_names` are skipped at any depth,
+    `exclude_dirs` are relative paths of directories which are skipped.
+    """
+    exclude_names = set(exclude_names)
+    exclude_dirs = set(exclude_dirs)
+    stack = ['']
+    while stack:
+        relative_dir = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, relative_dir))
+        except FileNotFoundError:
+            continue
+
+        with entries:
+            for entry in entries:
+                if entry.name in exclude_names or (exclude_suffixes and entry.name.endswith(exclude_suffixes)):
+                    continue
+                relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if relative_path in exclude_dirs:
+                        continue
+                    if not matcher or matcher.may_contain(relative_path):
+                        stack.append(relative_path)
+                elif entry.is_file() and (not matcher or matcher.matches(relative_path)):
+                    yield relative_path, entry
@@ -3,7 +3,6 @@ from pathlib import Path
 from typing import Type, TypeVar, Union, Annotated, List
 from pydantic import BaseModel, Field, ValidationError
 from pydantic_core import core_schema
-from pydantic_yaml import parse_yaml_file_as, to_yaml_file
 # from pydantic_yaml.loader import T as TModel
 
 def inject_classname_field(cls:BaseModel, field_name:str):
@@ -51,6 +50,8 @@ FileLike = Path | str | IOBase
     
 TModel = TypeVar("TModel", bound=BaseModel)
 def read_yaml_file(cls:Type[TModel], file:FileLike) -> TModel:
+    # pydantic_yaml (and its YAML parser) is only imported by commands reading files
+    from pydantic_yaml import parse_yaml_file_as
     try:
         return parse_yaml_file_as(cls, file)
     except ValidationError as e:
@@ -62,6 +63,7 @@ def read_yaml_file(cls:Type[TModel], file:FileLike) -> TModel:
         raise e
         
 def write_yaml_file(model:BaseModel, file:FileLike):
+    from pydantic_yaml import to_yaml_file
     to_yaml_file(file, model)
         
         
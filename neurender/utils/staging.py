@@ -0,0 +1,109 @@
+import os
+import shutil
+from pathlib import Path
+from threading import Lock
+from typing import Optional, Set, Tuple
+from pydantic import BaseModel, PrivateAttr
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where files are hardlinked or copied
+    fcntl = None
+
+# ioctl cloning a file's extents into another (Linux: btrfs, xfs, overlayfs on those, ...)
+FICLONE = 0x40049409
+
+MB = 1024 * 1024
+
+# (source device, destination device) pairs known not to support each method, so
+# unsupported filesystems fail once rather than once per file
+_no_reflink:Set[Tuple[int, int]] = set()
+_no_hardlink:Set[Tuple[int, int]] = set()
+
+
+class StagingStats(BaseModel):
+    reflinked:int = 0
+    hardlinked:int = 0
+    copied:int = 0
+    # Bytes actually written, by copies
+    bytes_copied:int = 0
+
+    _lock:Lock = PrivateAttr(default_factory=Lock)
+
+    def add(self, method:str, size:int):
+        with self._lock:
+            if method == 'reflink':
+                self.reflinked += 1
+            elif method == 'hardlink':
+                self.hardlinked += 1
+            else:
+                self.copied += 1
+                self.bytes_copied += size
+
+    def __str__(self):
+        return (f"{self.reflinked} reflinked, {self.hardlinked} hardlinked, {self.copied} copied "
+                f"({self.bytes_copied / MB:.1f} MB copied)")
+
+
+def stage_file(src:Path | str, dst:Path | str, stats:Optional[StagingStats]=None, hardlink=True) -> str:
+    """
+    Places the content of `src` at `dst` without copying bytes where possible: as a
+    copy-on-write reflink, else as a hardlink (unless `hardlink` is False), and only
+    copies as a last resort. An existing `dst` is replaced rather than written through.
+
+    Hardlinked files share content with `src`, so must be replaced rather than modified.
+    Returns the method used, 'reflink', 'hardlink' or 'copy'.
+    """
+    src, dst = Path(src), Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    dst.unlink(missing_ok=True)
+    src_stat = os.stat(src)
+    devices = (src_stat.st_dev, os.stat(dst.parent).st_dev)
+
+    if fcntl and devices not in _no_reflink and _try_reflink(src, dst, devices):
+        method = 'reflink'
+    elif hardlink and devices not in _no_hardlink and _try_hardlink(src, dst, devices):
+        method = 'hardlink'
+    else:
+        shutil.copy2(src, dst)
+        method = 'copy'
+
+    if stats is not None:
+        stats.add(method, src_stat.st_size)
+    return method
+
+def _try_reflink(src:Path, dst:Path, devices:Tuple[int, int]) -> bool:
+    try:
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    except OSError:
+        dst.unlink(missing_ok=True)
+        _no_reflink.add(devices)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+def _try_hardlink(src:Path, dst:Path, devices:Tuple[int, int]) -> bool:
+    try:
+        os.link(src, dst)
+        return True
+    except OSError:
+        _no_hardlink.add(devices)
+        return False
+
+
+def stage_tree(src:Path | str, dst:Path | str, stats:Optional[StagingStats]=None, hardlink=True) -> StagingStats:
+    """
+    Stages every file under the `src` directory to the same relative path under
+    `dst`, as with stage_file(). Like shutil.copytree(dirs_exist_ok=True) without
+    copying file content where possible.
+    """
+    stats = stats or StagingStats()
+    for dir_path, _, file_names in os.walk(src):
+        relative_dir = os.path.relpath(dir_path, src)
+        dst_dir = Path(dst) / relative_dir
+        dst_dir.mkdir(parents=True, exist_ok=True)
+        for file_name in file_names:
+            stage_file(Path(dir_path) / file_name, dst_dir / file_name, stats, hardlink=hardlink)
+    return stats
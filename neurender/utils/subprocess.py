@@ -1,4 +1,12 @@
+import os
 import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+from pydantic import BaseModel
 
 class SubprocessError(Exception):
     def __init__(self, status):
@@ -7,11 +15,134 @@ class SubprocessError(Exception):
     def __str__(self):
         return f"{self.__class__.__name__}(status={self.status})"
 
-def run_command(cmd_arr, cwd='.'):
+
+class CommandProfile(BaseModel):
+    command:str
+    status:int = 0
+    wall_s:float = 0
+    # CPU time of the command and the child processes it waited for
+    user_cpu_s:float = 0
+    system_cpu_s:float = 0
+    peak_rss_mb:float = 0
+    # Filesystem I/O which reached the block device, so excluding page cache hits
+    read_bytes:int = 0
+    written_bytes:int = 0
+
+
+# Commands run by a thread within record_commands()
+_recording = threading.local()
+
+@contextmanager
+def record_commands(log_path:Optional[Path]=None) -> Iterator[List[CommandProfile]]:
+    """
+    Profiles the commands run_command() runs in this thread within the context,
+    appending them to the yielded list. Their output is also appended to `log_path`.
+    """
+    profiles = []
+    previous = getattr(_recording, 'state', None)
+    _recording.state = (profiles, log_path)
+    try:
+        yield profiles
+    finally:
+        _recording.state = previous
+
+
+# Seconds output is still copied after a command exits, from background processes it
+# started which hold on to its output pipes
+_TEE_EXIT_TIMEOUT_S = 1
+
+
+class _Tee:
+    """
+    Copies a command's output pipe to `stream` and the log as it arrives, on a thread
+    """
+    def __init__(self, pipe, stream, log_file, log_lock:threading.Lock):
+        self._pipe = pipe
+        self._stream = stream
+        self._log_file = log_file
+        self._log_lock = log_lock
+        self._thread = threading.Thread(target=self._run, name='command-output', daemon=True)
+        self._thread.start()
+
+    def _write_stream(self, data:bytes):
+        try:
+            if hasattr(self._stream, 'buffer'):
+                self._stream.buffer.write(data)
+            else:
+                self._stream.write(data.decode(errors='replace'))
+            self._stream.flush()
+        except (OSError, ValueError):
+            # Output is still drained, so the command does not block on a full pipe
+            pass
+
+    def _run(self):
+        try:
+            while data := os.read(self._pipe.fileno(), 64 * 1024):
+                self._write_stream(data)
+                with self._log_lock:
+                    if self._log_file and not self._log_file.closed:
+                        self._log_file.write(data)
+                        self._log_file.flush()
+        finally:
+            self._pipe.close()
+
+    def join(self, timeout:float):
+        # Background processes the command started may keep the pipe open after it exits,
+        # in which case their output is still copied to `stream`, but no longer waited for
+        self._thread.join(timeout)
+
+
+def run_command(cmd_arr, cwd='.') -> CommandProfile:
     # Ensure all components are strings
-    cmd_arr = map(str, cmd_arr)
+    cmd_arr = list(map(str, cmd_arr))
+
+    profiles, log_path = getattr(_recording, 'state', None) or (None, None)
+    log_file = open(log_path, 'ab') if log_path else None
+    log_lock = threading.Lock()
+    try:
+        if log_file:
+            log_file.write(f"$ {' '.join(cmd_arr)}\n".encode())
+            log_file.flush()
+
+        start_time = time.monotonic()
+        # Output is only piped when it is also logged
+        output = subprocess.PIPE if log_file else None
+        process = subprocess.Popen(cmd_arr, cwd=cwd, stdout=output, stderr=output)
+        tees = []
+        if log_file:
+            tees = [_Tee(process.stdout, sys.stdout, log_file, log_lock), _Tee(process.stderr, sys.stderr, log_file, log_lock)]
+
+        try:
+            # wait4() rather than Popen.wait(), for the resource usage of the command
+            _, wait_status, usage = os.wait4(process.pid, 0)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        process.returncode = os.waitstatus_to_exitcode(wait_status)
+        deadline = time.monotonic() + _TEE_EXIT_TIMEOUT_S
+        for tee in tees:
+            tee.join(max(0, deadline - time.monotonic()))
+    finally:
+        if log_file:
+            with log_lock:
+                log_file.close()
 
-    result = subprocess.call(cmd_arr, cwd=cwd)
+    profile = CommandProfile(
+        command=' '.join(cmd_arr),
+        status=process.returncode,
+        wall_s=time.monotonic() - start_time,
+        user_cpu_s=usage.ru_utime,
+        system_cpu_s=usage.ru_stime,
+        # Reported in KB on Linux
+        peak_rss_mb=usage.ru_maxrss / 1024,
+        # Counted in 512 byte blocks
+        read_bytes=usage.ru_inblock * 512,
+        written_bytes=usage.ru_oublock * 512,
+    )
+    if profiles is not None:
+        profiles.append(profile)
 
-    if result != 0:
-        raise SubprocessError(result)
\ No newline at end of file
+    if process.returncode != 0:
+        raise SubprocessError(process.returncode)
+    return profile
@@ -0,0 +1,75 @@
+import os
+import socket
+import sys
+import uuid
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+REPO_ROOT = Path(__file__).parent.parent
+NEURENDER_BIN = REPO_ROOT / 'bin' / 'neurender'
+
+
+@pytest.fixture
+def cli_env(tmp_path) -> Dict[str, str]:
+    """
+    Environment for running the CLI in a subprocess, with a home directory of its own
+    so the user's ~/.neurender.conf and job queue are not used
+    """
+    home = tmp_path / 'home'
+    home.mkdir()
+    return { **os.environ, 'HOME': str(home), 'PYTHONPATH': os.pathsep.join([str(REPO_ROOT), os.environ.get('PYTHONPATH', '')]) }
+
+
+@pytest.fixture(scope='session')
+def s3_endpoint() -> str:
+    """
+    Url of a local S3 stand-in, skipping the test when moto is not installed
+    """
+    moto_server = pytest.importorskip('moto.server')
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    server = moto_server.ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    yield f"http://127.0.0.1:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def s3_config(s3_endpoint, monkeypatch):
+    """
+    S3Config for the local S3 stand-in
+    """
+    from neurender.config import S3Config
+
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    return S3Config(endpoint_url=s3_endpoint, access_key='testing', access_secret_key='testing')
+
+
+@pytest.fixture
+def s3_url(s3_config) -> str:
+    """
+    Url of a project folder in a new, empty bucket on the local S3 stand-in
+    """
+    from neurender.storage import _create_s3_client
+
+    bucket = f"test-{uuid.uuid4().hex[:12]}"
+    _create_s3_client(s3_config).create_bucket(Bucket=bucket)
+    return f"s3://{bucket}/project"
+
+
+@pytest.fixture
+def image_project(tmp_path) -> Path:
+    """
+    Project with a few small images and a pipeline staging them
+    """
+    project_path = tmp_path / 'project'
+    (project_path / 'media').mkdir(parents=True)
+    for i in range(3):
+        (project_path / 'media' / f"IMG_{i:04}.jpg").write_bytes(os.urandom(1024))
+    (project_path / 'pipelines').mkdir()
+    (project_path / 'pipelines' / 'default.nrp').write_text(
+        "name: Test\npipeline:\n  - step: ImportImageBatch\nupload_artifacts: []\n")
+    return project_path
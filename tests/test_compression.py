@@ -0,0 +1,70 @@
+import io
+import subprocess
+import sys
+import tarfile
+
+import pytest
+
+from conftest import NEURENDER_BIN
+from neurender.utils.compression import extract_tar, write_tar
+
+
+def _archive(*members) -> io.BytesIO:
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+        for member in members:
+            tar.addfile(member, io.BytesIO(b'data') if member.isfile() else None)
+    archive.seek(0)
+    return archive
+
+
+def _file(name) -> tarfile.TarInfo:
+    member = tarfile.TarInfo(name)
+    member.size = 4
+    return member
+
+
+def _symlink(name, target) -> tarfile.TarInfo:
+    member = tarfile.TarInfo(name)
+    member.type = tarfile.SYMTYPE
+    member.linkname = target
+    return member
+
+
+def test_round_trip(image_project, tmp_path):
+    archive = io.BytesIO()
+    assert write_tar(image_project, archive, threads=2) == 4
+    archive.seek(0)
+    assert extract_tar(archive, tmp_path / 'dst') == 4
+    assert (tmp_path / 'dst' / 'project' / 'media' / 'IMG_0000.jpg').read_bytes() == (image_project / 'media' / 'IMG_0000.jpg').read_bytes()
+
+
+@pytest.mark.parametrize('data_filter', [True, False])
+@pytest.mark.parametrize('unsafe', ['absolute', 'parent', 'symlink'])
+def test_extracts_nothing_outside_dst(unsafe, data_filter, tmp_path, monkeypatch):
+    if not data_filter:
+        monkeypatch.delattr(tarfile, 'data_filter', raising=False)
+    elif not hasattr(tarfile, 'data_filter'):
+        pytest.skip("tarfile.data_filter is not available")
+    member = {
+        'absolute': _file(str(tmp_path / 'escaped')),
+        'parent': _file('a/../../escaped'),
+        'symlink': _symlink('escaped', str(tmp_path / 'escaped')),
+    }[unsafe]
+
+    try:
+        extract_tar(_archive(_file('ok'), member), tmp_path / 'dst')
+    except tarfile.TarError:
+        pass
+    else:
+        # The 'data' filter extracts absolute paths relative to dst instead
+        assert data_filter and unsafe == 'absolute'
+    assert not (tmp_path / 'escaped').exists()
+    assert not (tmp_path / 'dst' / 'escaped').is_symlink()
+
+
+def test_upload_rejects_select_with_compress(cli_env, tmp_path):
+    result = subprocess.run([sys.executable, str(NEURENDER_BIN), 'upload', str(tmp_path), 's3://bucket/project',
+                             '--compress', '--select', 'media/**/*'], env=cli_env, capture_output=True, text=True)
+    assert result.returncode == 1
+    assert '--select cannot be combined with --compress' in result.stderr
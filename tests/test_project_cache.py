@@ -0,0 +1,69 @@
+import os
+import shutil
+
+from neurender.config import CacheConfig
+from neurender.pipeline import IMAGE_CACHE_PATH, ImportImageBatch, RunContext, STEP_CACHE_PATH
+from neurender.pipeline.cache import StepCache
+from neurender.project import LOCAL_CACHE_PATHS
+from neurender.project_cache import PROJECTS_PATH, ProjectCache
+from neurender.storage import S3
+
+
+def _cached_project(cache_root, image_project, name):
+    project_path = cache_root / PROJECTS_PATH / name
+    shutil.copytree(image_project, project_path)
+    ctx = RunContext(project_path, project_path / 'output' / 'default')
+    assert not StepCache(project_path / STEP_CACHE_PATH).run(ImportImageBatch(), ctx)
+    return project_path
+
+
+def test_evicts_step_cache_entries_of_intermediates(image_project, tmp_path):
+    # Staged media are hardlinked into the step cache, so removing them alone frees nothing
+    for name in ('first', 'second'):
+        image_project.joinpath('media', f'{name}.jpg').write_bytes(os.urandom(64 * 1024))
+        project_path = _cached_project(tmp_path, image_project, name)
+        os.utime(project_path, (0, 0) if name == 'first' else None)
+
+    cache = ProjectCache(CacheConfig(root=str(tmp_path)))
+    first, second = cache.list()
+    assert first.name == 'first'
+    cache.max_size = first.size + second.size - 1
+    freed = cache.evict()
+
+    assert freed > 0
+    first_path = tmp_path / PROJECTS_PATH / 'first'
+    assert (first_path / 'media' / 'first.jpg').is_file()
+    assert not (first_path / 'output' / 'default' / 'media-staged').exists()
+    assert not [p for p in (first_path / STEP_CACHE_PATH).iterdir() if p.is_dir()]
+    # Evicting the least recently used entry was enough
+    assert [p for p in (tmp_path / PROJECTS_PATH / 'second' / STEP_CACHE_PATH).iterdir() if p.is_dir()]
+    assert sum(p.size for p in cache.list()) <= cache.max_size
+
+
+def test_evicted_project_resyncs_without_downloads(image_project, tmp_path, s3_config, s3_url):
+    # Uploaded artifacts, such as all the training checkpoints, are kept by eviction
+    model_path = image_project / 'output' / 'default' / 'model-gaussian-splatting'
+    model_path.mkdir(parents=True)
+    for iteration in (1000, 2000):
+        model_path.joinpath(f'chkpnt{iteration}.pth').write_bytes(os.urandom(64 * 1024))
+    s3 = S3(s3_config)
+    assert s3.sync_to_remote(image_project, s3_url).ok
+
+    cache = ProjectCache(CacheConfig(root=str(tmp_path / 'cache')))
+    project_path = cache.project_path(s3_url)
+    assert s3.sync_to_local(s3_url, project_path, exclude=LOCAL_CACHE_PATHS).ok
+    ctx = RunContext(project_path, project_path / 'output' / 'default')
+    assert not StepCache(project_path / STEP_CACHE_PATH).run(ImportImageBatch(), ctx)
+    (project_path / IMAGE_CACHE_PATH).mkdir(parents=True)
+    (project_path / IMAGE_CACHE_PATH / 'IMG_0000.jpg').write_bytes(os.urandom(64 * 1024))
+
+    # Evicting the intermediates is enough
+    cache.max_size = cache.list()[0].size - 1
+    assert cache.evict() > 0
+    assert not (project_path / IMAGE_CACHE_PATH).exists()
+    assert not (project_path / 'output' / 'default' / 'media-staged').exists()
+
+    summary = s3.sync_to_local(s3_url, project_path, exclude=LOCAL_CACHE_PATHS)
+    assert summary.ok and not summary.transferred
+    assert sorted(p.name for p in (project_path / 'output' / 'default' / 'model-gaussian-splatting').iterdir()) == \
+        ['chkpnt1000.pth', 'chkpnt2000.pth']
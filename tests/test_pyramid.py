@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from neurender.pipeline import IMAGE_CACHE_PATH, RunContext
+from neurender.pipeline.pyramid import build_resolutions, evict_image_cache
+
+
+def _cached_images(cache_path):
+    return sorted(p.name for p in cache_path.rglob('*') if p.is_file())
+
+
+def test_evicts_least_recently_used_images(tmp_path):
+    cache_path = tmp_path / 'cache'
+    (cache_path / 'ab').mkdir(parents=True)
+    for i, name in enumerate(['old.jpg', 'used.jpg', 'new.jpg', 'partial.1234abcd.tmp.jpg']):
+        path = cache_path / 'ab' / name
+        path.write_bytes(b'x' * 100)
+        os.utime(path, (i, i))
+    os.utime(cache_path / 'ab' / 'used.jpg')
+
+    assert evict_image_cache(cache_path, 150) == 2
+    assert _cached_images(cache_path) == ['partial.1234abcd.tmp.jpg', 'used.jpg']
+
+
+def test_build_resolutions_keeps_image_cache_in_budget(tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    source_path = tmp_path / 'gs'
+    (source_path / 'images').mkdir(parents=True)
+    for i in range(4):
+        Image.effect_noise((64, 48), 64).convert('RGB').save(source_path / 'images' / f"{i}.jpg")
+
+    ctx = RunContext(tmp_path, tmp_path / 'output', worker_processes=1)
+    cache_path = tmp_path / IMAGE_CACHE_PATH
+    build_resolutions(ctx, source_path, [2, 4], cache_path)
+    assert len(_cached_images(cache_path)) == 8
+
+    ctx.image_cache_max_size = 1
+    build_resolutions(ctx, source_path, [8], cache_path)
+    assert not _cached_images(cache_path)
+    # Staged images outlive their evicted cache copies
+    assert len(list((source_path / 'images_8').iterdir())) == 4
+    assert len(list((source_path / 'images_2').iterdir())) == 4
@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+from conftest import NEURENDER_BIN
+
+
+def test_failed_step_fails_the_run(image_project, cli_env, tmp_path):
+    # The images are random bytes, which fail to decode when rescaled
+    (image_project / 'pipelines' / 'default.nrp').write_text(
+        "name: Test\npipeline:\n  - step: ImportImageBatch\n    downscale: 2\nupload_artifacts: []\n")
+    finished_path = tmp_path / 'finished'
+    on_finished = tmp_path / 'on_finished.sh'
+    on_finished.write_text(f"#!/bin/sh\ntouch {finished_path}\n")
+    on_finished.chmod(0o755)
+
+    result = subprocess.run([sys.executable, str(NEURENDER_BIN), 'run', str(image_project), '--on-finished', str(on_finished)],
+                            env=cli_env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 1
+    assert "Pipeline 'Test' failed" in result.stderr
+    assert 'Done.' not in result.stdout
+    assert not finished_path.exists()
+
+
+def test_successful_run(image_project, cli_env):
+    result = subprocess.run([sys.executable, str(NEURENDER_BIN), 'run', str(image_project)],
+                            env=cli_env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert 'Done.' in result.stdout
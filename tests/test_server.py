@@ -0,0 +1,57 @@
+import json
+import re
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+
+from conftest import NEURENDER_BIN
+
+_JOB_TIMEOUT_S = 60
+
+
+def _request(url:str, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data=data, method='POST' if data else 'GET',
+                                     headers={ 'Content-Type': 'application/json' })
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.read().decode()
+
+
+@pytest.fixture
+def server_url(tmp_path, cli_env):
+    # Started through bin/neurender, whose spawned workers re-import it
+    server = subprocess.Popen([sys.executable, str(NEURENDER_BIN), 'serve', '--port', '0', '--jobs-path', str(tmp_path / 'jobs')],
+                              env=cli_env, stdout=subprocess.PIPE, text=True)
+    try:
+        line = server.stdout.readline()
+        match = re.search(r'http://[\d.]+:\d+', line)
+        assert match, f"Unexpected server output: {line!r}"
+        yield match[0]
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def test_run_job(server_url, image_project, tmp_path):
+    output_path = tmp_path / 'output'
+    job = json.loads(_request(f"{server_url}/jobs", { 'args': ['run', str(image_project), '-o', str(output_path)] }))
+
+    deadline = time.monotonic() + _JOB_TIMEOUT_S
+    while job['status'] in ('queued', 'running') and time.monotonic() < deadline:
+        time.sleep(0.2)
+        job = json.loads(_request(f"{server_url}/jobs/{job['id']}"))
+
+    log = _request(f"{server_url}/jobs/{job['id']}/log")
+    assert job['status'] == 'succeeded', log
+    assert job['exit_code'] == 0
+    assert sorted(p.name for p in (output_path / 'media-staged').iterdir()) == ['IMG_0000.jpg', 'IMG_0001.jpg', 'IMG_0002.jpg']
+    assert "Done." in log
+
+
+def test_rejects_unknown_command(server_url):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        _request(f"{server_url}/jobs", { 'args': ['serve'] })
+    assert error.value.code == 400
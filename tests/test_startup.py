@@ -0,0 +1,24 @@
+import subprocess
+import sys
+
+import pytest
+
+# Runs the CLI with `argv`, then prints the modules it imported
+_MODULES_SCRIPT = """
+import contextlib, io, sys
+from neurender.__main__ import main
+with contextlib.redirect_stdout(io.StringIO()), contextlib.suppress(SystemExit):
+    main(sys.argv[1:])
+print(' '.join(sys.modules))
+"""
+
+# Only the commands and steps using these should import them
+HEAVY_MODULES = { 'boto3', 'botocore', 'PIL', 'cv2', 'numpy', 'am_imaging' }
+
+
+@pytest.mark.parametrize('argv', [['--help'], ['run', '--help'], ['config', '--set-all', 'storage: {}']])
+def test_commands_skip_heavy_imports(argv, cli_env):
+    output = subprocess.check_output([sys.executable, '-c', _MODULES_SCRIPT, *argv], env=cli_env, text=True)
+    modules = set(output.split())
+    assert 'neurender.__main__' in modules
+    assert not {m for m in modules if m.split('.')[0] in HEAVY_MODULES}
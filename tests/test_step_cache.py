@@ -0,0 +1,51 @@
+import os
+from pathlib import Path
+
+from neurender.config import S3Config
+from neurender.pipeline import ImportImageBatch, RunContext, STEP_CACHE_PATH
+from neurender.pipeline.cache import StepCache
+from neurender.project import LOCAL_CACHE_PATHS
+from neurender.storage import S3
+
+
+def _staged_files(ctx:RunContext):
+    return sorted(p.name for p in ctx.staged_media_path.iterdir())
+
+
+def test_stores_only_written_files(image_project, tmp_path):
+    cache = StepCache(image_project / STEP_CACHE_PATH)
+    ctx = RunContext(image_project, tmp_path / 'output')
+    ctx.staged_media_path.mkdir(parents=True)
+    (ctx.staged_media_path / 'stale.jpg').write_bytes(b'stale')
+
+    assert not cache.run(ImportImageBatch(), ctx)
+    entries = [p for p in cache.path.iterdir() if p.is_dir()]
+    assert len(entries) == 1
+    stored = sorted(p.name for p in (entries[0] / 'files' / 'media-staged').iterdir())
+    assert stored == ['IMG_0000.jpg', 'IMG_0001.jpg', 'IMG_0002.jpg']
+
+
+def test_restore_removes_stale_outputs(image_project, tmp_path):
+    cache = StepCache(image_project / STEP_CACHE_PATH)
+    assert not cache.run(ImportImageBatch(), RunContext(image_project, tmp_path / 'first'))
+
+    ctx = RunContext(image_project, tmp_path / 'second')
+    ctx.staged_media_path.mkdir(parents=True)
+    (ctx.staged_media_path / 'stale.jpg').write_bytes(b'stale')
+    # Written by an earlier step of the same run, such as a video import
+    (ctx.staged_media_path / 'video.mp4_000000.jpg').write_bytes(b'frame')
+    ctx.produced_files.add('media-staged/video.mp4_000000.jpg')
+
+    assert cache.run(ImportImageBatch(), ctx)
+    assert _staged_files(ctx) == ['IMG_0000.jpg', 'IMG_0001.jpg', 'IMG_0002.jpg', 'video.mp4_000000.jpg']
+
+
+def test_step_cache_is_not_synced(image_project, tmp_path):
+    cache = StepCache(image_project / STEP_CACHE_PATH)
+    cache.run(ImportImageBatch(), RunContext(image_project, image_project / 'output' / 'default'))
+
+    plan = S3(S3Config())._prepare_upload(image_project, 's3://bucket/project', '', LOCAL_CACHE_PATHS)
+    keys = list(plan.iter_local_files())
+    assert 'media/IMG_0000.jpg' in keys
+    assert 'output/default/media-staged/IMG_0000.jpg' in keys
+    assert not [key for key in keys if key.startswith('cache/')]
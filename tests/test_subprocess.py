@@ -0,0 +1,46 @@
+import io
+import sys
+import time
+
+import pytest
+
+from neurender.utils.subprocess import SubprocessError, record_commands, run_command
+
+
+def test_background_process_does_not_block(tmp_path):
+    with record_commands(tmp_path / 'step.log'):
+        start_time = time.monotonic()
+        run_command(['sh', '-c', 'sleep 5 & echo started'])
+    assert time.monotonic() - start_time < 3
+    assert 'started' in (tmp_path / 'step.log').read_text()
+
+
+def test_stdout_and_stderr_are_logged_separately(tmp_path, capfd):
+    with record_commands(tmp_path / 'step.log') as commands:
+        run_command(['sh', '-c', 'echo out; echo err >&2'])
+    captured = capfd.readouterr()
+    assert captured.out == 'out\n'
+    assert captured.err == 'err\n'
+    assert 'out\n' in (tmp_path / 'step.log').read_text()
+    assert 'err\n' in (tmp_path / 'step.log').read_text()
+    assert len(commands) == 1
+
+
+def test_text_only_stdout(tmp_path, monkeypatch):
+    stdout = io.StringIO()
+    monkeypatch.setattr(sys, 'stdout', stdout)
+    with record_commands(tmp_path / 'step.log'):
+        run_command(['echo', 'text'])
+    assert stdout.getvalue() == 'text\n'
+
+
+def test_failure_raises(tmp_path):
+    with record_commands(tmp_path / 'step.log') as commands, pytest.raises(SubprocessError):
+        run_command(['sh', '-c', 'exit 3'])
+    assert commands[0].status == 3
+
+
+def test_missing_executable_raises(tmp_path):
+    with record_commands(tmp_path / 'step.log'):
+        with pytest.raises(FileNotFoundError):
+            run_command(['neurender-missing-tool'])
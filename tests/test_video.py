@@ -0,0 +1,44 @@
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+
+from neurender.pipeline.video import export_segment, split_video
+
+
+def _write_video(path, frame_count):
+    # Frames of varying detail, so each block has a distinct sharpest frame
+    rng = np.random.default_rng(0)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), 30, (64, 48))
+    for i in range(frame_count):
+        amplitude = int(rng.integers(1, 120))
+        writer.write(np.clip(128 + rng.integers(-amplitude, amplitude + 1, (48, 64, 3)), 0, 255).astype(np.uint8))
+    writer.release()
+
+
+def _frames(prefix):
+    return { p.name: cv2.imread(str(p)) for p in sorted(prefix.parent.glob(f"{prefix.name}*")) }
+
+
+def test_segments_match_single_pass(tmp_path, monkeypatch):
+    video_path = tmp_path / 'clip.mp4'
+    _write_video(video_path, 130)
+    monkeypatch.setattr('neurender.pipeline.video.MIN_SEGMENT_FRAMES', 30)
+    keep_size = lambda size: size
+
+    single = tmp_path / 'single' / 'clip_'
+    single.parent.mkdir()
+    [whole] = split_video(video_path, str(single), 12, 1)
+    assert export_segment(whole, keep_size) == 11
+
+    segmented = tmp_path / 'segmented' / 'clip_'
+    segmented.parent.mkdir()
+    segments = split_video(video_path, str(segmented), 12, 3)
+    assert len(segments) == 3
+    assert sum(export_segment(segment, keep_size) for segment in segments) == 11
+
+    single_frames = _frames(single)
+    segmented_frames = _frames(segmented)
+    assert list(single_frames) == list(segmented_frames)
+    for name, frame in single_frames.items():
+        assert np.array_equal(frame, segmented_frames[name]), name